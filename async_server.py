@@ -0,0 +1,86 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# async_server.py runs the server side of a super peer or leaf node on a single asyncio
+# event loop instead of one thread per accepted socket. blocking work (disk reads and
+# outgoing socket calls) is handed to a bounded worker pool so the loop never stalls
+#
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from protocol import read_message, LEGACY
+from metrics import MeteredReader, MeteredWriter
+
+HOST = 'localhost'
+DEFAULT_WORKERS = 8
+
+log = logging.getLogger("async_server")
+
+#
+# Async server class, owns the event loop and the worker pool for one node
+#
+class AsyncServer:
+    def __init__(self, node, port, workers=DEFAULT_WORKERS):
+        self.node = node
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.serial = ThreadPoolExecutor(max_workers=1)
+        self.ready = threading.Event()
+
+    # entry point for the server thread, runs the loop until the process exits
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.serve())
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_client, HOST, self.port)
+        self.ready.set()
+        async with server:
+            await server.serve_forever()
+
+    # one coroutine per connection. pooled connections carry many requests, each handled as
+    # its own task so a slow request does not hold up the ones behind it
+    async def handle_client(self, reader, writer):
+        metrics = self.node.metrics
+        reader, writer = MeteredReader(reader, metrics), MeteredWriter(writer, metrics)
+        metrics.connected(1)
+        tasks = set()
+        try:
+            while True:
+                request, codec = await read_message(reader)
+                if request is None:
+                    break
+                # legacy messages and file transfers own the whole connection
+                if codec == LEGACY or request.get("type") in ("file_transfer", "chunk_transfer"):
+                    await self.handle_request(request, writer, codec)
+                    break
+                task = self.loop.create_task(self.handle_request(request, writer, codec))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            log.warning("Dropped connection on port %s: %s", self.port, e)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            metrics.connected(-1)
+            writer.close()
+
+    async def handle_request(self, request, writer, codec):
+        try:
+            with self.node.metrics.timed(request.get("type")):
+                await self.node.handle_request_async(request, writer, codec)
+                await writer.drain()
+        except Exception as e:
+            log.error("Error handling request on port %s: %s", self.port, e, exc_info=True)
+
+    # runs a blocking function on the bounded worker pool and waits for it on the loop
+    async def run_blocking(self, func, *args):
+        return await self.loop.run_in_executor(self.pool, func, *args)
+
+    # like run_blocking, but one at a time in the order the requests arrived, for updates
+    # that must not overtake each other
+    async def run_in_order(self, func, *args):
+        return await self.loop.run_in_executor(self.serial, func, *args)
@@ -0,0 +1,275 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# benchmark.py runs a fixed set of scenarios against a network started on localhost and
+# writes the results as json and csv with percentiles, so runs of two versions of the code
+# can be compared. every scenario runs once per topology in its own python process, since
+# the servers bind fixed ports and never shut down, and the parent collects what they report
+#
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+from network_setup import setup_network, load_config, parse_flags
+from load_generator import start_leaves, snapshot_directories, restore_directories
+from super_peer import SuperPeer
+from file import File
+
+SCENARIOS = {"query_latency": ["push"], "invalidation_fanout": ["push"],
+             "stale_reads": ["push", "pull"], "transfer": ["push"]}
+TOPOLOGIES = ["linear", "all_to_all"]
+TTLS = [1, 2, 4, 8, 17]
+COPIES = [1, 4, 8]  # leaves holding a copy when the origin edits
+SIZES = [1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024]
+STALE_DURATION = 10  # seconds of reads and edits per stale read run
+EDIT_RATE = 2  # edits per second during a stale read run
+READ_INTERVAL = 0.01
+WAIT_LIMIT = 5  # seconds to wait for an invalidation to reach every copy
+DEFAULTS = {"scenarios": ",".join(SCENARIOS), "topologies": ",".join(TOPOLOGIES), "reps": 20,
+            "seed": 485, "engine": "thread", "codec": "json", "out": "benchmark_results", "worker": ""}
+
+# linear interpolation between the closest ranks
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+def result(scenario, topology, mode, param, metric, values):
+    return {"scenario": scenario, "topology": topology, "mode": mode, "param": param, "metric": metric,
+            "count": len(values), "mean": sum(values) / len(values) if values else 0.0,
+            "p50": percentile(values, 50), "p90": percentile(values, 90), "p99": percentile(values, 99),
+            "min": min(values, default=0.0), "max": max(values, default=0.0)}
+
+# counts every request super peers handle, by message type
+def count_messages(counts):
+    lock = threading.Lock()
+    handle, handle_async = SuperPeer.handle_request, SuperPeer.handle_request_async
+
+    def counted(self, request, *args):
+        with lock:
+            counts[request.get("type")] += 1
+        return handle(self, request, *args)
+
+    async def counted_async(self, request, *args):
+        with lock:
+            counts[request.get("type")] += 1
+        return await handle_async(self, request, *args)
+
+    SuperPeer.handle_request = counted
+    SuperPeer.handle_request_async = counted_async
+
+def wait_until(check, limit=WAIT_LIMIT):
+    deadline = time.time() + limit
+    while not check():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.002)
+    return True
+
+def drop_copy(leaf, file_name):
+    path = os.path.join(leaf.directory, file_name)
+    if os.path.exists(path):
+        os.remove(path)
+    if leaf.files.remove(file_name):
+        leaf.update_registration(removed=[file_name])
+
+#
+# scenarios, each returns a list of results
+#
+
+# time to the first QueryHit and to the end of the query for each TTL, asked from L1
+def query_latency(topology, mode, super_peers, leaves, counts, reps, rng):
+    asker = leaves["L1"]
+    catalog = sorted(f for leaf in leaves.values() if leaf is not asker for f in leaf.files.names())
+    results = []
+    for ttl in TTLS:
+        first, total, hits = [], [], []
+        for _ in range(reps):
+            start = time.time()
+            found = 0
+            for _ in asker.stream_query(rng.choice(catalog), ttl):
+                if not found:
+                    first.append((time.time() - start) * 1000)
+                found += 1
+            total.append((time.time() - start) * 1000)
+            hits.append(found)
+        results.append(result("query_latency", topology, mode, ttl, "first_hit_ms", first))
+        results.append(result("query_latency", topology, mode, ttl, "query_ms", total))
+        results.append(result("query_latency", topology, mode, ttl, "hits", hits))
+    return results
+
+# messages super peers handle and time until every copy is gone for one edit of a file
+# that k leaves hold a copy of. the SUBSCRIBEs sent when the copies are made and the
+# CLEANUPs sent when they are discarded are part of the cost of keeping them consistent
+def invalidation_fanout(topology, mode, super_peers, leaves, counts, reps, rng):
+    origin = leaves[sorted(leaves, key=lambda n: int(n[1:]))[-1]]
+    file_name = origin.files.names()[0]
+    others = sorted(l for l in leaves if l != origin.node_id)
+    results = []
+    for k in COPIES:
+        sent = {kind: [] for kind in ("INVALIDATION", "CLEANUP", "SUBSCRIBE")}
+        messages, delays = [], []
+        for rep in range(reps):
+            holders = [leaves[l] for l in rng.sample(others, k)]
+            counts.clear()
+            for holder in holders:
+                holder.retrieve_file(origin.node_id, file_name)
+            time.sleep(0.2)  # subscriptions reach the origin's super peer
+            start = time.time()
+            origin.edit_file(file_name, f"benchmark edit {k}-{rep}")
+            wait_until(lambda: all(file_name not in h.files for h in holders))
+            delays.append((time.time() - start) * 1000)
+            time.sleep(0.1)  # the last forwards and cleanups land before counting
+            for kind, values in sent.items():
+                values.append(counts[kind])
+            messages.append(sum(counts[kind] for kind in sent))
+            for holder in holders:
+                drop_copy(holder, file_name)
+        results.append(result("invalidation_fanout", topology, mode, k, "invalidation_messages", sent["INVALIDATION"]))
+        results.append(result("invalidation_fanout", topology, mode, k, "cleanup_messages", sent["CLEANUP"]))
+        results.append(result("invalidation_fanout", topology, mode, k, "subscribe_messages", sent["SUBSCRIBE"]))
+        results.append(result("invalidation_fanout", topology, mode, k, "messages", messages))
+        results.append(result("invalidation_fanout", topology, mode, k, "all_invalidated_ms", delays))
+    return results
+
+# readers keep reading their copies while origins edit them, a read is stale when the copy
+# is older than the origin's version at that moment. a missing copy is downloaded again
+def stale_reads(topology, mode, super_peers, leaves, counts, reps, rng):
+    ids = sorted(leaves, key=lambda n: int(n[1:]))
+    origins = [leaves[n] for n in ids[-4:]]
+    readers = [leaves[n] for n in ids[:8]]
+    files = [(origin, origin.files.names()[0]) for origin in origins]
+    for reader in readers:
+        reader.ttr.start_ttr, reader.ttr.min_ttr, reader.ttr.max_ttr = 0.5, 0.1, 2.0
+        for origin, file_name in files:
+            reader.retrieve_file(origin.node_id, file_name)
+    counts.clear()
+    stop = time.time() + STALE_DURATION
+
+    def edit():
+        n = 0
+        while time.time() < stop:
+            origin, file_name = rng.choice(files)
+            origin.edit_file(file_name, f"benchmark edit {n}")
+            n += 1
+            time.sleep(1 / EDIT_RATE)
+
+    editor = threading.Thread(target=edit)
+    editor.start()
+    stale, misses = [], 0
+    while time.time() < stop:
+        reader = rng.choice(readers)
+        origin, file_name = rng.choice(files)
+        copy = reader.files.get(file_name)
+        if copy is not None and copy.valid:
+            stale.append(1 if copy.version < origin.files[file_name].version else 0)
+        else:
+            misses += 1
+            drop_copy(reader, file_name)
+            reader.retrieve_file(origin.node_id, file_name)
+        time.sleep(READ_INTERVAL)
+    editor.join()
+    polls = sum(reader.ttr.polls for reader in readers)
+    return [result("stale_reads", topology, mode, STALE_DURATION, "stale_read", stale),
+            result("stale_reads", topology, mode, STALE_DURATION, "redownloads", [misses]),
+            result("stale_reads", topology, mode, STALE_DURATION, "pull_batches", [polls]),
+            result("stale_reads", topology, mode, STALE_DURATION, "super_peer_messages", [sum(counts.values())])]
+
+# one leaf downloading files of growing size from another
+def transfer(topology, mode, super_peers, leaves, counts, reps, rng):
+    ids = sorted(leaves, key=lambda n: int(n[1:]))
+    sender, receiver = leaves[ids[-1]], leaves[ids[0]]
+    results = []
+    for size in SIZES:
+        file_name = f"benchmark_{size}.bin"
+        with open(os.path.join(sender.directory, file_name), "wb") as f:
+            f.write(random.Random(size).randbytes(size))
+        sender.files.add(File(file_name, sender.node_id, True, sender.node_id))
+        rates, times = [], []
+        for _ in range(max(reps // (1 + size // (16 * 1024 * 1024)), 3)):
+            start = time.time()
+            receiver.retrieve_file(sender.node_id, file_name)
+            duration = time.time() - start
+            times.append(duration * 1000)
+            rates.append(size / duration / 1e6)
+            drop_copy(receiver, file_name)
+        results.append(result("transfer", topology, mode, size, "mb_per_s", rates))
+        results.append(result("transfer", topology, mode, size, "transfer_ms", times))
+    return results
+
+# runs one scenario on one topology inside this process and prints the results as json
+def run_worker(scenario, topology, mode, options):
+    rng = random.Random(f"{options['seed']}-{scenario}-{topology}-{mode}")
+    counts = Counter()
+    with open(os.devnull, "w") as quiet, redirect_stdout(quiet):
+        count_messages(counts)
+        config_file = f"{topology}.json"
+        super_peers, _ = setup_network(config_file, mode, options["engine"], options["codec"])
+        for sp in super_peers.values():
+            sp.query_cache.ttl = 0  # measure the network, not the query cache
+        leaves = start_leaves(load_config(config_file), mode, options["engine"], options["codec"])
+        saved = snapshot_directories(leaves)
+        try:
+            results = globals()[scenario](topology, mode, super_peers, leaves, counts, options["reps"], rng)
+        finally:
+            restore_directories(leaves, saved)
+    print(json.dumps(results))
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+def write_results(results, options):
+    meta = {"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "options": {k: v for k, v in options.items() if k != "worker"}}
+    with open(options["out"] + ".json", "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    with open(options["out"] + ".csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]) if results else ["scenario"])
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"Wrote {len(results)} results to {options['out']}.json and {options['out']}.csv")
+
+#
+# main
+#
+if __name__ == "__main__":
+    options = parse_flags(sys.argv[1:], DEFAULTS)
+
+    if options["worker"]:
+        scenario, topology, mode = options["worker"].split(":")
+        run_worker(scenario, topology, mode, options)
+        sys.stdout.flush()
+        os._exit(0)
+
+    results = []
+    for scenario in options["scenarios"].split(","):
+        for topology in options["topologies"].split(","):
+            for mode in SCENARIOS[scenario]:
+                print(f"Running {scenario} on {topology} in {mode} mode")
+                args = [f"--{k}={v}" for k, v in options.items() if k not in ("worker", "scenarios", "topologies", "out")]
+                worker = subprocess.run([sys.executable, __file__, f"--worker={scenario}:{topology}:{mode}"] + args,
+                                        capture_output=True, text=True)
+                lines = worker.stdout.strip().splitlines()
+                if worker.returncode or not lines:
+                    print(f"  failed: {worker.stderr.strip().splitlines()[-1:] or 'no output'}")
+                    continue
+                for row in json.loads(lines[-1]):
+                    results.append(row)
+                    print(f"  {row['param']:>10} {row['metric']:<22} p50 {row['p50']:10.3f}  p90 {row['p90']:10.3f}  p99 {row['p99']:10.3f}")
+    write_results(results, options)
@@ -0,0 +1,114 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# chunk_store.py keeps the chunks of copies a leaf node had to throw away, each stored once
+# under its sha256 in L<n>/.chunks no matter how many files contain it. when a copy is
+# invalidated its chunks are kept along with the list of hashes it was made of, so downloading
+# the new version only has to fetch the chunks whose hash the store does not have. an edit
+# that appends a line changes the last chunk and leaves the rest to be reused
+#
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+from swarm import CHUNK_SIZE
+
+INDEX = "manifests.json"
+
+#
+# Chunk store class, {file_name: [chunk hashes]} plus a reference count for every chunk
+#
+class ChunkStore:
+    def __init__(self, directory, chunk_size=CHUNK_SIZE):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.index_path = os.path.join(directory, INDEX)
+        self.manifests = {}
+        self.refs = Counter()
+        self.lock = threading.Lock()
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path) as f:
+                    self.manifests = json.load(f)
+            except (OSError, ValueError):
+                self.manifests = {}
+        for hashes in self.manifests.values():
+            self.refs.update(set(hashes))
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def get(self, digest):
+        with open(self.path(digest), "rb") as f:
+            return f.read()
+
+    # a chunk that is already stored is not written again
+    def put(self, digest, data):
+        path = self.path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    # splits a copy that is about to be deleted into chunks and remembers its hash list
+    def keep(self, file_name, file_path):
+        hashes = []
+        with self.lock, open(file_path, "rb") as f:
+            while True:
+                data = f.read(self.chunk_size)
+                if not data:
+                    break
+                digest = hashlib.sha256(data).hexdigest()
+                self.put(digest, data)
+                hashes.append(digest)
+            # counted before the old list is dropped, so chunks both share are not deleted
+            self.refs.update(set(hashes))
+            self.drop_manifest(file_name)
+            self.manifests[file_name] = hashes
+            self.save_index()
+
+    # the copy is back on disk, chunks no other kept file uses are deleted
+    def release(self, file_name):
+        with self.lock:
+            if self.drop_manifest(file_name):
+                self.save_index()
+
+    # caller holds self.lock
+    def drop_manifest(self, file_name):
+        hashes = self.manifests.pop(file_name, None)
+        if hashes is None:
+            return False
+        for digest in set(hashes):
+            self.refs[digest] -= 1
+            if self.refs[digest] <= 0:
+                del self.refs[digest]
+                try:
+                    os.remove(self.path(digest))
+                    os.rmdir(os.path.dirname(self.path(digest)))  # only goes if it is now empty
+                except OSError:
+                    pass
+        return True
+
+    # caller holds self.lock
+    def save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifests, f)
+        os.replace(tmp_path, self.index_path)
+
+    def __contains__(self, file_name):
+        return file_name in self.manifests
+
+    def stats(self):
+        with self.lock:
+            return {"files": len(self.manifests), "chunks": len(self.refs),
+                    "references": sum(len(h) for h in self.manifests.values())}
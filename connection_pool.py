@@ -0,0 +1,283 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# connection_pool.py keeps one open TCP connection per peer port and reuses it for every
+# message a node sends to that peer, instead of a new handshake per message. requests that
+# expect an answer carry a req_id so several threads can share a connection and each gets
+# its own reply back. idle connections are closed by a sweeper thread and a connection that
+# sat idle for a while is pinged before it is reused. coroutines on an asyncio engine await
+# their replies on the event loop instead of holding a thread while they wait
+#
+import asyncio
+import socket
+import threading
+import itertools
+import queue
+import time
+from protocol import send_message, recv_message, JSON
+from metrics import MeteredSocket
+
+HOST = 'localhost'
+IDLE_TIMEOUT = 60  # seconds before an unused connection is closed
+CHECK_AFTER = 5  # seconds idle before a connection is pinged on reuse
+REQUEST_TIMEOUT = 10
+
+#
+# one pooled socket plus the thread that reads replies off of it
+#
+class PooledConnection:
+    def __init__(self, port, codec, metrics=None):
+        self.port = port
+        self.codec = codec
+        self.sock = socket.create_connection((HOST, port))
+        # small frames back to back (a hit then "done") must not wait on Nagle
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if metrics:
+            self.sock = MeteredSocket(self.sock, metrics)
+        self.send_lock = threading.Lock()
+        self.pending = {}  # {req_id: Queue}
+        self.alive = True
+        self.last_used = time.time()
+        threading.Thread(target=self.read_replies, daemon=True).start()
+
+    def send(self, message):
+        with self.send_lock:
+            send_message(self.sock, message, self.codec)
+        self.last_used = time.time()
+
+    # routes every reply to the queue of the request waiting for it
+    def read_replies(self):
+        try:
+            while True:
+                message, _ = recv_message(self.sock)
+                if message is None:
+                    break
+                if isinstance(message, dict) and message.get("req_id") in self.pending:
+                    self.pending[message["req_id"]].put(message)
+        except (OSError, ValueError):
+            pass
+        self.alive = False
+        # wake up anyone still waiting on this connection
+        for waiting in list(self.pending.values()):
+            waiting.put(None)
+
+    def close(self):
+        self.alive = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+#
+# takes the place of a request's Queue when a coroutine is waiting, the reply read by the
+# connection's thread is handed over to the event loop
+#
+class LoopQueue:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, message):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+
+    async def get(self, timeout):
+        if not self.queue.empty():
+            return self.queue.get_nowait()
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+#
+# pool of connections keyed by peer port
+#
+class ConnectionPool:
+    def __init__(self, codec=JSON, idle_timeout=IDLE_TIMEOUT, metrics=None, sweep=True):
+        self.codec = codec
+        self.metrics = metrics  # counts the bytes sent and read on pooled connections
+        self.idle_timeout = idle_timeout
+        self.connections = {}  # {port: PooledConnection}
+        self.opening = {}  # {port: Lock} so two threads never open the same peer at once
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.opened = 0
+        self.reused = 0
+        self.evicted = 0
+        self.failed = 0
+        # a pool that never opens a connection (the 'sim' engine) has nothing to sweep
+        if sweep:
+            threading.Thread(target=self.evict_idle, daemon=True).start()
+
+    # sends a message that does not expect a reply
+    def send(self, port, message):
+        for attempt in range(2):
+            conn = self.get(port)
+            try:
+                conn.send(message)
+                return
+            except OSError:
+                # the peer dropped the connection, retry once on a fresh one
+                self.discard(conn)
+                if attempt:
+                    raise
+
+    # sends a message and waits for the reply with the same req_id
+    def request(self, port, message, timeout=REQUEST_TIMEOUT):
+        req_id = next(self.ids)
+        waiting = queue.Queue()
+        message = dict(message, req_id=req_id)
+        for attempt in range(2):
+            conn = self.get(port)
+            conn.pending[req_id] = waiting
+            try:
+                conn.send(message)
+                reply = waiting.get(timeout=timeout)
+            except OSError:
+                reply = None
+            except queue.Empty:
+                conn.pending.pop(req_id, None)
+                raise TimeoutError(f"No reply from port {port} after {timeout} seconds")
+            conn.pending.pop(req_id, None)
+            if reply is not None:
+                return reply["reply"]
+            self.discard(conn)
+            if attempt:
+                raise ConnectionError(f"Lost connection to port {port}")
+
+    # sends a message and yields every streamed reply for its req_id, the final reply
+    # (the one without "more") ends the stream and becomes the generator's return value
+    def stream(self, port, message, timeout=REQUEST_TIMEOUT):
+        req_id = next(self.ids)
+        waiting = queue.Queue()
+        deadline = time.time() + timeout
+        conn = self.get(port)
+        conn.pending[req_id] = waiting
+        try:
+            try:
+                conn.send(dict(message, req_id=req_id))
+            except OSError:
+                self.discard(conn)
+                raise
+            while True:
+                try:
+                    reply = waiting.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    raise TimeoutError(f"Stream from port {port} did not finish after {timeout} seconds")
+                if reply is None:
+                    raise ConnectionError(f"Lost connection to port {port}")
+                if not reply.get("more"):
+                    return reply["reply"]
+                yield reply["reply"]
+        finally:
+            conn.pending.pop(req_id, None)
+
+    # request for a coroutine. only opening a connection runs on a thread, the wait for the
+    # reply does not
+    async def request_async(self, port, message, timeout=REQUEST_TIMEOUT):
+        loop = asyncio.get_running_loop()
+        req_id = next(self.ids)
+        waiting = LoopQueue(loop)
+        message = dict(message, req_id=req_id)
+        for attempt in range(2):
+            conn = await loop.run_in_executor(None, self.get, port)
+            conn.pending[req_id] = waiting
+            try:
+                conn.send(message)
+                reply = await waiting.get(timeout)
+            except asyncio.TimeoutError:  # an OSError as well, so caught first
+                raise TimeoutError(f"No reply from port {port} after {timeout} seconds")
+            except OSError:
+                reply = None
+            finally:
+                conn.pending.pop(req_id, None)
+            if reply is not None:
+                return reply["reply"]
+            self.discard(conn)
+            if attempt:
+                raise ConnectionError(f"Lost connection to port {port}")
+
+    # stream for a coroutine, yields every streamed reply until the final one
+    async def stream_async(self, port, message, timeout=REQUEST_TIMEOUT):
+        loop = asyncio.get_running_loop()
+        req_id = next(self.ids)
+        waiting = LoopQueue(loop)
+        deadline = time.time() + timeout
+        conn = await loop.run_in_executor(None, self.get, port)
+        conn.pending[req_id] = waiting
+        try:
+            try:
+                conn.send(dict(message, req_id=req_id))
+            except OSError:
+                self.discard(conn)
+                raise
+            while True:
+                try:
+                    reply = await waiting.get(max(deadline - time.time(), 0))
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"Stream from port {port} did not finish after {timeout} seconds")
+                if reply is None:
+                    raise ConnectionError(f"Lost connection to port {port}")
+                if not reply.get("more"):
+                    return
+                yield reply["reply"]
+        finally:
+            conn.pending.pop(req_id, None)
+
+    # returns an open connection for the port, opening one if needed
+    def get(self, port):
+        with self.lock:
+            opening = self.opening.setdefault(port, threading.Lock())
+        with opening:
+            with self.lock:
+                conn = self.connections.get(port)
+            if conn and conn.alive:
+                if time.time() - conn.last_used <= CHECK_AFTER or self.healthy(conn):
+                    self.reused += 1
+                    return conn
+            if conn:
+                self.discard(conn)
+            try:
+                conn = PooledConnection(port, self.codec, self.metrics)
+            except OSError:
+                self.failed += 1
+                raise
+            with self.lock:
+                self.connections[port] = conn
+                self.opened += 1
+            return conn
+
+    # health check for a connection that has been idle, a PING must come back quickly
+    def healthy(self, conn):
+        req_id = next(self.ids)
+        waiting = queue.Queue()
+        conn.pending[req_id] = waiting
+        try:
+            conn.send({"type": "PING", "req_id": req_id})
+            return waiting.get(timeout=2) is not None
+        except (OSError, queue.Empty):
+            return False
+        finally:
+            conn.pending.pop(req_id, None)
+
+    def discard(self, conn):
+        with self.lock:
+            if self.connections.get(conn.port) is conn:
+                del self.connections[conn.port]
+        conn.close()
+
+    # sweeper thread, closes connections nobody has used for idle_timeout seconds
+    def evict_idle(self):
+        while True:
+            time.sleep(max(self.idle_timeout / 2, 1))
+            now = time.time()
+            with self.lock:
+                idle = [c for c in self.connections.values()
+                        if now - c.last_used > self.idle_timeout and not c.pending]
+                for conn in idle:
+                    del self.connections[conn.port]
+                    self.evicted += 1
+            for conn in idle:
+                conn.close()
+
+    def stats(self):
+        return {"opened": self.opened, "reused": self.reused, "evicted": self.evicted,
+                "failed": self.failed, "open": len(self.connections)}
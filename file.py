@@ -4,8 +4,11 @@
 #
 # file.py is basically a struct for maintiaing file information
 # including version number, if it is a master copy or not, and validity
+# a file kept in a FileStore tells the store whenever it changes so the change is journaled
 
 class File:
+    __slots__ = ("name", "connected_node", "valid", "origin_node", "copy", "version", "unique", "store")
+
     def __init__(self, name, node, valid, og):
         self.name = name
         self.connected_node = node
@@ -14,15 +17,27 @@ class File:
         self.copy = False
         self.version = 1
         self.unique = ''
+        self.store = None
 
     def invalidate(self):
         self.valid = False
+        self.saved()
     
     def is_copy(self):
         self.copy = True
+        self.saved()
     
     def increment_version(self):
         self.version += 1
+        self.saved()
+
+    def set_version(self, version):
+        self.version = version
+        self.saved()
+
+    def saved(self):
+        if self.store is not None:
+            self.store.save(self)
     
     def create_id(self):
         if self.copy:
@@ -0,0 +1,142 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# file_store.py keeps the File records of one leaf node, indexed by name, and writes every
+# change as one line to an append only journal in the node's directory. a restarted leaf
+# replays the journal and gets back its copies and every version number as they were.
+# once most of the journal is old changes it is rewritten with one line per file
+#
+import json
+import os
+import threading
+from file import File
+
+JOURNAL = ".files.journal"
+COMPACT_MIN = 1024  # journal lines before a rewrite is even considered
+COMPACT_RATIO = 4  # rewrite once there are this many lines per file in the store
+
+#
+# File store class, {file_name: File} plus the journal behind it
+#
+class FileStore:
+    def __init__(self, directory, node_id):
+        self.directory = directory
+        self.node_id = node_id
+        self.path = os.path.join(directory, JOURNAL)
+        self.files = {}
+        self.lines = 0  # lines in the journal, old ones included
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        rewrite = self.load()
+        self.journal = open(self.path, "a")
+        if rewrite or self.lines > max(COMPACT_MIN, COMPACT_RATIO * len(self.files)):
+            self.compact()
+
+    # replays the journal, the last line written for a file wins. a file whose data is gone
+    # from the directory is dropped, and a line cut short by a crash ends the replay. returns
+    # True if the journal no longer matches the store and has to be rewritten
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        rewrite = False
+        with open(self.path) as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    rewrite = True
+                    break
+                self.lines += 1
+                if record.get("removed"):
+                    self.files.pop(record["name"], None)
+                else:
+                    self.files[record["name"]] = self.record_file(record)
+        for name in [n for n in self.files if not os.path.exists(os.path.join(self.directory, n))]:
+            del self.files[name]
+            rewrite = True
+        for file in self.files.values():
+            file.store = self
+        return rewrite
+
+    def record_file(self, record):
+        file = File(record["name"], self.node_id, record["valid"], record["origin"])
+        file.copy = record["copy"]
+        file.version = record["version"]
+        return file
+
+    def file_record(self, file):
+        return {"name": file.name, "version": file.version, "valid": file.valid,
+                "copy": file.copy, "origin": file.origin_node}
+
+    def write(self, record):
+        self.journal.write(json.dumps(record, separators=(',', ':')) + "\n")
+        self.journal.flush()
+        self.lines += 1
+        if self.lines > max(COMPACT_MIN, COMPACT_RATIO * len(self.files)):
+            self.compact()
+
+    # rewrites the journal as one line per file, renamed into place so a crash during the
+    # rewrite leaves the old journal
+    def compact(self):
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                for file in self.files.values():
+                    f.write(json.dumps(self.file_record(file), separators=(',', ':')) + "\n")
+            self.journal.close()
+            os.replace(tmp_path, self.path)
+            self.journal = open(self.path, "a")
+            self.lines = len(self.files)
+
+    # adds or replaces a file
+    def add(self, file):
+        with self.lock:
+            file.store = self
+            self.files[file.name] = file
+            self.write(self.file_record(file))
+
+    # called by a File in this store after it changed
+    def save(self, file):
+        with self.lock:
+            if self.files.get(file.name) is file:
+                self.write(self.file_record(file))
+
+    # removes a file and returns it, or None if it was not here
+    def remove(self, name):
+        with self.lock:
+            file = self.files.pop(name, None)
+            if file is not None:
+                file.store = None
+                self.write({"name": name, "removed": True})
+            return file
+
+    def get(self, name, default=None):
+        return self.files.get(name, default)
+
+    def __getitem__(self, name):
+        return self.files[name]
+
+    def __contains__(self, name):
+        return name in self.files
+
+    def __iter__(self):
+        return iter(list(self.files))
+
+    def __len__(self):
+        return len(self.files)
+
+    def values(self):
+        return list(self.files.values())
+
+    def names(self):
+        return list(self.files)
+
+    def copies(self):
+        return [file.name for file in self.values() if file.copy]
+
+    def __repr__(self):
+        return f"FileStore({self.names()})"
+
+    def stats(self):
+        return {"files": len(self.files), "copies": len(self.copies()), "journal_lines": self.lines}
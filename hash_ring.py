@@ -0,0 +1,33 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# hash_ring.py is a consistent hashing ring over the super peer ids from the config file.
+# each super peer owns the slice of file names that hash between its points and the next,
+# so every node can work out which super peer indexes a file without asking anyone
+#
+import bisect
+import hashlib
+
+VIRTUAL_NODES = 64  # points per super peer, evens out how many names each one owns
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+#
+# Hash ring class
+#
+class HashRing:
+    def __init__(self, peer_ids, virtual_nodes=VIRTUAL_NODES):
+        points = []
+        for peer_id in peer_ids:
+            for i in range(virtual_nodes):
+                points.append((ring_hash(f"{peer_id}#{i}"), peer_id))
+        points.sort()
+        self.keys = [point[0] for point in points]
+        self.owners = [point[1] for point in points]
+
+    # super peer responsible for indexing a file name
+    def owner(self, file_name):
+        i = bisect.bisect(self.keys, ring_hash(file_name)) % len(self.keys)
+        return self.owners[i]
@@ -0,0 +1,68 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# interest_table.py is a super peer's view of which super peers have leaves holding a copy
+# of a file. a leaf subscribes when it downloads a copy and is removed again by the CLEANUP
+# it sends when the copy is discarded. other super peers only hear of a super peer's first
+# leaf to subscribe and its last to clean up, invalidations only need to reach the super
+# peers listed here
+#
+import threading
+
+#
+# Interest table class, {file_name: {super_peer_id: set of leaf ids}}
+#
+class InterestTable:
+    def __init__(self):
+        self.files = {}
+        self.lock = threading.Lock()
+
+    # returns True if that is the super peer's first leaf holding the file
+    def subscribe(self, file_name, super_peer, leaf_id):
+        with self.lock:
+            leaves = self.files.setdefault(file_name, {}).setdefault(super_peer, set())
+            first = not leaves
+            leaves.add(leaf_id)
+            return first
+
+    # returns True if that was the super peer's last leaf holding the file
+    def unsubscribe(self, file_name, super_peer, leaf_id):
+        with self.lock:
+            holders = self.files.get(file_name, {})
+            leaves = holders.get(super_peer)
+            if leaves is None:
+                return False
+            leaves.discard(leaf_id)
+            if leaves:
+                return False
+            del holders[super_peer]
+            if not holders:
+                self.files.pop(file_name, None)
+            return True
+
+    # the super peer has no leaves holding the file any more
+    def drop(self, file_name, super_peer):
+        with self.lock:
+            holders = self.files.get(file_name, {})
+            holders.pop(super_peer, None)
+            if not holders:
+                self.files.pop(file_name, None)
+
+    # leaves under one super peer holding a copy of the file
+    def leaves(self, file_name, super_peer):
+        with self.lock:
+            return set(self.files.get(file_name, {}).get(super_peer, ()))
+
+    # super peers with a leaf holding a copy of any of the files
+    def peers(self, file_names):
+        with self.lock:
+            interested = set()
+            for file_name in file_names:
+                interested.update(self.files.get(file_name, {}))
+            return interested
+
+    def stats(self):
+        with self.lock:
+            return {"files": len(self.files),
+                    "subscriptions": sum(len(h) for h in self.files.values())}
@@ -0,0 +1,82 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# invalidation_batcher.py collects invalidations for a short window before they are sent.
+# several edits of the same file in that window collapse into the newest version, and all
+# files waiting are shipped as one INVALIDATION message with a "files" list. the batch goes
+# out when the window ends or as soon as it holds max_batch files
+#
+import logging
+import threading
+import time
+
+FLUSH_INTERVAL = 0.05  # seconds an invalidation may wait for others to join it
+MAX_BATCH = 64  # files in one INVALIDATION message
+
+log = logging.getLogger("invalidation_batcher")
+
+# the files an INVALIDATION covers, older nodes send one file per message
+def invalidation_entries(message):
+    if "files" in message:
+        return message["files"]
+    return [{"file_name": message["file_name"], "origin_server_id": message["origin_server_id"],
+             "version_number": message["version_number"]}]
+
+#
+# Invalidation batcher class, pending {(origin, file_name): entry} flushed by a timer thread
+#
+class InvalidationBatcher:
+    def __init__(self, flush, interval=FLUSH_INTERVAL, max_batch=MAX_BATCH, start=True):
+        self.flush = flush  # called with a list of entries, once per batch
+        self.interval = interval
+        self.max_batch = max_batch
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.added = 0
+        self.coalesced = 0
+        self.batches = 0
+        # without the timer thread whoever replaces wakeup decides when batches go out
+        if start:
+            threading.Thread(target=self.run, daemon=True).start()
+
+    # queues one file, a newer version replaces an older one still waiting
+    def add(self, entry):
+        key = (entry["origin_server_id"], entry["file_name"])
+        with self.lock:
+            self.added += 1
+            waiting = self.pending.get(key)
+            if waiting:
+                self.coalesced += 1
+                if waiting["version_number"] >= entry["version_number"]:
+                    return
+            self.pending[key] = entry
+            full = len(self.pending) >= self.max_batch
+        if full:
+            self.send_pending()
+        else:
+            self.wakeup.set()
+
+    # sleeps until something is queued, then gives it interval seconds to fill up
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            time.sleep(self.interval)
+            self.wakeup.clear()
+            self.send_pending()
+
+    def send_pending(self):
+        with self.lock:
+            entries = list(self.pending.values())
+            self.pending.clear()
+        for start in range(0, len(entries), self.max_batch):
+            self.batches += 1
+            try:
+                self.flush(entries[start:start + self.max_batch])
+            except Exception as e:
+                log.warning("Error sending invalidation batch: %s", e)
+
+    def stats(self):
+        return {"added": self.added, "coalesced": self.coalesced, "batches": self.batches,
+                "pending": len(self.pending)}
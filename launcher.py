@@ -0,0 +1,235 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# launcher.py starts the network of a config file with every super peer, and every leaf node
+# unless told not to, in its own python process, so the super peers no longer share one GIL
+# and one node crashing leaves the rest running. super peers start first, leaves once every
+# super peer printed its READY line. a supervisor starts a node again when it exits on its
+# own, and ctrl-c stops the leaves and then the super peers
+#   python launcher.py <all_to_all.json/linear.json> [--mode=push/pull] [--leaves=yes/no] ...
+#
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from network_setup import load_config, parse_flags
+from invalidation_batcher import FLUSH_INTERVAL, MAX_BATCH
+from protocol import send_message
+from metrics import configure_logging
+
+DEFAULTS = {"mode": "push", "engine": "thread", "codec": "json", "lookup": "flood", "leaves": "yes",
+            "log": "info", "logs": "", "metrics": "", "sp-flush": FLUSH_INTERVAL, "sp-batch": MAX_BATCH}
+READY_TIMEOUT = 10  # seconds a node has to print READY
+STOP_TIMEOUT = 5  # seconds between SIGTERM and SIGKILL
+RESTART_LIMIT = 5  # restarts of one node within RESTART_WINDOW before the supervisor gives up on it
+RESTART_WINDOW = 60  # seconds
+BACKOFF = 0.5  # seconds before a restart, doubled for every recent restart
+CHECK_INTERVAL = 0.5  # seconds between checks of the node processes
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+log = logging.getLogger("launcher")
+
+#
+# Node process class, one super peer or leaf node running as a child process
+#
+class NodeProcess:
+    def __init__(self, name, args, log_path=None):
+        self.name = name
+        self.args = args  # script and arguments, run with this python
+        self.log_path = log_path  # output goes here, or to our terminal with the name in front
+        self.process = None
+        self.ready = threading.Event()
+        self.restarts = deque()  # times of recent restarts
+        self.failed = False  # restarted too often, left down
+
+    # the node runs in its own session so a ctrl-c in the terminal only reaches the launcher
+    def start(self):
+        self.ready.clear()
+        self.process = subprocess.Popen([sys.executable, "-u"] + self.args, stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                        start_new_session=True)
+        threading.Thread(target=self.forward, args=(self.process,), daemon=True).start()
+
+    # copies the output of the node until it exits, watching for its READY line
+    def forward(self, process):
+        out = open(self.log_path, "a") if self.log_path else None
+        try:
+            for line in process.stdout:
+                if line.startswith("READY "):
+                    self.ready.set()
+                if out:
+                    out.write(line)
+                    out.flush()
+                else:
+                    sys.stdout.write(f"[{self.name}] {line}")
+                    sys.stdout.flush()
+        finally:
+            if out:
+                out.close()
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def terminate(self):
+        if self.running():
+            self.process.terminate()
+
+    # waits for a terminated node to exit, killing it once the deadline passes
+    def wait_stopped(self, deadline):
+        if self.process is None:
+            return
+        try:
+            self.process.wait(max(deadline - time.time(), 0))
+        except subprocess.TimeoutExpired:
+            log.warning("%s did not stop, killing it.", self.name)
+            self.process.kill()
+            self.process.wait()
+
+#
+# Launcher class, starts every node of a config, restarts the ones that die and stops them all
+#
+class Launcher:
+    def __init__(self, config_file, options):
+        config = load_config(config_file)
+        ports = {sp["peer_id"]: sp["port"] for sp in config["super_peers"]}
+        flags = [f"--{name}={options[name]}" for name in ("mode", "engine", "codec")]
+        self.stopping = threading.Event()
+        self.super_peers = []
+        for sp_config in config["super_peers"]:
+            peer_id = sp_config["peer_id"]
+            args = [os.path.join(HERE, "super_peer.py"), config_file, peer_id] + flags
+            args += [f"--lookup={options['lookup']}", f"--log={options['log']}",
+                     f"--flush={options['sp-flush']}", f"--batch={options['sp-batch']}"]
+            args += self.metrics_flag(options, peer_id)
+            self.super_peers.append(NodeProcess(peer_id, args, self.log_path(options, peer_id)))
+        self.leaves = []
+        self.leaf_ports = [ln_config["port"] for ln_config in config["leaf_nodes"]]
+        if options["leaves"] == "yes":
+            for ln_config in config["leaf_nodes"]:
+                node_id = ln_config["node_id"]
+                args = [os.path.join(HERE, "leaf_node.py"), node_id, str(ports[ln_config["connected_super_peer"]]),
+                        str(ln_config["port"])] + list(ln_config["files"]) + flags
+                args += ["--headless=yes", f"--super-peer={ln_config['connected_super_peer']}", f"--log={options['log']}"] + self.metrics_flag(options, node_id)
+                self.leaves.append(NodeProcess(node_id, args, self.log_path(options, node_id)))
+
+    # every node writes its stats to <metrics>/<node>.json
+    def metrics_flag(self, options, name):
+        if not options["metrics"]:
+            return []
+        os.makedirs(options["metrics"], exist_ok=True)
+        return [f"--metrics={os.path.join(options['metrics'], name + '.json')}"]
+
+    # every node writes its output to <logs>/<node>.log
+    def log_path(self, options, name):
+        if not options["logs"]:
+            return None
+        os.makedirs(options["logs"], exist_ok=True)
+        return os.path.join(options["logs"], name + ".log")
+
+    def nodes(self):
+        return self.super_peers + self.leaves
+
+    # super peers first, all at once, then the leaves once every super peer is listening
+    def start(self):
+        start_time = time.time()
+        for group in (self.super_peers, self.leaves):
+            for node in group:
+                node.start()
+            self.wait_ready(group)
+        log.info("Started %d super peers and %d leaf nodes in %.2f seconds.",
+                 len(self.super_peers), len(self.leaves), time.time() - start_time)
+
+    # gives up as soon as a node exits before it is ready, or on ctrl-c
+    def wait_ready(self, nodes):
+        deadline = time.time() + READY_TIMEOUT
+        for node in nodes:
+            while not node.ready.wait(0.05):
+                if not node.running():
+                    raise RuntimeError(f"{node.name} exited with code {node.process.returncode} while starting")
+                if self.stopping.is_set():
+                    raise RuntimeError("Stopped while starting the network")
+                if time.time() > deadline:
+                    raise RuntimeError(f"{node.name} did not start within {READY_TIMEOUT} seconds")
+
+    # checks the nodes until stop is asked for, a node that exited is started again
+    def supervise(self):
+        while not self.stopping.wait(CHECK_INTERVAL):
+            for node in self.nodes():
+                if not node.failed and not node.running() and not self.stopping.is_set():
+                    self.restart(node)
+
+    # waits longer after every recent restart and leaves a node down that keeps crashing
+    def restart(self, node):
+        now = time.time()
+        while node.restarts and node.restarts[0] < now - RESTART_WINDOW:
+            node.restarts.popleft()
+        if len(node.restarts) >= RESTART_LIMIT:
+            node.failed = True
+            log.error("%s exited %d times in %d seconds, leaving it down.", node.name, RESTART_LIMIT, RESTART_WINDOW)
+            return
+        delay = BACKOFF * 2 ** len(node.restarts)
+        log.warning("%s exited with code %s, restarting it in %.1f seconds.", node.name, node.process.returncode, delay)
+        node.restarts.append(now)
+        if self.stopping.wait(delay):
+            return
+        node.start()
+        if not node.ready.wait(READY_TIMEOUT):
+            log.warning("%s did not print READY after its restart.", node.name)
+            return
+        if node in self.super_peers:
+            self.resync_leaves(node.name)
+
+    # a restarted super peer lost its registrations and interest table, every leaf sends its
+    # files and subscriptions again. leaves started elsewhere are asked as well
+    def resync_leaves(self, peer_id):
+        for port in self.leaf_ports:
+            try:
+                with socket.create_connection(("localhost", port), timeout=1) as s:
+                    send_message(s, {"type": "RESYNC", "restarted": peer_id})
+            except OSError as e:
+                log.debug("Could not ask the leaf on port %s to resync: %s", port, e)
+
+    # leaves first so their last invalidations and cleanups still reach a super peer
+    def stop(self):
+        self.stopping.set()
+        for group in (self.leaves, self.super_peers):
+            for node in group:
+                node.terminate()
+            deadline = time.time() + STOP_TIMEOUT
+            for node in group:
+                node.wait_stopped(deadline)
+        log.info("Stopped every node.")
+
+#
+# main
+#
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python launcher.py <all_to_all.json/linear.json> [--mode=push/pull] [--engine=thread/asyncio] "
+              "[--codec=json/binary] [--lookup=flood/dht] [--leaves=yes/no] [--log=debug/info/warning] "
+              "[--logs=<directory for node output>] [--metrics=<stats directory>] [--sp-flush=<seconds>] [--sp-batch=<n>]")
+        sys.exit(1)
+
+    options = parse_flags(sys.argv[2:], DEFAULTS)
+    configure_logging(options["log"])
+    launcher = Launcher(sys.argv[1], options)
+
+    def shutdown(signum, frame):
+        launcher.stopping.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    try:
+        launcher.start()
+        log.info("Network is up, ctrl-c to stop it.")
+        launcher.supervise()
+    except RuntimeError as e:
+        log.error("%s", e)
+    finally:
+        launcher.stop()
@@ -7,291 +7,980 @@
 #
 import socket
 import json
+import logging
 import threading
 import time
 import sys
 import os
-import traceback
+import itertools
+import hashlib
+import signal
 from file import File
+from file_store import FileStore
+from async_server import AsyncServer
+from protocol import send_message, recv_message, recv_exact, write_message, wrap_reply, encode, CODECS, LEGACY
+from connection_pool import ConnectionPool
+from swarm import SwarmDownload, chunk_hashes, CHUNK_SIZE
+from chunk_store import ChunkStore
+from version_history import VersionHistory
+from ttr_scheduler import TTRScheduler
+from invalidation_batcher import InvalidationBatcher, invalidation_entries
+from selection import SourceStats, UploadSlots, UPLOAD_LIMIT, order, describe
+from metrics import Metrics, MeteredSocket, configure_logging
 
 HOST = 'localhost'
+TRANSFER_BUFFER = 1024 * 1024  # receive buffer reused for every recv_into during a download
+TRANSFERS = ("file_transfer", "chunk_transfer")  # requests that take an upload slot
+LOAD_INTERVAL = 0.5  # seconds between load reports to the super peer
+
+log = logging.getLogger("leaf_node")
 
 #
 # leaf node class for handling nodes
 #
 class LeafNode:
-    def __init__(self, node_id, connected_super_peer_port, sp_name, files, file_names, port, mode):
+    def __init__(self, node_id, connected_super_peer_port, sp_name, files, file_names, port, mode, engine='thread', codec='json', lease=0,
+                 interactive=True, policy='ranked', upload_limit=UPLOAD_LIMIT):
         self.node_id = node_id
         self.connected_super_peer_port = connected_super_peer_port
         self.connected_super_peer_name = sp_name
-        self.files = files
-        self.file_names = file_names
+        self.directory = os.path.join(os.getcwd(), node_id)  # Directory for this leaf node
+        # file records live in a journaled store in the node's directory so versions survive a
+        # restart, files from the config are added when the store does not know them yet
+        self.files = FileStore(self.directory, node_id)
+        for name in file_names:
+            if name not in self.files:
+                self.files.add(files.get(name) or File(name, node_id, True, node_id))
+        # copies kept from before a restart, subscribed and checked again at registration
+        self.restored = self.files.copies()
         self.port = port
         self.mode = mode
-        self.directory = os.path.join(os.getcwd(), node_id)  # Directory for this leaf node
-        threading.Thread(target=self.start_server).start()
+        self.engine = engine
+        self.codec = CODECS[codec]  # encoding used for messages this leaf starts
+        # counters, latencies and query traces, answered to STATS
+        self.metrics = Metrics(node_id)
+        # keep-alive connection to the super peer, simulation.py replaces it with its own
+        self.pool = ConnectionPool(self.codec, metrics=self.metrics, sweep=engine != 'sim')
+        # message ids are unique per message, the session part keeps a restarted leaf from
+        # reusing ids super peers still remember
+        self.session = os.urandom(3).hex()
+        self.sequence = itertools.count(1)
+        # registrations are numbered so the super peer notices a lost update
+        self.registration_seq = itertools.count(1)
+        self.registration_lock = threading.Lock()
+        self.manifests = {}  # {file_name: (mtime, size, chunk_size, hashes)} for swarm downloads
+        # chunks of invalidated copies, a new version only fetches the chunks that changed
+        self.chunks = ChunkStore(os.path.join(self.directory, ".chunks"))
+        # the last edits to this node's own files, copies a few versions behind ask for them
+        # with a DELTA_REQUEST instead of downloading the file again
+        self.history = VersionHistory()
+        # pull mode, when each cached copy is checked next. as an origin this node may promise
+        # pollers that a file will not change for lease seconds
+        self.ttr = TTRScheduler()
+        self.lease = lease
+        self.leases = {}  # {file_name: time the last lease handed out runs out}
+        # a headless leaf never calls input(), it picks sources with the selection policy and
+        # re-downloads stale copies only if redownload is set
+        self.interactive = interactive
+        self.policy = policy
+        self.redownload = False
+        # with refresh a copy found out of date is brought up to date in place instead of
+        # being thrown away
+        self.refresh = False
+        self.sources = SourceStats()  # transfer rates and running downloads per holder
+        # transfers this node serves at once, the super peer hears how busy it is and puts
+        # that in our QueryHits
+        self.uploads = UploadSlots(upload_limit)
+        self.load_lock = threading.Lock()
+        self.load_reported = 0  # time of the last LOAD_REPORT
+        self.load_pending = False  # a report is waiting for LOAD_INTERVAL to pass
+        # edits made close together go out as one INVALIDATION with the newest versions
+        self.invalidations = InvalidationBatcher(self.send_invalidations, start=engine != 'sim')
+        self.metrics.gauge("copies", lambda: len(self.files.copies()))
+        self.metrics.gauge("active_downloads", lambda: sum(self.sources.active.values()))
+        self.metrics.gauge("active_uploads", lambda: self.uploads.active)
+        self.ready = threading.Event()  # set once the server socket is listening
+        if self.engine == 'asyncio':
+            # single event loop for every connection, disk reads go to the worker pool
+            self.server = AsyncServer(self, self.port)
+            self.ready = self.server.ready
+            threading.Thread(target=self.server.run).start()
+        elif self.engine != 'sim':
+            threading.Thread(target=self.start_server).start()
+        # with the 'sim' engine simulation.py delivers every message itself, there is no server
         if self.mode == 'pull':
-            threading.Thread(target=self.poll_for_updates, args=(30,), daemon=True).start()
+            threading.Thread(target=self.poll_for_updates, daemon=True).start()
 
     # starts server socket on number given in config file
     def start_server(self):
-        print(f'Starting leaf node {self.node_id}')
+        log.debug("Starting leaf node %s", self.node_id)
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # lets a restarted node rebind while its old connections sit in TIME_WAIT
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server_socket.bind((HOST, self.port))
         server_socket.listen()
-        print(f"Leaf-node {self.node_id} server started on port {self.port} in {self.mode} mode")
+        self.ready.set()
+        log.info("Leaf-node %s server started on port %s in %s mode", self.node_id, self.port, self.mode)
 
         while True:
             client_socket, address = server_socket.accept()
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client_socket = MeteredSocket(client_socket, self.metrics)
             threading.Thread(target=self.handle_connection, args=(client_socket, address)).start()
     
-    # handles file transfers to other leaf nodes if requested in message
+    # pooled connections stay open and carry many requests, legacy ones and file transfers one
     def handle_connection(self, client_socket, address):
-        data = client_socket.recv(1024).decode()
-        request = json.loads(data)
+        self.metrics.connected(1)
+        try:
+            while True:
+                request, codec = recv_message(client_socket)
+                if request is None:
+                    break
+                self.metrics.measure(request.get("type"), self.handle_request, request, client_socket, codec)
+                if codec == LEGACY or request["type"] in ("file_transfer", "chunk_transfer"):
+                    break
+        except (OSError, ValueError) as e:
+            log.warning("Leaf-node %s dropped connection from %s: %s", self.node_id, address, e)
+        finally:
+            self.metrics.connected(-1)
+        client_socket.close()
+
+    # handles file transfers to other leaf nodes if requested in message
+    def handle_request(self, request, client_socket, codec):
         # print(f'request recieved from super peer: {request}')
 
+        if request["type"] in TRANSFERS and request["file_name"] in self.files:
+            # with every upload slot taken the downloader is told BUSY and tries another holder
+            if not self.start_upload():
+                self.send_busy(client_socket.sendall, codec)
+                return
+            start, sent = time.time(), 0
+            try:
+                sent = self.send_transfer(request, client_socket, codec)
+            finally:
+                self.end_upload(sent, time.time() - start)
+        elif request["type"] == "chunk_transfer":
+            send_message(client_socket, {"status": "NOT_FOUND"}, codec)
+        elif request["type"] == "file_manifest":
+            send_message(client_socket, wrap_reply(request, self.manifest_response(request)), codec)
+        elif request["type"] == "INVALIDATION":
+            # print('In handle invallidation')
+            for entry in invalidation_entries(request):
+                if entry["file_name"] in self.files:
+                    if self.refresh:
+                        self.update_copy(entry)
+                    else:
+                        self.handle_invallidation(entry)
+            log.debug("registered files at L%s: %s", self.node_id, self.files)
+        elif request["type"] == "DELTA_REQUEST":
+            send_message(client_socket, wrap_reply(request, self.delta_response(request)), codec)
+        elif request["type"] == "VERSION_REQUEST":
+            self.handle_version_request(client_socket, request, codec)
+        elif request["type"] == "VERSION_BATCH":
+            send_message(client_socket, wrap_reply(request, self.version_batch_response(request)), codec)
+        elif request["type"] == "RESYNC":
+            self.resync(request)
+        elif request["type"] == "PING":
+            send_message(client_socket, wrap_reply(request, {"type": "PONG"}), codec)
+        elif request["type"] == "STATS":
+            send_message(client_socket, wrap_reply(request, self.stats()), codec)
+        elif codec == LEGACY:
+            client_socket.send("File not found".encode())
+        else:
+            send_message(client_socket, wrap_reply(request, {"status": "NOT_FOUND"}), codec)
+
+    # sends a whole file, a byte range of it or the chunks asked for, returns the bytes sent
+    def send_transfer(self, request, client_socket, codec):
+        if request["type"] == "chunk_transfer":
+            header, ranges = self.chunk_ranges(request)
+            send_message(client_socket, header, codec)
+            sent = 0
+            if ranges:
+                with open(os.path.join(self.directory, request["file_name"]), "rb") as file:
+                    for offset, length in ranges:
+                        sent += client_socket.sendfile(file, offset, length)
+            return sent
+
         file_path = os.path.join(self.directory, request["file_name"])  # Use directory for the file path
+        # Open the file in the node's directory and send the actual file content
+        # sendfile lets the kernel copy straight from the page cache to the socket
+        with open(file_path, "rb") as file:
+            offset, size = self.transfer_range(request, os.fstat(file.fileno()).st_size)
+            self.send_transfer_header(client_socket.sendall, request, codec, size)
+            sent = client_socket.sendfile(file, offset, size)
+        log.info("Leaf-node %s sent '%s' to Leaf-node %s", self.node_id, request["file_name"], request["requester"])
+        return sent
 
-        if request["type"] == "file_transfer" and request["file_name"] in self.file_names:
-            response = f"Sending file {request['file_name']} to {request['requester']}"
-            client_socket.send(response.encode())
-            print(f"Leaf-node {self.node_id} sent '{request['file_name']}' to Leaf-node {request['requester']}")
-            
-            # Open the file in the node's directory and send the actual file content
-            with open(file_path, "rb") as file:
-                while True:
-                    file_data = file.read(1024)
-                    if not file_data:
-                        break
-                    client_socket.send(file_data)
-        elif request["type"] == "INVALIDATION" and request["file_name"] in self.file_names:
-            # print('In handle invallidation')
-            self.handle_invallidation(request)
-            print(f'registered files at L{self.node_id}: {self.files} and {self.file_names}')
+    def start_upload(self):
+        if not self.uploads.acquire():
+            self.metrics.incr("uploads_refused")
+            return False
+        self.report_load()
+        return True
+
+    def end_upload(self, size, duration):
+        self.uploads.release(size, duration)
+        self.report_load()
+
+    def send_busy(self, send, codec):
+        if codec == LEGACY:
+            send("Leaf node busy".encode())
+        else:
+            send(encode({"status": "BUSY"}, codec))
+
+    # tells the super peer how many uploads are running, at most once every LOAD_INTERVAL.
+    # a change inside the interval goes out when it ends, so the last one is never lost. the
+    # report is always sent from a timer thread, uploads start and end on the event loop too
+    def report_load(self):
+        with self.load_lock:
+            if self.load_pending:
+                return
+            self.load_pending = True
+            wait = max(0, self.load_reported + LOAD_INTERVAL - time.time())
+        threading.Timer(wait, self.send_load).start()
+
+    def send_load(self):
+        with self.load_lock:
+            self.load_pending = False
+            self.load_reported = time.time()
+        report = dict(self.uploads.hint(), type="LOAD_REPORT", node_id=self.node_id)
+        try:
+            self.pool.send(self.connected_super_peer_port, report)
+        except OSError as e:
+            log.debug("Leaf-node %s could not report its load: %s", self.node_id, e)
+
+    # older nodes expect a plain text line before the file bytes, framed ones get a header
+    # message that also says how many bytes follow and which version of the file they are
+    def send_transfer_header(self, send, request, codec, size):
+        if codec == LEGACY:
+            send(f"Sending file {request['file_name']} to {request['requester']}".encode())
+        else:
+            version = self.files[request["file_name"]].version
+            send(encode({"status": "SENDING", "file_name": request["file_name"], "size": size, "version": version}, codec))
+
+    # swarm downloads ask for one byte range at a time, a plain request gets the whole file
+    def transfer_range(self, request, file_size):
+        offset = min(max(request.get("offset", 0), 0), file_size)
+        length = request.get("length", file_size - offset)
+        return offset, min(max(length, 0), file_size - offset)
+
+    # size and per chunk sha256 of a file, reused until the file changes on disk
+    def manifest_response(self, request):
+        filename = request["file_name"]
+        chunk_size = request.get("chunk_size") or TRANSFER_BUFFER
+        if filename not in self.files:
+            return {"status": "NOT_FOUND"}
+        file_path = os.path.join(self.directory, filename)
+        stat = os.stat(file_path)
+        cached = self.manifests.get(filename)
+        if not cached or cached[:3] != (stat.st_mtime_ns, stat.st_size, chunk_size):
+            cached = (stat.st_mtime_ns, stat.st_size, chunk_size, chunk_hashes(file_path, chunk_size))
+            self.manifests[filename] = cached
+        return {"status": "OK", "size": stat.st_size, "chunk_size": chunk_size, "hashes": cached[3],
+                "version": self.files[filename].version}
+
+    # where the chunks a downloader asked for by hash are in the file, from the same manifest
+    # it was sent. a hash that is not in the file means it changed since, nothing is sent
+    def chunk_ranges(self, request):
+        manifest = self.manifest_response(request)
+        if manifest["status"] != "OK":
+            return {"status": "NOT_FOUND"}, None
+        chunk_size = manifest["chunk_size"]
+        index = {}
+        for i, digest in enumerate(manifest["hashes"]):
+            index.setdefault(digest, i)
+        if any(digest not in index for digest in request["hashes"]):
+            return {"status": "CHANGED"}, None
+        ranges = []
+        for digest in request["hashes"]:
+            offset = index[digest] * chunk_size
+            ranges.append((offset, min(chunk_size, manifest["size"] - offset)))
+        return {"status": "SENDING", "lengths": [length for _, length in ranges],
+                "version": manifest["version"]}, ranges
+
+    # coroutine version of handle_connection used by the asyncio engine
+    async def handle_request_async(self, request, writer, codec):
+        if request["type"] in TRANSFERS and request["file_name"] in self.files:
+            if not self.start_upload():
+                self.send_busy(writer.write, codec)
+                return
+            start, sent = time.time(), 0
+            try:
+                sent = await self.send_transfer_async(request, writer, codec)
+            finally:
+                self.end_upload(sent, time.time() - start)
+        elif request["type"] == "chunk_transfer":
+            write_message(writer, {"status": "NOT_FOUND"}, codec)
+        elif request["type"] == "file_manifest":
+            response = await self.server.run_blocking(self.manifest_response, request)
+            write_message(writer, wrap_reply(request, response), codec)
+        elif request["type"] == "INVALIDATION":
+            for entry in invalidation_entries(request):
+                if entry["file_name"] in self.files:
+                    await self.server.run_blocking(self.update_copy if self.refresh else self.handle_invallidation, entry)
+            log.debug("registered files at L%s: %s", self.node_id, self.files)
+        elif request["type"] == "DELTA_REQUEST":
+            write_message(writer, wrap_reply(request, self.delta_response(request)), codec)
         elif request["type"] == "VERSION_REQUEST":
-            self.handle_version_request(client_socket, request)
+            write_message(writer, wrap_reply(request, self.version_response(request)), codec)
+        elif request["type"] == "VERSION_BATCH":
+            write_message(writer, wrap_reply(request, self.version_batch_response(request)), codec)
+        elif request["type"] == "RESYNC":
+            await self.server.run_blocking(self.resync, request)
+        elif request["type"] == "PING":
+            write_message(writer, wrap_reply(request, {"type": "PONG"}), codec)
+        elif request["type"] == "STATS":
+            write_message(writer, wrap_reply(request, self.stats()), codec)
+        elif codec == LEGACY:
+            writer.write("File not found".encode())
         else:
-            client_socket.send("File not found".encode())
-        client_socket.close()
+            write_message(writer, wrap_reply(request, {"status": "NOT_FOUND"}), codec)
+
+    # coroutine version of send_transfer
+    async def send_transfer_async(self, request, writer, codec):
+        # the transport is written to directly, so the metered writer does not see these bytes
+        sent = 0
+        if request["type"] == "chunk_transfer":
+            header, ranges = await self.server.run_blocking(self.chunk_ranges, request)
+            write_message(writer, header, codec)
+            await writer.drain()
+            if ranges:
+                with open(os.path.join(self.directory, request["file_name"]), "rb") as file:
+                    for offset, length in ranges:
+                        sent += await self.server.loop.sendfile(writer.transport, file, offset, length)
+            self.metrics.sent(sent)
+            return sent
 
-    def handle_version_request(self, client_socket, request):
+        file_path = os.path.join(self.directory, request["file_name"])
+        # the loop hands the file to the kernel with sendfile, or falls back to reading it
+        # in large chunks if the transport cannot
+        with open(file_path, "rb") as file:
+            offset, size = self.transfer_range(request, os.fstat(file.fileno()).st_size)
+            self.send_transfer_header(writer.write, request, codec, size)
+            await writer.drain()
+            sent = await self.server.loop.sendfile(writer.transport, file, offset, size)
+        self.metrics.sent(sent)
+        log.info("Leaf-node %s sent '%s' to Leaf-node %s", self.node_id, request["file_name"], request["requester"])
+        return sent
+
+    def handle_version_request(self, client_socket, request, codec):
+        response = self.version_response(request)
+        send_message(client_socket, wrap_reply(request, response), codec)
+
+    # looks up the current version of a file for a VERSION_REQUEST
+    def version_response(self, request):
         filename = request["file_name"]
         if filename in self.files:
             file_struct = self.files[filename]
-            response = {"version": file_struct.version}
-            client_socket.send(json.dumps(response).encode())
-            print(f"Leaf-node {self.node_id} sent version {file_struct.version} for {filename}.")
-        else:
-            response = {"version": 0}  # File not found or invalid
-            client_socket.send(json.dumps(response).encode())
-            print(f"Leaf-node {self.node_id} could not find {filename}.")
+            log.debug("Leaf-node %s sent version %s for %s.", self.node_id, file_struct.version, filename)
+            return {"version": file_struct.version}
+        log.debug("Leaf-node %s could not find %s.", self.node_id, filename)
+        return {"version": 0}  # File not found or invalid
+
+    # the text appended to one of this node's files since the version a copy holder has.
+    # PRUNED means the history no longer goes back that far
+    def delta_response(self, request):
+        file_struct = self.files.get(request["file_name"])
+        if file_struct is None or file_struct.copy:
+            return {"status": "NOT_FOUND"}
+        version = file_struct.version
+        edits = self.history.delta(request["file_name"], request["version"], version)
+        if edits is None:
+            self.metrics.incr("deltas_pruned")
+            return {"status": "PRUNED", "version": version}
+        self.metrics.incr("deltas_sent")
+        return {"status": "OK", "version": version,
+                "edits": [{"offset": offset, "text": text} for _, offset, text in edits]}
+
+    # versions of many files for one super peer checking a whole batch of pulls
+    def version_batch_response(self, request):
+        versions = {}
+        leases = {}
+        for filename in request["files"]:
+            file_struct = self.files.get(filename)
+            versions[filename] = file_struct.version if file_struct else 0
+            if self.lease and file_struct and not file_struct.copy:
+                leases[filename] = self.lease
+                self.leases[filename] = time.time() + self.lease
+        log.debug("Leaf-node %s sent versions for %d files.", self.node_id, len(versions))
+        return {"versions": versions, "leases": leases}
+
+    # what this leaf counted about itself and its parts, the reply to STATS
+    def stats(self):
+        return dict(self.metrics.stats(), pool=self.pool.stats(), ttr=self.ttr.stats(), files=self.files.stats(),
+                    invalidations=self.invalidations.stats(), history=self.history.stats(), uploads=self.uploads.stats(),
+                    sources={"rates": dict(self.sources.rates), "active": dict(self.sources.active)})
 
     # function to handle invalildation requests from superpeers
     def handle_invallidation(self, message):
         
         filename = message["file_name"]
-        f = self.files[filename]
+        f = self.files.get(filename)
 
-        if filename in self.file_names and f.copy:
+        if f is not None and f.copy:
+            origin_node = f.origin_node
             # Invalidate the file and update its metadata
             file_struct = self.files[filename]
             file_struct.invalidate()  # Mark the file as invalid
 
             # Optionally, remove the file from the directory if necessary
+            # its chunks stay in the chunk store for the download of the next version
             file_path = os.path.join(self.directory, filename)
             if os.path.exists(file_path):
+                self.chunks.keep(filename, file_path)
                 os.remove(file_path)
-                print(f"Leaf-node {self.node_id} discarded invalid file {filename}.")
+                log.info("Leaf-node %s discarded invalid file %s.", self.node_id, filename)
 
             # Deregister the file
-            self.file_names.remove(filename)
-            del self.files[filename]
-            self.register_files()
-            print(f"Leaf-node {self.node_id} deregistered {filename}.")
+            self.files.remove(filename)
+            self.ttr.remove(filename)
+            self.update_registration(removed=[filename])
+            self.metrics.incr("copies_invalidated")
+            log.info("Leaf-node %s deregistered %s.", self.node_id, filename)
 
             cleanup_message = {
                 "type": "CLEANUP",
                 "file_name": filename,
-                "msg_id": f"{self.node_id}_{filename}",
+                "msg_id": self.new_message_id(filename),
+                "node_id": self.node_id,
+                "origin_node": origin_node,
                 "super_peer": self.connected_super_peer_name
             }
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((HOST, self.connected_super_peer_port))
-                s.send(json.dumps(cleanup_message).encode())
+            self.pool.send(self.connected_super_peer_port, cleanup_message)
                 
         else:
-            print(f"Leaf-node {self.node_id} received invalidation for {filename}, but it does not exist locally.")
+            log.debug("Leaf-node %s received invalidation for %s, but it does not exist locally.", self.node_id, filename)
         return
 
 
-    # registers files in leaf nodes at startup of leafnode
-    def register_files(self):
-        query = {"type": "register_files", "node_id": self.node_id, "files": self.file_names}
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((HOST, self.connected_super_peer_port))
-            s.send(json.dumps(query).encode())
-        print(f"Leaf-node {self.node_id} registered its files with super-peer at port {self.connected_super_peer_port}.")
+    # an out of date copy asks the origin for the edits it missed and appends them in place.
+    # if the origin no longer remembers them the copy is discarded like before and
+    # downloaded again, which only fetches the chunks that changed
+    def update_copy(self, message):
+        filename = message["file_name"]
+        copy = self.files.get(filename)
+        if copy is None or not copy.copy:
+            return self.handle_invallidation(message)
+        origin = message.get("origin_server_id") or copy.origin_node
+        if self.refresh_copy(filename, origin, message.get("version_number")):
+            return
+        self.handle_invallidation(message)
+        try:
+            self.retrieve_file(origin, filename)
+        except (OSError, ValueError) as e:
+            log.warning("Leaf-node %s could not download '%s' again from %s: %s", self.node_id, filename, origin, e)
+
+    # returns True if the copy is now at the origin's version
+    def refresh_copy(self, filename, origin, version=None):
+        copy = self.files.get(filename)
+        if version is not None and copy.version >= version:
+            return True
+        request = {"type": "DELTA_REQUEST", "file_name": filename, "version": copy.version, "requester": self.node_id}
+        try:
+            response = self.pool.request(6000 + int(origin[1:]), request)
+        except (OSError, ValueError) as e:
+            log.warning("Leaf-node %s could not ask %s for changes to '%s': %s", self.node_id, origin, filename, e)
+            return False
+        if response.get("status") != "OK":
+            log.info("Leaf-node %s got no delta for '%s' from %s: %s", self.node_id, filename, origin, response.get("status"))
+            return False
+        edits = response["edits"]
+        file_path = os.path.join(self.directory, filename)
+        size = 0
+        with open(file_path, "r+b") as f:
+            # the first missed edit was appended where the copy ends, anything else means the
+            # copy is not the version it claims
+            if edits and edits[0]["offset"] != os.fstat(f.fileno()).st_size:
+                log.warning("Leaf-node %s copy of '%s' does not match version %s.", self.node_id, filename, copy.version)
+                return False
+            for edit in edits:
+                data = edit["text"].encode()
+                os.pwrite(f.fileno(), data, edit["offset"])
+                size += len(data)
+        copy.set_version(response["version"])
+        self.update_registration(changed=[filename])
+        self.metrics.incr("copies_refreshed")
+        self.metrics.incr("delta_bytes", size)
+        log.info("Leaf-node %s refreshed '%s' to version %s with %d bytes.", self.node_id, filename, copy.version, size)
+        return True
+
+    # e.g. L1_file1.txt_3fa2c1-7
+    def new_message_id(self, file_name):
+        return f"{self.node_id}_{file_name}_{self.session}-{next(self.sequence)}"
+
+    # registers files in leaf nodes at startup of leafnode, or when the super peer asks for
+    # the whole list again
+    def register_files(self, republish=False):
+        with self.registration_lock:
+            names = self.files.names()
+            query = {"type": "register_files", "node_id": self.node_id, "files": names,
+                     "versions": {name: self.files[name].version for name in names},
+                     "origins": self.copy_origins(names),
+                     "seq": next(self.registration_seq), "republish": republish}
+            self.pool.send(self.connected_super_peer_port, query)
+        log.debug("Leaf-node %s registered its files with super-peer at port %s.", self.node_id, self.connected_super_peer_port)
+        if self.restored:
+            restored, self.restored = self.restored, []
+            threading.Thread(target=self.resume_copies, args=(restored,), daemon=True).start()
+
+    # a super peer lost track of this leaf and wants the full list. when one was restarted
+    # (the launcher says which) every super peer may have lost our files or copies, so both
+    # are announced again
+    def resync(self, request):
+        restarted = request.get("restarted")
+        self.register_files(republish=bool(restarted))
+        if restarted:
+            log.info("Super-peer %s restarted, Leaf-node %s subscribes to its copies again.", restarted, self.node_id)
+            for file_name in self.files.copies():
+                self.subscribe(file_name, again=True)
+
+    # tells the super peer only which files came and went, and the new version of any copy
+    # that was brought up to date. if the send fails the next update arrives out of order
+    # and the super peer asks for the full list
+    def update_registration(self, added=(), removed=(), changed=()):
+        with self.registration_lock:
+            delta = {"type": "REGISTER_DELTA", "node_id": self.node_id, "seq": next(self.registration_seq),
+                     "add": list(added), "remove": list(removed),
+                     "versions": {name: self.files[name].version for name in [*added, *changed] if name in self.files},
+                     "origins": self.copy_origins(added)}
+            try:
+                self.pool.send(self.connected_super_peer_port, delta)
+            except OSError as e:
+                log.warning("Leaf-node %s could not update its registration: %s", self.node_id, e)
+
+    # where the copies among these files came from, so QueryHits for them name the origin
+    def copy_origins(self, names):
+        return {name: self.files[name].origin_node for name in names
+                if name in self.files and self.files[name].copy}
+
+    # copies kept from before a restart get their invalidations again and are checked with
+    # the origin once, since they may have changed while this node was down
+    def resume_copies(self, file_names):
+        for file_name in file_names:
+            self.subscribe(file_name)
+            if self.mode == 'pull':
+                self.ttr.add(file_name)
+        self.pull_updates(file_names)
   
     # for sending queries to super peers or file download requests
-    def query_file(self, file_name, TTL=17):
+    # with first_hit the file comes from whoever answers first and the rest of the flood is cancelled
+    # with swarm the file is fetched from every leaf node that answered at once. a leaf that is
+    # not interactive, or given a policy, picks the holder with the selection policy. a holder
+    # that is busy or gone hands the download on to the next best one
+    def query_file(self, file_name, TTL=17, first_hit=False, swarm=False, policy=None):
         
-        if file_name in self.file_names:
+        if file_name in self.files:
             print(f"Leaf-node {self.node_id} already has '{file_name}' locally.")
             return
 
         start_time = time.time()
-        query = {
-            "type": "file_query",
-            "file_name": file_name,
-            "TTL": TTL,
-            "message_id": f"{self.node_id}_{file_name}",
-            "origin": self.node_id,
-            "super_node": self.connected_super_peer_name
-        }
-        reponse = []
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            print('sending file query\n')
-            s.connect((HOST, self.connected_super_peer_port))
-            s.send(json.dumps(query).encode())
-            # print(query)
-            response = json.loads(s.recv(1024).decode())
-            # print(response)
-
-        # if response:
-        # print(f'response from leaf node query {response}')
+        print('sending file query\n')
+        response = []
+        first_duration = 0
+        hits = self.stream_query(file_name, TTL)
+        # hits are printed as they stream in instead of after the whole network answered
+        for hit in hits:
+            if not response:
+                first_duration = time.time() - start_time
+                print(f"QueryHit! Leaf-node {self.node_id} found '{file_name}' on the following leaf nodes:")
+            response.append(hit)
+            print(f"{len(response)} - Leaf-node {hit['leaf_node']}{describe(hit)}")
+            if first_hit:
+                hits.close()
+                break
 
         duration = 0
         if response:
             duration = time.time() - start_time
-            print(f"QueryHit! Leaf-node {self.node_id} found '{file_name}' on the following leaf nodes:")
-            i = 0
-            for hit in response:
-                i += 1
-                print(f"{i} - Leaf-node {hit['leaf_node']}")
-            n = input("Select a Leaf Node to download from (e.g. 1, 2, 3): ")
-            self.retrieve_file(response[int(n)-1]["leaf_node"], file_name)
-            self.register_files()
+            if swarm:
+                if not self.swarm_download(file_name, response):
+                    print(f"No leaf node could send '{file_name}'.")
+            else:
+                if first_hit:
+                    sources = response
+                elif policy or not self.interactive:
+                    sources = order(policy or self.policy, response, self.sources)
+                else:
+                    n = input("Select a Leaf Node to download from (e.g. 1, 2, 3), or press enter to pick the best: ")
+                    chosen = response[int(n)-1] if n.strip() else None
+                    sources = order(self.policy, response, self.sources, chosen)
+                if self.retrieve_from(file_name, sources) is None:
+                    print(f"No leaf node could send '{file_name}'.")
 
+            print(f"First QueryHit for '{file_name}' arrived after {first_duration:.4f} seconds.")
             print(f"Query for '{file_name}' took {duration:.4f} seconds.")
+
+    # headless api, returns the QueryHits instead of printing them
+    def query(self, file_name, TTL=17, first_hit=False):
+        response = []
+        hits = self.stream_query(file_name, TTL)
+        for hit in hits:
+            response.append(hit)
+            if first_hit:
+                hits.close()
+                break
+        return response
+
+    # headless api, queries and downloads a file from the holder the policy picks. returns
+    # the leaf node it came from, or None if nobody had it
+    def download(self, file_name, policy=None, TTL=17):
+        if file_name in self.files:
+            return None
+        response = self.query(file_name, TTL)
+        if not response:
+            return None
+        return self.retrieve_from(file_name, order(policy or self.policy, response, self.sources))
+
+    # tries the holders in order until one sends the file, returns the leaf node it came
+    # from or None if none of them could
+    def retrieve_from(self, file_name, hits):
+        for hit in hits:
+            try:
+                if self.retrieve_file(hit["leaf_node"], file_name, hit.get("origin")):
+                    return hit["leaf_node"]
+            except (OSError, ValueError) as e:
+                log.info("Leaf-node %s could not get '%s' from Leaf-node %s: %s", self.node_id, file_name, hit["leaf_node"], e)
+            self.metrics.incr("source_fallbacks")
+        return None
+
+    # yields QueryHits one at a time as the super peer streams them back. closing the
+    # generator before the end sends QUERY_CANCEL so the super peers stop flooding
+    def stream_query(self, file_name, TTL=17):
+        query = {
+            "type": "file_query",
+            "file_name": file_name,
+            "TTL": TTL,
+            "message_id": self.new_message_id(file_name),
+            "origin": self.node_id,
+            "super_node": self.connected_super_peer_name,
+            "stream": True
+        }
+        finished = False
+        hits = []
+        start = time.time()
+        try:
+            for hit in self.pool.stream(self.connected_super_peer_port, query):
+                hits.append(hit)
+                yield hit
+            finished = True
+        finally:
+            # the path each hit took, as the super peers recorded it
+            self.metrics.trace(query["message_id"], file_name=file_name, ttl=TTL, complete=finished,
+                               ms=(time.time() - start) * 1000,
+                               hits=[{"leaf_node": hit["leaf_node"], "path": hit.get("path", [])} for hit in hits])
+            if not finished:
+                cancel = {"type": "QUERY_CANCEL", "message_id": query["message_id"]}
+                self.pool.send(self.connected_super_peer_port, cancel)
        
        
     # function to request download from other leaf nodes
-    def retrieve_file(self, leaf_node_id, file_name):
-        print(f"Leaf-node {self.node_id} attempting to retrieve '{file_name}' from Leaf-node {leaf_node_id}")
+    # a file this node held a copy of before only has its changed chunks fetched
+    def retrieve_file(self, leaf_node_id, file_name, origin=None):
+        log.info("Leaf-node %s attempting to retrieve '%s' from Leaf-node %s", self.node_id, file_name, leaf_node_id)
+        self.sources.started(leaf_node_id)
+        size = duration = 0
+        try:
+            start_time = time.time()
+            version = None
+            if file_name in self.chunks:
+                try:
+                    version, size = self.retrieve_chunks(leaf_node_id, file_name)
+                except ConnectionRefusedError:
+                    raise  # busy or down, the whole file would not come either
+                except (OSError, ValueError) as e:
+                    log.warning("Leaf-node %s could not fetch chunks of '%s', downloading all of it: %s", self.node_id, file_name, e)
+            if version is None:
+                # whatever the whole download brings, the chunks kept for this file are of no
+                # more use and would stay in the chunk store for good
+                self.chunks.release(file_name)
+                version, size = self.retrieve_whole(leaf_node_id, file_name)
+            if version is None:
+                self.metrics.incr("download_failures")
+                return False
+            duration = max(time.time() - start_time, 1e-6)
+            # a holder that has a copy itself is not where invalidations for the file come from
+            self.add_copy(file_name, origin or leaf_node_id, version)
+
+            self.metrics.incr("downloads")
+            self.metrics.observe("download", duration)
+            log.info("Leaf-node %s successfully downloaded '%s' from Leaf-node %s.", self.node_id, file_name, leaf_node_id)
+            log.info("Transfer of %d bytes took %.4f seconds (%.2f MB/s).", size, duration, size / duration / 1e6)
+            return True
+        finally:
+            # what the selection policies know about this holder
+            self.sources.finished(leaf_node_id, size, duration)
+
+    # one file_transfer for the whole file, returns (version, bytes) or (None, 0)
+    def retrieve_whole(self, leaf_node_id, file_name):
         target_port = 6000 + int(leaf_node_id[1:]) 
         # print(f'Target port: {target_port}')
-        
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((HOST, target_port))
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as raw:
+            raw.connect((HOST, target_port))
+            s = MeteredSocket(raw, self.metrics)
             request = {"type": "file_transfer", "file_name": file_name, "requester": self.node_id}
-            s.send(json.dumps(request).encode())
+            send_message(s, request, self.codec)
 
             # Receive the initial response
-            response = s.recv(1024).decode()
+            response, _ = recv_message(s)
             # print(f"Response from leaf node: {response}")
+            if response and response.get("status") == "BUSY":
+                raise ConnectionRefusedError(f"Leaf-node {leaf_node_id} has no free upload slot")
 
-            if "Sending file" in response:
+            if response and response.get("status") == "SENDING":
                 # Save the file in the node's directory
                 file_path = os.path.join(self.directory, file_name)
-                with open(file_path, 'wb') as file:
-                    while True:
-                        data = s.recv(1024)
-                        if not data:
-                            break
-                        file.write(data)
+                size = self.receive_file(s, file_path, response.get("size"))
+                # the copy has the version it was downloaded at, not a fresh 1
+                return response.get("version", 1), size
+        return None, 0
+
+    # asks the holder for its chunk hashes and fetches only the chunks the chunk store does
+    # not have, in one chunk_transfer. the file is put together from both with pwrite.
+    # returns (version, bytes received), or (None, 0) if the holder cannot send chunks
+    def retrieve_chunks(self, leaf_node_id, file_name):
+        target_port = 6000 + int(leaf_node_id[1:])
+        manifest = self.pool.request(target_port, {"type": "file_manifest", "file_name": file_name, "chunk_size": CHUNK_SIZE})
+        if manifest.get("status") != "OK":
+            return None, 0
+        positions = {}
+        for i, digest in enumerate(manifest["hashes"]):
+            positions.setdefault(digest, []).append(i * manifest["chunk_size"])
+        needed = [digest for digest in positions if not self.chunks.has(digest)]
+
+        file_path = os.path.join(self.directory, file_name)
+        partial_path = file_path + ".part"
+        received = 0
+        complete = False
+        fd = os.open(partial_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, manifest["size"])
+            if needed:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as raw:
+                    raw.connect((HOST, target_port))
+                    s = MeteredSocket(raw, self.metrics)
+                    request = {"type": "chunk_transfer", "file_name": file_name, "requester": self.node_id,
+                               "chunk_size": manifest["chunk_size"], "hashes": needed}
+                    send_message(s, request, self.codec)
+                    response, _ = recv_message(s)
+                    if response and response.get("status") == "BUSY":
+                        raise ConnectionRefusedError(f"Leaf-node {leaf_node_id} has no free upload slot")
+                    if not response or response.get("status") != "SENDING":
+                        return None, 0
+                    for digest, length in zip(needed, response["lengths"]):
+                        data = recv_exact(s, length)
+                        if hashlib.sha256(data).hexdigest() != digest:
+                            raise ValueError(f"chunk {digest[:12]} does not match its hash")
+                        for offset in positions.pop(digest):
+                            os.pwrite(fd, data, offset)
+                        received += length
+            for digest, offsets in positions.items():
+                data = self.kept_chunk(file_name, digest)
+                if data is None:
+                    return None, 0
+                for offset in offsets:
+                    os.pwrite(fd, data, offset)
+            complete = True
+        finally:
+            os.close(fd)
+            if not complete:
+                os.remove(partial_path)
+        os.replace(partial_path, file_path)
+        self.chunks.release(file_name)
+        self.metrics.incr("chunks_fetched", len(needed))
+        self.metrics.incr("chunks_reused", len(manifest["hashes"]) - len(needed))
+        return manifest["version"], received
+
+    # a chunk from the chunk store, or None if it went missing since the hashes were compared
+    # or no longer matches its hash. the caller then downloads the whole file instead
+    def kept_chunk(self, file_name, digest):
+        try:
+            data = self.chunks.get(digest)
+        except OSError as e:
+            log.warning("Leaf-node %s lost a kept chunk of '%s', downloading all of it: %s", self.node_id, file_name, e)
+            return None
+        if hashlib.sha256(data).hexdigest() != digest:
+            log.warning("Leaf-node %s has a damaged chunk of '%s', downloading all of it.", self.node_id, file_name)
+            return None
+        return data
+
+    # records a downloaded copy, registers it and asks for its invalidations
+    def add_copy(self, file_name, origin, version):
+        copy = File(file_name, self.node_id, valid = True, og=origin)
+        copy.is_copy()
+        copy.version = version
+        self.files.add(copy)
+        self.update_registration(added=[file_name])
+        if self.mode == 'pull':
+            self.ttr.add(file_name)
+        self.subscribe(file_name)
+
+    # downloads a file in chunks from several leaf nodes at once, running it again after a
+    # crash resumes from the chunk map left in this node's directory
+    def swarm_download(self, file_name, hits):
+        hits = [hit for hit in hits if hit["leaf_node"] != self.node_id]
+        holders = [hit["leaf_node"] for hit in hits]
+        log.info("Leaf-node %s swarm downloading '%s' from %s", self.node_id, file_name, ", ".join(holders))
+        start_time = time.time()
+        swarm = SwarmDownload(self, file_name, holders)
+        try:
+            size = swarm.run()
+        except ConnectionError as e:
+            log.info("Leaf-node %s could not swarm download '%s': %s", self.node_id, file_name, e)
+            self.metrics.incr("download_failures")
+            return False
+        duration = max(time.time() - start_time, 1e-6)
+        self.add_copy(file_name, hits[0].get("origin", holders[0]), swarm.version)
+
+        self.metrics.incr("downloads")
+        self.metrics.observe("download", duration)
+        log.info("Leaf-node %s successfully downloaded '%s' from %d leaf nodes.", self.node_id, file_name, len(holders))
+        log.info("Transfer of %d bytes took %.4f seconds (%.2f MB/s).", size, duration, size / duration / 1e6)
+        return True
 
-                self.file_names.append(file_name)
-                self.files[file_name] = File(file_name, self.node_id, valid = True, og=leaf_node_id)
-                self.files[file_name].is_copy()
+    # asks for invalidations of a file this node now holds a copy of
+    def subscribe(self, file_name, again=False):
+        message = {"type": "SUBSCRIBE", "file_name": file_name, "node_id": self.node_id,
+                   "origin_node": self.files[file_name].origin_node, "again": again}
+        self.pool.send(self.connected_super_peer_port, message)
 
-                print(f"Leaf-node {self.node_id} successfully downloaded '{file_name}' from Leaf-node {leaf_node_id}.")
+    # reads exactly size bytes into the file using one reusable buffer. the data goes to a
+    # temporary file that only replaces the real one once every byte has arrived. older
+    # nodes do not send a size, then everything up to the close is the file
+    def receive_file(self, s, file_path, size):
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * TRANSFER_BUFFER)
+        buffer = bytearray(TRANSFER_BUFFER if size is None else min(TRANSFER_BUFFER, max(size, 1)))
+        view = memoryview(buffer)
+        partial_path = file_path + ".part"
+        got = 0
+        try:
+            with open(partial_path, 'wb') as file:
+                if size and hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(file.fileno(), 0, size)
+                while size is None or got < size:
+                    count = s.recv_into(view, len(buffer) if size is None else min(len(buffer), size - got))
+                    if count == 0:
+                        break
+                    file.write(view[:count])
+                    got += count
+            if size is not None and got != size:
+                raise ConnectionError(f"Transfer ended after {got} of {size} bytes")
+            os.replace(partial_path, file_path)
+        except Exception:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        return got
 
-    # broadcasts invalidate message
+    # broadcasts invalidate message, after a short wait in case the same file is edited again
     def push(self, filename, version):
+        self.invalidations.add({"origin_server_id": self.node_id, "file_name": filename, "version_number": version})
+
+    def send_invalidations(self, entries):
         # message
         message = {
             "type": "INVALIDATION",
-            "msg_id": f"{self.node_id}_{filename}_{version}",
+            "msg_id": self.new_message_id("INV"),
             "origin_server_id": self.node_id,
-            "file_name": filename,
-            "version_number": version
+            "files": entries
         }
 
         # send message
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((HOST, self.connected_super_peer_port))
-            s.send(json.dumps(message).encode())
-        print(f"Leaf-node {self.node_id} pushed invalidation for {filename}.\n")
+        self.pool.send(self.connected_super_peer_port, message)
+        self.metrics.incr("invalidations_pushed", len(entries))
+        if log.isEnabledFor(logging.INFO):
+            names = ", ".join(f"{entry['file_name']} v{entry['version_number']}" for entry in entries)
+            log.info("Leaf-node %s pushed invalidation for %s.", self.node_id, names)
 
-    def poll_for_updates(self, ttr=30):
+    # sleeps until the scheduler says some copies are due, then checks all of them with a
+    # single PULL_BATCH
+    def poll_for_updates(self):
 
         while True:
-            time.sleep(ttr)
-            for filename, file_struct in self.files.items():
-                if file_struct.valid and file_struct.copy:
-                    pull_request = {
-                        "type": "PULL",
-                        "node_id": self.node_id,
-                        "file_name": filename,
-                        "cached_version": file_struct.version,
-                        "origin_node": file_struct.origin_node
-                    }
-                    try:
-                        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                            s.connect((HOST, self.connected_super_peer_port))
-                            s.send(json.dumps(pull_request).encode())
-                            response = json.loads(s.recv(1024).decode())
-                        if response["status"] == "STALE":
-                            print(f"File {filename} is stale. Invalidating locally.")
-                            self.handle_invallidation(response)
-                            reply = input("would you like to re-download the newest version?")
-                            if reply == 'yes':
-                                self.query_file(filename)
-                            else:
-                                continue
-                        elif response["status"] == "VALID":
-                            print(f"File {filename} is up-to-date. No action needed.")
-                    except Exception as e:
-                        print(f"Error polling for updates for file {filename}: {e}")
+            self.pull_updates(self.ttr.wait_due())
+
+    def pull_updates(self, file_names=None):
+        if file_names is None:
+            file_names = list(self.files)
+        copies = []
+        for filename in file_names:
+            file_struct = self.files.get(filename)
+            if file_struct and file_struct.valid and file_struct.copy:
+                copies.append({"file_name": filename, "cached_version": file_struct.version,
+                               "origin_node": file_struct.origin_node})
+        if not copies:
+            return
+        pull_request = {"type": "PULL_BATCH", "node_id": self.node_id, "files": copies}
+        self.ttr.polls += 1
+        try:
+            response = self.pool.request(self.connected_super_peer_port, pull_request)
+        except Exception as e:
+            log.warning("Error polling for updates: %s", e)
+            self.ttr.retry([c["file_name"] for c in copies])
+            return
+        for filename, status in response["status"].items():
+            if status == "STALE" and filename in self.files:
+                self.ttr.stale_found(filename)
+                if self.refresh:
+                    log.info("File %s is stale. Refreshing it.", filename)
+                    self.update_copy({"file_name": filename})
+                    if filename in self.files:
+                        self.ttr.add(filename)
+                    continue
+                log.info("File %s is stale. Invalidating locally.", filename)
+                self.handle_invallidation({"file_name": filename})
+                if self.interactive:
+                    reply = input("would you like to re-download the newest version?")
+                else:
+                    reply = 'yes' if self.redownload else 'no'
+                if reply == 'yes':
+                    self.query_file(filename)
+            elif status == "VALID":
+                self.ttr.valid(filename, response.get("leases", {}).get(filename, 0))
+                log.debug("File %s is up-to-date. No action needed.", filename)
 
 
     # function to allow usser to edit file
     def edit_file(self, name, input):
-        if name in self.file_names:
+        if name in self.files:
             file = self.files[name]
 
             # check if file can be edited 
             # no if it is a copy and no if it is invalid
             if file.copy == True:
-                print("You can not edit this file, it is not a master copy.\n")
+                log.warning("You can not edit this file, it is not a master copy.")
                 return
             if file.valid == False:
-                print("You cannot edit this file, it is invalid.\n")
+                log.warning("You cannot edit this file, it is invalid.")
                 return
             
-            print(f"Editing file: {name}")
+            log.debug("Editing file: %s", name)
             file_path = os.path.join(self.directory, name)
             try:
-                with open(file_path, "a") as f:
-                    f.write(f"\n{str(input)}")
-                
+                text = f"\n{str(input)}"
+                with open(file_path, "ab") as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    f.write(text.encode())
+
+                # remembered before the version goes up, so a delta never misses this edit
+                self.history.record(name, file.version + 1, offset, text)
                 # Update file version number
                 file.increment_version()
                 
-                print(f"File {name} has been updated. Version is now {file.version}.\n")
-                # broadcast change to rest of network (PUSH Method)
-                if self.mode == 'push':
+                log.info("File %s has been updated. Version is now %s.", name, file.version)
+                # our super peer puts the version in QueryHits for the file, in either mode
+                self.update_registration(changed=[name])
+                # broadcast change to rest of network (PUSH Method). in pull mode copies
+                # still under a lease were promised to stay valid, so they are told too
+                if self.mode == 'push' or self.leases.get(name, 0) > time.time():
                     self.push(file.name, file.version)
             
             except Exception as e:
-                print(f"An error occurred while editing the file: {e}")
-                traceback.print_exc()
+                log.error("An error occurred while editing the file: %s", e, exc_info=True)
 
 
         # file is not in node        
         else:
-            print(f"File {name} does not exist in this node.\n")
+            log.warning("File %s does not exist in this node.", name)
 
 
 #
@@ -300,7 +989,7 @@ class LeafNode:
 if __name__ == "__main__":
     
     if len(sys.argv) < 5:
-        print("Usage: python leaf_node.py <node_id> <super_peer_port> <node_port> <file1> [file2 ...] --mode=<push/pull>")
+        print("Usage: python leaf_node.py <node_id> <super_peer_port> <node_port> <file1> [file2 ...] --mode=<push/pull> [--engine=<thread/asyncio>] [--codec=<json/binary>] [--lease=<seconds>] [--flush=<seconds>] [--batch=<n>] [--log=<debug/info/warning>] [--metrics=<stats file>] [--refresh=<yes/no>] [--headless=<yes/no>] [--super-peer=<name>] [--uploads=<n>]")
         sys.exit(1)
     
     # Parse mode
@@ -316,11 +1005,97 @@ if __name__ == "__main__":
         print("Invalid mode. Defaulting to pull.")
         mode = "push"
 
+    # Parse server engine
+    engine_arg = [arg for arg in sys.argv if arg.startswith("--engine=")]
+    if engine_arg:
+        engine = engine_arg[0].split("=")[1].lower()
+        sys.argv.remove(engine_arg[0])
+    else:
+        engine = "thread"  # Default engine
+
+    if engine not in ["thread", "asyncio"]:
+        print("Invalid engine. Defaulting to thread.")
+        engine = "thread"
+
+    # Parse wire encoding
+    codec_arg = [arg for arg in sys.argv if arg.startswith("--codec=")]
+    if codec_arg:
+        codec = codec_arg[0].split("=")[1].lower()
+        sys.argv.remove(codec_arg[0])
+    else:
+        codec = "json"  # Default encoding
+
+    if codec not in ["json", "binary"]:
+        print("Invalid codec. Defaulting to json.")
+        codec = "json"
+
+    # Parse lease offered to pollers of this node's files
+    lease_arg = [arg for arg in sys.argv if arg.startswith("--lease=")]
+    if lease_arg:
+        lease = float(lease_arg[0].split("=")[1])
+        sys.argv.remove(lease_arg[0])
+    else:
+        lease = 0  # Default no lease
+
+    # Parse invalidation batching, how long edits wait to be sent together and how many at most
+    flush_arg = [arg for arg in sys.argv if arg.startswith("--flush=")]
+    flush = None
+    if flush_arg:
+        flush = float(flush_arg[0].split("=")[1])
+        sys.argv.remove(flush_arg[0])
+    batch_arg = [arg for arg in sys.argv if arg.startswith("--batch=")]
+    batch = None
+    if batch_arg:
+        batch = int(batch_arg[0].split("=")[1])
+        sys.argv.remove(batch_arg[0])
+
+    # Parse log level and the file the stats are written to every few seconds
+    log_arg = [arg for arg in sys.argv if arg.startswith("--log=")]
+    level = "info"
+    if log_arg:
+        level = log_arg[0].split("=")[1].lower()
+        sys.argv.remove(log_arg[0])
+    configure_logging(level)
+    metrics_arg = [arg for arg in sys.argv if arg.startswith("--metrics=")]
+    metrics_path = None
+    if metrics_arg:
+        metrics_path = metrics_arg[0].split("=", 1)[1]
+        sys.argv.remove(metrics_arg[0])
+
+    # Parse whether out of date copies are refreshed in place
+    refresh_arg = [arg for arg in sys.argv if arg.startswith("--refresh=")]
+    refresh = False
+    if refresh_arg:
+        refresh = refresh_arg[0].split("=")[1].lower() in ("yes", "true", "1")
+        sys.argv.remove(refresh_arg[0])
+
+    # Parse headless, no command prompt and sources picked by the selection policy. used by
+    # launcher.py, which starts every leaf as its own process
+    headless_arg = [arg for arg in sys.argv if arg.startswith("--headless=")]
+    headless = False
+    if headless_arg:
+        headless = headless_arg[0].split("=")[1].lower() in ("yes", "true", "1")
+        sys.argv.remove(headless_arg[0])
+
+    # Parse the name of the super peer, needed when its port does not follow 70xx
+    super_peer_arg = [arg for arg in sys.argv if arg.startswith("--super-peer=")]
+    super_peer_name = None
+    if super_peer_arg:
+        super_peer_name = super_peer_arg[0].split("=")[1]
+        sys.argv.remove(super_peer_arg[0])
+
+    # Parse how many transfers this node serves at once, 0 for no limit
+    uploads_arg = [arg for arg in sys.argv if arg.startswith("--uploads=")]
+    upload_limit = UPLOAD_LIMIT
+    if uploads_arg:
+        upload_limit = int(uploads_arg[0].split("=")[1])
+        sys.argv.remove(uploads_arg[0])
+
     # Parse remaining arguments
     node_id, connected_super_peer_port, port, *files = sys.argv[1:]
     file_in_node = {f: File(f, node_id, True, node_id) for f in files}
 
-    sp_name = "SP" + str(int(str(connected_super_peer_port)[2:]))
+    sp_name = super_peer_name or "SP" + str(int(str(connected_super_peer_port)[2:]))
     
     # Initialize the leaf node with the chosen mode
     leaf_node = LeafNode(
@@ -330,18 +1105,50 @@ if __name__ == "__main__":
         file_in_node,
         files,
         int(port),
-        mode
+        mode,
+        engine,
+        codec,
+        lease,
+        interactive=not headless,
+        upload_limit=upload_limit
     )
-    sp_name = "SP" + str(int(str(connected_super_peer_port)[2:]))
-    # leaf_node = LeafNode(node_id, int(connected_super_peer_port), sp_name, file_in_node, files, int(port), mode)
-    leaf_node.register_files()
+    if flush is not None:
+        leaf_node.invalidations.interval = flush
+    if batch is not None:
+        leaf_node.invalidations.max_batch = batch
+    leaf_node.refresh = refresh
+    if metrics_path:
+        leaf_node.metrics.start_dump(metrics_path, leaf_node.stats)
+    # invalidations still waiting in the batch go out before the process ends
+    def stop(signum, frame):
+        leaf_node.invalidations.send_pending()
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    if not leaf_node.ready.wait(10):
+        log.error("Leaf-node %s could not start its server on port %s.", node_id, port)
+        os._exit(1)
+    # super peers started on their own only know our files from the config, the dht owners
+    # of their names have to hear about them from us
+    leaf_node.register_files(republish=True)
+    if headless:
+        signal.signal(signal.SIGINT, stop)
+        # the launcher waits for this line before it reports the network as started
+        print(f"READY {node_id} {port}", flush=True)
+        while True:
+            signal.pause()
     while True:
-        command = input("Enter a command (query [filename], edit [filename] [text], or exit): ")
+        command = input("Enter a command (query [filename], swarm [filename], edit [filename] [text], stats, or exit): ")
         if command.startswith("query"):
             _, file_name = command.split()
             leaf_node.query_file(file_name)
+        elif command.startswith("swarm"):
+            _, file_name = command.split()
+            leaf_node.query_file(file_name, swarm=True)
         elif command.startswith("edit"):
             _, file_name, text = command.split()
             leaf_node.edit_file(file_name, text)
+        elif command == "stats":
+            print(json.dumps(leaf_node.stats(), indent=2))
         elif command == "exit":
             break
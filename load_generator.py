@@ -0,0 +1,207 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# load_generator.py starts the super peers and every leaf node of a config file in one
+# process, with the leaves headless, and replays a workload of queries and edits at a target
+# rate. files are picked with a zipf distribution so a few popular files get most of the
+# traffic. the leaf directories are put back the way they were when it is done, copies it
+# downloaded are removed and files it edited or overwrote get their old contents back
+#
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from network_setup import setup_network, load_config, parse_flags
+from invalidation_batcher import FLUSH_INTERVAL, MAX_BATCH
+from leaf_node import LeafNode
+from file import File
+from selection import POLICIES
+from metrics import configure_logging
+
+DEFAULTS = {"mode": "push", "engine": "thread", "codec": "json", "lookup": "flood",
+            "rate": 20.0, "duration": 30.0, "zipf": 1.0, "edit-ratio": 0.1,
+            "policy": "least_loaded", "workers": 32, "seed": None, "log": "warning", "metrics": "",
+            "sp-flush": FLUSH_INTERVAL, "sp-batch": MAX_BATCH}
+READY_TIMEOUT = 10  # seconds a leaf has to start listening
+
+#
+# picks items by rank, the item at rank k is chosen with weight 1 / k^s
+#
+class ZipfSampler:
+    def __init__(self, items, s, rng):
+        self.items = list(items)
+        self.rng = rng
+        total = 0.0
+        self.cum_weights = []
+        for rank in range(1, len(self.items) + 1):
+            total += 1.0 / rank ** s
+            self.cum_weights.append(total)
+
+    def sample(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+# starts a headless leaf node for every leaf in the config and registers its files
+def start_leaves(config, mode, engine='thread', codec='json', policy='first', metrics_dir=None):
+    ports = {sp["peer_id"]: sp["port"] for sp in config["super_peers"]}
+    leaves = {}
+    for ln_config in config["leaf_nodes"]:
+        node_id = ln_config["node_id"]
+        sp_name = ln_config["connected_super_peer"]
+        files = list(ln_config["files"])
+        leaf = LeafNode(node_id, ports[sp_name], sp_name,
+                        {f: File(f, node_id, True, node_id) for f in files}, files,
+                        ln_config["port"], mode, engine, codec,
+                        interactive=False, policy=policy)
+        leaves[node_id] = leaf
+        if metrics_dir:
+            leaf.metrics.start_dump(os.path.join(metrics_dir, f"{node_id}.json"), leaf.stats)
+    # a leaf registers only once its server is listening, hits for it must be answerable
+    for node_id, leaf in leaves.items():
+        if not leaf.ready.wait(READY_TIMEOUT):
+            raise RuntimeError(f"Leaf-node {node_id} did not start within {READY_TIMEOUT} seconds")
+    for leaf in leaves.values():
+        leaf.register_files()
+    return leaves
+
+#
+# Load generator class, replays one workload against a set of headless leaf nodes
+#
+class LoadGenerator:
+    def __init__(self, leaves, zipf=1.0, edit_ratio=0.1, policy='first', seed=None):
+        self.leaves = leaves
+        self.edit_ratio = edit_ratio
+        self.policy = policy
+        self.rng = random.Random(seed)
+        self.owners = {f: leaf.node_id for leaf in leaves.values() for f in leaf.files.names()}
+        catalog = sorted(self.owners)
+        self.rng.shuffle(catalog)  # popularity rank has nothing to do with the file name
+        self.sampler = ZipfSampler(catalog, zipf, self.rng)
+        self.busy = set()  # (leaf_id, file_name) downloads in progress
+        self.lock = threading.Lock()
+
+    # replays the workload open loop, operation i is started at i / rate seconds whether or
+    # not the earlier ones have finished, so a slow network shows up as latency instead of a
+    # lower rate. returns one record per operation and the seconds it took
+    def run(self, rate=20.0, duration=30.0, workers=32):
+        futures = []
+        begin = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for i in range(int(rate * duration)):
+                scheduled = begin + i / rate
+                delay = scheduled - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                file_name = self.sampler.sample()
+                if self.rng.random() < self.edit_ratio:
+                    op, leaf_id = "edit", self.owners[file_name]
+                else:
+                    # the query comes from a random leaf that does not have the file yet
+                    askers = [l for l in sorted(self.leaves) if file_name not in self.leaves[l].files]
+                    op, leaf_id = "query", self.rng.choice(askers or sorted(self.leaves))
+                futures.append(pool.submit(self.operation, op, leaf_id, file_name, scheduled))
+        return [f.result() for f in futures], time.time() - begin
+
+    # one query or edit, returns a record of what happened and how long it took
+    def operation(self, op, leaf_id, file_name, scheduled):
+        start = time.time()
+        record = {"op": op, "leaf": leaf_id, "file": file_name, "scheduled": scheduled, "start": start,
+                  "lag": start - scheduled, "ok": False, "source": None}
+        leaf = self.leaves[leaf_id]
+        try:
+            if op == "edit":
+                leaf.edit_file(file_name, f"load generator edit at {start:.3f}")
+                record["ok"] = True
+            else:
+                with self.lock:
+                    skip = file_name in leaf.files or (leaf_id, file_name) in self.busy
+                    if not skip:
+                        self.busy.add((leaf_id, file_name))
+                if skip:
+                    record["op"] = "local"
+                else:
+                    try:
+                        record["source"] = leaf.download(file_name, self.policy)
+                        record["ok"] = record["source"] is not None
+                    finally:
+                        with self.lock:
+                            self.busy.discard((leaf_id, file_name))
+        except Exception as e:
+            record["error"] = str(e)
+        record["latency"] = time.time() - start
+        return record
+
+# contents of every file in the leaf directories before the run, directories (the chunk
+# store) are only remembered so one the run created can be removed again
+def snapshot_directories(leaves):
+    saved = {}
+    for leaf in leaves.values():
+        for file_name in os.listdir(leaf.directory):
+            path = os.path.join(leaf.directory, file_name)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    saved[path] = f.read()
+            elif os.path.isdir(path):
+                saved[path] = None
+    return saved
+
+# removes what the run added and rewrites what it changed, so the next run starts the same
+def restore_directories(leaves, saved):
+    for leaf in leaves.values():
+        for file_name in os.listdir(leaf.directory):
+            path = os.path.join(leaf.directory, file_name)
+            if path in saved:
+                continue
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+    for path, data in saved.items():
+        if data is not None:
+            with open(path, "wb") as f:
+                f.write(data)
+
+def summarize(records, elapsed):
+    print(f"\n{len(records)} operations in {elapsed:.2f} seconds ({len(records) / elapsed:.2f} per second)")
+    for op in ("query", "edit", "local"):
+        done = [r for r in records if r["op"] == op]
+        if not done:
+            continue
+        ok = [r for r in done if r["ok"]]
+        mean = sum(r["latency"] for r in done) / len(done)
+        print(f"  {op}: {len(done)} sent, {len(ok)} succeeded, mean latency {mean * 1000:.1f} ms")
+    lag = max(r["lag"] for r in records) if records else 0
+    print(f"  most an operation started behind schedule: {lag * 1000:.1f} ms")
+
+#
+# main
+#
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python load_generator.py <all_to_all.json/linear.json> [--mode=push/pull] [--engine=thread/asyncio] "
+              "[--codec=json/binary] [--lookup=flood/dht] [--rate=ops per second] [--duration=seconds] [--zipf=s] "
+              f"[--edit-ratio=0..1] [--policy={'/'.join(POLICIES)}] [--workers=n] [--seed=n] "
+              "[--sp-flush=seconds] [--sp-batch=n] [--log=debug/info/warning] [--metrics=stats directory]")
+        sys.exit(1)
+
+    config_file = sys.argv[1]
+    options = parse_flags(sys.argv[2:], DEFAULTS)
+    config = load_config(config_file)
+    configure_logging(options["log"])
+    metrics_dir = options["metrics"] or None
+
+    setup_network(config_file, options["mode"], options["engine"], options["codec"], options["lookup"], metrics_dir,
+                  options["sp-flush"], options["sp-batch"])
+    leaves = start_leaves(config, options["mode"], options["engine"], options["codec"], options["policy"], metrics_dir)
+    saved = snapshot_directories(leaves)
+    try:
+        generator = LoadGenerator(leaves, options["zipf"], options["edit-ratio"], options["policy"], options["seed"])
+        records, elapsed = generator.run(options["rate"], options["duration"], options["workers"])
+        summarize(records, elapsed)
+    finally:
+        restore_directories(leaves, saved)
+    # server threads never return, leave without waiting for them
+    os._exit(0)
@@ -0,0 +1,94 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# message_log.py is the duplicate filter super peers keep for queries, invalidations and
+# cleanups. ids go into a dict for lookups and a ring buffer in arrival order, the oldest
+# ones fall off once the log is full or they are older than max_age, so a long running
+# super peer uses the same memory no matter how many messages it has seen
+#
+import sys
+import threading
+import time
+from collections import deque
+
+LOG_SIZE = 100000  # most message ids remembered at once
+LOG_AGE = 300  # seconds after which a message id is forgotten
+
+#
+# Message log class, dict of {msg_id: (arrived_at, value)} plus a deque of (arrived_at, msg_id)
+#
+class MessageLog:
+    def __init__(self, max_entries=LOG_SIZE, max_age=LOG_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries = {}
+        self.order = deque()
+        self.lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    # records a message id, returns False if it was already in the log
+    def add(self, msg_id, value=True):
+        with self.lock:
+            self.trim()
+            if msg_id in self.entries:
+                return False
+            now = time.time()
+            self.entries[msg_id] = (now, value)
+            self.order.append((now, msg_id))
+            return True
+
+    def __setitem__(self, msg_id, value):
+        with self.lock:
+            self.trim()
+            now = time.time()
+            self.entries[msg_id] = (now, value)
+            self.order.append((now, msg_id))
+
+    def __contains__(self, msg_id):
+        entry = self.entries.get(msg_id)
+        return entry is not None and time.time() - entry[0] <= self.max_age
+
+    def __getitem__(self, msg_id):
+        if msg_id not in self:
+            raise KeyError(msg_id)
+        return self.entries[msg_id][1]
+
+    def get(self, msg_id, default=None):
+        return self[msg_id] if msg_id in self else default
+
+    def __delitem__(self, msg_id):
+        with self.lock:
+            del self.entries[msg_id]
+
+    def __len__(self):
+        return len(self.entries)
+
+    # drops ids that are too old, and makes room for one more once the log is full
+    def trim(self):
+        now = time.time()
+        while self.order:
+            arrived, msg_id = self.order[0]
+            if now - arrived > self.max_age:
+                self.expired += 1
+            elif len(self.order) >= self.max_entries:
+                self.evicted += 1
+            else:
+                break
+            self.order.popleft()
+            # the id may have been deleted or logged again since, only drop this copy
+            entry = self.entries.get(msg_id)
+            if entry is not None and entry[0] == arrived:
+                del self.entries[msg_id]
+
+    # rough memory use of the log in bytes, the containers plus the ids they hold
+    def memory(self):
+        with self.lock:
+            size = sys.getsizeof(self.entries) + sys.getsizeof(self.order)
+            size += sum(sys.getsizeof(msg_id) for msg_id in self.entries)
+        return size
+
+    def stats(self):
+        return {"entries": len(self.entries), "expired": self.expired, "evicted": self.evicted,
+                "bytes": self.memory()}
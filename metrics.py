@@ -0,0 +1,250 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# metrics.py keeps counters, latency histograms and gauges for one super peer or leaf node,
+# along with the bytes it read and wrote and the hop path of recent queries. a node answers
+# a STATS message with everything collected so far and can also write it to a json file
+# every few seconds. run on its own it asks a running node for its stats:
+#   python metrics.py <port>
+#
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from protocol import send_message, recv_message
+
+# upper bounds of the latency buckets in milliseconds, anything slower lands in one more
+BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+TRACE_LIMIT = 256  # recent query traces kept per node
+DUMP_INTERVAL = 10  # seconds between writes of the stats file
+
+# one line per record, nodes log through logging.getLogger(<module name>) so a message
+# below the configured level costs a level check instead of a formatted print
+def configure_logging(level="info"):
+    logging.basicConfig(level=getattr(logging, level.upper(), logging.INFO), format="%(message)s")
+
+#
+# fixed bucket latency histogram, percentiles are read off the bucket bounds
+#
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    # upper bound of the bucket holding the p-th percentile, the slowest bucket reports max
+    def percentile(self, p):
+        rank = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return 0.0
+
+    def stats(self):
+        return {"count": self.count, "mean_ms": self.total / self.count if self.count else 0.0,
+                "p50_ms": self.percentile(50), "p90_ms": self.percentile(90),
+                "p99_ms": self.percentile(99), "max_ms": self.max,
+                "buckets": {str(bound): n for bound, n in zip(self.buckets + ["inf"], self.counts) if n}}
+
+#
+# Metrics class, everything one node counts about itself
+#
+class Metrics:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.counters = Counter()
+        self.latency = {}  # {message type: Histogram} of time spent handling each request
+        self.gauges = {}  # {name: function returning the current value}
+        self.connections = 0  # accepted connections open right now
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.traces = OrderedDict()  # {trace_id: record} of the newest queries
+        self.lock = threading.Lock()
+        self.gauge("threads", threading.active_count)
+
+    def incr(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def observe(self, message_type, seconds):
+        with self.lock:
+            histogram = self.latency.get(message_type)
+            if histogram is None:
+                histogram = self.latency[message_type] = Histogram()
+            histogram.observe(seconds * 1000)
+
+    # calls func and records how long it took under the message type
+    def measure(self, message_type, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.observe(message_type, time.perf_counter() - start)
+
+    # same as measure for code that cannot be wrapped in a function call, like an await
+    @contextmanager
+    def timed(self, message_type):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(message_type, time.perf_counter() - start)
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def connected(self, delta):
+        with self.lock:
+            self.connections += delta
+
+    def received(self, n):
+        with self.lock:
+            self.bytes_in += n
+
+    def sent(self, n):
+        with self.lock:
+            self.bytes_out += n
+
+    # records or extends what this node saw of one query, the oldest traces are dropped
+    def trace(self, trace_id, **record):
+        with self.lock:
+            entry = self.traces.pop(trace_id, None) or {"trace_id": trace_id, "time": time.time()}
+            entry.update(record)
+            self.traces[trace_id] = entry
+            while len(self.traces) > TRACE_LIMIT:
+                self.traces.popitem(last=False)
+
+    def stats(self):
+        gauges = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception as e:
+                gauges[name] = f"error: {e}"
+        with self.lock:
+            return {"node": self.name, "uptime": time.time() - self.started,
+                    "counters": dict(self.counters),
+                    "latency": {t: h.stats() for t, h in self.latency.items()},
+                    "gauges": dict(gauges, connections=self.connections),
+                    "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+                    "traces": list(self.traces.values())}
+
+    # writes the stats to a temporary file first so a reader never sees half of it. nodes
+    # pass their own stats function, which adds what their other parts count
+    def dump(self, path, read=None):
+        stats = (read or self.stats)()
+        partial_path = path + ".tmp"
+        with open(partial_path, "w") as f:
+            json.dump(stats, f, indent=2, default=str)
+        os.replace(partial_path, path)
+
+    # dumps the stats every interval seconds for as long as the process runs
+    def start_dump(self, path, read=None, interval=DUMP_INTERVAL):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dump(path, read)
+                except OSError as e:
+                    logging.getLogger("metrics").warning("Could not write stats for %s to %s: %s", self.name, path, e)
+        threading.Thread(target=run, daemon=True).start()
+
+#
+# socket wrapper that counts the bytes through an accepted or outgoing socket
+#
+class MeteredSocket:
+    def __init__(self, sock, metrics):
+        self.sock = sock
+        self.metrics = metrics
+
+    def recv(self, n, *args):
+        data = self.sock.recv(n, *args)
+        self.metrics.received(len(data))
+        return data
+
+    def recv_into(self, buffer, n=0, *args):
+        count = self.sock.recv_into(buffer, n, *args)
+        self.metrics.received(count)
+        return count
+
+    def send(self, data, *args):
+        count = self.sock.send(data, *args)
+        self.metrics.sent(count)
+        return count
+
+    def sendall(self, data, *args):
+        self.sock.sendall(data, *args)
+        self.metrics.sent(len(data))
+
+    def sendfile(self, file, offset=0, count=None):
+        sent = self.sock.sendfile(file, offset, count)
+        self.metrics.sent(sent)
+        return sent
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+# asyncio stream wrappers doing the same for the asyncio engine
+class MeteredReader:
+    def __init__(self, reader, metrics):
+        self.reader = reader
+        self.metrics = metrics
+
+    async def read(self, n=-1):
+        data = await self.reader.read(n)
+        self.metrics.received(len(data))
+        return data
+
+    async def readexactly(self, n):
+        data = await self.reader.readexactly(n)
+        self.metrics.received(n)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.reader, name)
+
+class MeteredWriter:
+    def __init__(self, writer, metrics):
+        self.writer = writer
+        self.metrics = metrics
+
+    def write(self, data):
+        self.writer.write(data)
+        self.metrics.sent(len(data))
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+# asks the node listening on port for its stats
+def request_stats(port, host='localhost'):
+    with socket.create_connection((host, port)) as s:
+        send_message(s, {"type": "STATS", "req_id": 1})
+        reply, _ = recv_message(s)
+    return reply["reply"]
+
+#
+# main
+#
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python metrics.py <node_port>")
+        sys.exit(1)
+    print(json.dumps(request_stats(int(sys.argv[1])), indent=2))
@@ -6,16 +6,75 @@
 # using a config.json file. must be run before any testing.
 #
 import json
-from super_peer import SuperPeer
-from leaf_node import LeafNode
-from file import File
+import os
+from super_peer import SuperPeer, RemotePeer
+from invalidation_batcher import FLUSH_INTERVAL, MAX_BATCH
+from metrics import configure_logging
 
 def load_config(config_file):
     with open(config_file, 'r') as f:
         return json.load(f)
 
+# --name=value flags of the command line tools, anything not given keeps its default
+def parse_flags(args, defaults):
+    options = dict(defaults)
+    for arg in args:
+        name, _, value = arg[2:].partition("=")
+        if name not in options:
+            raise ValueError(f"Unknown option --{name}")
+        default = defaults[name]
+        options[name] = type(default)(value) if default is not None else int(value)
+    return options
+
+# {leaf_id: super peer id} for every leaf in the config, subscriptions to a copy go to the
+# super peer of the file's origin
+def leaf_homes(config):
+    return {ln_config["node_id"]: ln_config["connected_super_peer"] for ln_config in config["leaf_nodes"]}
+
+# creates one super peer of the config with its neighbors, topology and the files of its
+# own leaves. neighbors are reached over sockets, so they may be in this process or in
+# another one started by launcher.py. every super peer works out the same spanning trees,
+# hash ring and leaf homes, a simulation of many peers in one process passes one of each
+# for all of them. flush and batch are how long invalidations wait to be sent together and
+# how many files go in one message at most
+def start_super_peer(config, peer_id, mode, engine='thread', codec='json', lookup='flood', tree=None, ring=None, homes=None,
+                     flush=FLUSH_INTERVAL, batch=MAX_BATCH):
+    ports = {sp_config["peer_id"]: sp_config["port"] for sp_config in config["super_peers"]}
+    sp_config = next(sp_config for sp_config in config["super_peers"] if sp_config["peer_id"] == peer_id)
+    super_peer = SuperPeer(peer_id, sp_config["port"], mode, engine, codec, lookup)
+    super_peer.leaf_nodes = sp_config["leaf_nodes"]
+    super_peer.invalidations.interval = flush
+    super_peer.invalidations.max_batch = batch
+
+    # Set up neighbor relationships for SuperPeers
+    for neighbor_id in sp_config["neighbors"]:
+        if neighbor_id in ports:
+            super_peer.neighbor_peers.append(RemotePeer(neighbor_id, ports[neighbor_id]))
+
+    # invalidations travel down a spanning tree, every super peer builds the same trees
+    if tree is None:
+        super_peer.set_topology({sp_config["peer_id"]: sp_config["neighbors"] for sp_config in config["super_peers"]})
+    else:
+        super_peer.tree = tree
+    super_peer.leaf_homes = leaf_homes(config) if homes is None else homes
+
+    # dht mode, every super peer gets the full list so it can find the owner of any file name
+    if lookup == 'dht' and ring is None:
+        super_peer.join_ring(ports)
+    elif lookup == 'dht':
+        super_peer.peer_ports, super_peer.ring = ports, ring
+
+    # Register each file with the connected super-peer
+    for ln_config in config["leaf_nodes"]:
+        if ln_config["connected_super_peer"] == peer_id:
+            for file in ln_config["files"]:
+                super_peer.registered_files.setdefault(file, set()).add(ln_config["node_id"])
+                super_peer.leaf_files.setdefault(ln_config["node_id"], set()).add(file)
+    return super_peer
+
 # setup network creates super peers with connected leaf nodes and registered files
-def setup_network(config_file, mode):
+def setup_network(config_file, mode, engine='thread', codec='json', lookup='flood', metrics_dir=None,
+                  flush=FLUSH_INTERVAL, batch=MAX_BATCH):
     if config_file == 'linear.json':
         print('Starting network with a Linear Topology\n')
     else:
@@ -27,31 +86,23 @@ def setup_network(config_file, mode):
     # Initialize SuperPeers
     for sp_config in config["super_peers"]:
         peer_id = sp_config["peer_id"]
-        port = sp_config["port"]
-        leafs = sp_config["leaf_nodes"]
-        super_peers[peer_id] = SuperPeer(peer_id, port, mode)
-        super_peers[peer_id].leaf_nodes = leafs
-
-    # Set up neighbor relationships for SuperPeers
-    for sp_config in config["super_peers"]:
-        peer_id = sp_config["peer_id"]
-        neighbors = sp_config["neighbors"]
-        for neighbor_id in neighbors:
-            if neighbor_id in super_peers:
-                super_peers[peer_id].neighbor_peers.append(super_peers[neighbor_id])
-
-    for ln_config in config["leaf_nodes"]:
-        leaf_id = ln_config["node_id"]
-        connected_sp_id = ln_config["connected_super_peer"]
-
-        files = ln_config["files"]
+        super_peers[peer_id] = start_super_peer(config, peer_id, mode, engine, codec, lookup, flush=flush, batch=batch)
 
+    # every super peer writes its stats to <metrics_dir>/<peer_id>.json every few seconds
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for sp in super_peers.values():
+            sp.metrics.start_dump(os.path.join(metrics_dir, f"{sp.peer_id}.json"), sp.stats)
 
-        # Register each file with the connected super-peer
-        if connected_sp_id in super_peers:
-            for file in files:
-                # print(f'file: {file}')
-                super_peers[connected_sp_id].registered_files[file] = leaf_id
+    # dht mode, the owner of each file name learns which leaf has it
+    if lookup == 'dht':
+        for ln_config in config["leaf_nodes"]:
+            leaf_id = ln_config["node_id"]
+            connected_sp_id = ln_config["connected_super_peer"]
+            if connected_sp_id in super_peers:
+                for file in ln_config["files"]:
+                    owner = super_peers[connected_sp_id].ring.owner(file)
+                    super_peers[owner].file_index.setdefault(file, {})[leaf_id] = connected_sp_id
  
     print("Network initialized with super-peers and leaf nodes.")
     # print(f'super peers: {super_peers}')
@@ -59,8 +110,14 @@ def setup_network(config_file, mode):
 
 # main
 if __name__ == "__main__":
+    configure_logging("info")
     config = input('Input either "all_to_all.json" or "linear.json": ')
     # config = 'linear.json'
     mode = input('Input mode: push or pull: ')
-    super_peers, leaf_nodes = setup_network(config, mode)
-    print("Run each leaf node in a separate terminal to initiate queries.")
+    engine = input('Input server engine: thread or asyncio (default thread): ') or 'thread'
+    lookup = input('Input lookup: flood or dht (default flood): ') or 'flood'
+    metrics_dir = input('Input directory for stats files (default none): ') or None
+    flush = float(input(f'Input seconds invalidations wait to be batched (default {FLUSH_INTERVAL}): ') or FLUSH_INTERVAL)
+    batch = int(input(f'Input most files in one invalidation batch (default {MAX_BATCH}): ') or MAX_BATCH)
+    super_peers, leaf_nodes = setup_network(config, mode, engine, lookup=lookup, metrics_dir=metrics_dir, flush=flush, batch=batch)
+    print("Run each leaf node in a separate terminal to initiate queries, or start the whole network with launcher.py.")
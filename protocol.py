@@ -0,0 +1,216 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# protocol.py is the framing layer shared by super peers and leaf nodes. every message is
+# sent as a 6 byte header (magic, codec, payload length) followed by the payload, so the
+# receiver knows exactly how many bytes to wait for instead of hoping one recv(1024) is enough.
+# the payload is either json or a compact struct packed binary encoding, picked by the sender
+# and mirrored by the receiver for its reply. unframed json from older nodes is still accepted
+#
+import json
+import struct
+import threading
+
+MAGIC = 0xB5
+HEADER = struct.Struct('!BBI')  # magic, codec, payload length
+MAX_MESSAGE = 64 * 1024 * 1024
+
+# codecs, LEGACY means a raw json message with no header
+LEGACY = 0
+JSON = 1
+BINARY = 2
+CODECS = {"legacy": LEGACY, "json": JSON, "binary": BINARY}
+
+_decoder = json.JSONDecoder()
+
+#
+# compact binary encoding, one type tag byte per value
+#
+_INT = struct.Struct('!q')
+_FLOAT = struct.Struct('!d')
+_LEN = struct.Struct('!I')
+
+def _pack(value, out):
+    if value is None:
+        out.append(b'N')
+    elif value is True:
+        out.append(b'T')
+    elif value is False:
+        out.append(b'F')
+    elif isinstance(value, int):
+        out.append(b'i')
+        out.append(_INT.pack(value))
+    elif isinstance(value, float):
+        out.append(b'd')
+        out.append(_FLOAT.pack(value))
+    elif isinstance(value, str):
+        data = value.encode()
+        out.append(b's')
+        out.append(_LEN.pack(len(data)))
+        out.append(data)
+    elif isinstance(value, (list, tuple)):
+        out.append(b'l')
+        out.append(_LEN.pack(len(value)))
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        out.append(b'm')
+        out.append(_LEN.pack(len(value)))
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} in binary message")
+
+def _unpack(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag == 0x4E:  # N
+        return None, pos
+    if tag == 0x54:  # T
+        return True, pos
+    if tag == 0x46:  # F
+        return False, pos
+    if tag == 0x69:  # i
+        return _INT.unpack_from(data, pos)[0], pos + 8
+    if tag == 0x64:  # d
+        return _FLOAT.unpack_from(data, pos)[0], pos + 8
+    if tag == 0x73:  # s
+        length = _LEN.unpack_from(data, pos)[0]
+        pos += 4
+        return str(data[pos:pos + length], 'utf-8'), pos + length
+    if tag == 0x6C:  # l
+        count = _LEN.unpack_from(data, pos)[0]
+        pos += 4
+        items = []
+        for _ in range(count):
+            item, pos = _unpack(data, pos)
+            items.append(item)
+        return items, pos
+    if tag == 0x6D:  # m
+        count = _LEN.unpack_from(data, pos)[0]
+        pos += 4
+        items = {}
+        for _ in range(count):
+            key, pos = _unpack(data, pos)
+            items[key], pos = _unpack(data, pos)
+        return items, pos
+    raise ValueError(f"Unknown type tag {tag} in binary message")
+
+def dumps_binary(message):
+    out = []
+    _pack(message, out)
+    return b''.join(out)
+
+def loads_binary(data):
+    message, _ = _unpack(memoryview(data), 0)
+    return message
+
+#
+# framing
+#
+def encode(message, codec=JSON):
+    if codec == LEGACY:
+        return json.dumps(message).encode()
+    if codec == BINARY:
+        payload = dumps_binary(message)
+    else:
+        payload = json.dumps(message, separators=(',', ':')).encode()
+    return HEADER.pack(MAGIC, codec, len(payload)) + payload
+
+def decode(payload, codec):
+    if codec == BINARY:
+        return loads_binary(payload)
+    return json.loads(payload)
+
+# pooled connections tag requests with a req_id, echo it so the reply finds its way back.
+# more=True marks one of several replies streamed back for the same request
+def wrap_reply(request, response, more=False):
+    if isinstance(request, dict) and "req_id" in request:
+        if more:
+            return {"req_id": request["req_id"], "reply": response, "more": True}
+        return {"req_id": request["req_id"], "reply": response}
+    return response
+
+# lets several handler threads reply on one keep-alive socket without interleaving frames
+class LockedSocket:
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+
+    def sendall(self, data):
+        with self.lock:
+            self.sock.sendall(data)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+# sends a whole message over a blocking socket
+def send_message(sock, message, codec=JSON):
+    sock.sendall(encode(message, codec))
+
+# reads exactly n bytes, never more, so raw file bytes after a frame stay in the socket
+def recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        count = sock.recv_into(view[got:], n - got)
+        if count == 0:
+            raise ConnectionError(f"Connection closed after {got} of {n} bytes")
+        got += count
+    return buf
+
+# reads one message from a blocking socket, returns (message, codec) or (None, None) on eof
+def recv_message(sock):
+    first = sock.recv(HEADER.size)
+    if not first:
+        return None, None
+    if first[0] != MAGIC:
+        return _recv_legacy(sock, first)
+    if len(first) < HEADER.size:
+        first += recv_exact(sock, HEADER.size - len(first))
+    _, codec, length = HEADER.unpack(first)
+    if length > MAX_MESSAGE:
+        raise ValueError(f"Message of {length} bytes is over the {MAX_MESSAGE} byte limit")
+    return decode(recv_exact(sock, length), codec), codec
+
+# older nodes send bare json, keep reading until the buffer holds one complete object
+def _recv_legacy(sock, buf):
+    buf = bytearray(buf)
+    while True:
+        try:
+            message, _ = _decoder.raw_decode(buf.decode())
+            return message, LEGACY
+        except ValueError:
+            pass
+        data = sock.recv(4096)
+        if not data:
+            raise ConnectionError("Connection closed in the middle of a message")
+        buf += data
+
+# asyncio versions used by async_server.py
+async def read_message(reader):
+    first = await reader.read(1)
+    if not first:
+        return None, None
+    if first[0] != MAGIC:
+        buf = bytearray(first)
+        while True:
+            try:
+                message, _ = _decoder.raw_decode(buf.decode())
+                return message, LEGACY
+            except ValueError:
+                pass
+            data = await reader.read(4096)
+            if not data:
+                raise ConnectionError("Connection closed in the middle of a message")
+            buf += data
+    _, codec, length = HEADER.unpack(first + await reader.readexactly(HEADER.size - 1))
+    if length > MAX_MESSAGE:
+        raise ValueError(f"Message of {length} bytes is over the {MAX_MESSAGE} byte limit")
+    return decode(await reader.readexactly(length), codec), codec
+
+def write_message(writer, message, codec=JSON):
+    writer.write(encode(message, codec))
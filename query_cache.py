@@ -0,0 +1,57 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# query_cache.py remembers which leaf nodes answered a query for a file so the next query
+# for the same file can be answered by the first super peer without flooding the network.
+# entries expire after a while and the least recently used ones are dropped when it is full
+#
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_SIZE = 1024  # most file names kept at once
+CACHE_TTL = 30  # seconds an answer stays usable
+
+#
+# Query cache class, LRU ordered dict of {file_name: (expires_at, [QueryHit])}
+#
+class QueryCache:
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # returns the cached QueryHits for a file, or None if there is no fresh entry
+    def get(self, file_name):
+        with self.lock:
+            entry = self.entries.get(file_name)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self.entries[file_name]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(file_name)
+            self.hits += 1
+            return list(entry[1])
+
+    def put(self, file_name, query_hits):
+        with self.lock:
+            self.entries[file_name] = (time.time() + self.ttl, list(query_hits))
+            self.entries.move_to_end(file_name)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    # drops a file whose holders may have changed
+    def invalidate(self, file_name):
+        with self.lock:
+            self.entries.pop(file_name, None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self.entries)}
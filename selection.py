@@ -0,0 +1,132 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# selection.py picks which QueryHit a leaf node downloads from when nobody is asked. the
+# leaf keeps a small record of every holder it has downloaded from, the transfer rate it
+# got (smoothed) and how many downloads from that holder are running right now. hits also
+# carry what the holder last told its super peer, its running uploads, upload rate and
+# limit, plus the version of its file and how many super peers away it is. a holder only
+# serves UPLOAD_LIMIT transfers at once and answers BUSY to the rest
+#
+import random
+import threading
+
+RATE_WEIGHT = 0.3  # weight of the newest transfer in the smoothed rate
+UPLOAD_LIMIT = 4  # transfers a leaf sends at once, 0 for no limit
+
+#
+# per holder download history of one leaf node
+#
+class SourceStats:
+    def __init__(self):
+        self.rates = {}  # {leaf_id: smoothed bytes per second}
+        self.active = {}  # {leaf_id: downloads in progress}
+        self.lock = threading.Lock()
+
+    def started(self, leaf_id):
+        with self.lock:
+            self.active[leaf_id] = self.active.get(leaf_id, 0) + 1
+
+    def finished(self, leaf_id, size=0, duration=0):
+        with self.lock:
+            self.active[leaf_id] = max(self.active.get(leaf_id, 1) - 1, 0)
+            if size and duration:
+                rate = size / duration
+                old = self.rates.get(leaf_id)
+                self.rates[leaf_id] = rate if old is None else old + RATE_WEIGHT * (rate - old)
+
+#
+# upload slots of one leaf node, and the smoothed rate its finished uploads went at
+#
+class UploadSlots:
+    def __init__(self, limit=UPLOAD_LIMIT):
+        self.limit = limit
+        self.active = 0
+        self.rate = 0.0  # bytes per second, 0 until an upload finished
+        self.busy = 0  # transfers turned away
+        self.lock = threading.Lock()
+
+    # False when every slot is taken
+    def acquire(self):
+        with self.lock:
+            if self.limit and self.active >= self.limit:
+                self.busy += 1
+                return False
+            self.active += 1
+            return True
+
+    def release(self, size=0, duration=0):
+        with self.lock:
+            self.active = max(self.active - 1, 0)
+            if size and duration:
+                rate = size / duration
+                self.rate = rate if not self.rate else self.rate + RATE_WEIGHT * (rate - self.rate)
+
+    # what the leaf reports to its super peer, copied into its QueryHits
+    def hint(self):
+        with self.lock:
+            return {"uploads": self.active, "rate": round(self.rate), "limit": self.limit}
+
+    def stats(self):
+        return dict(self.hint(), busy=self.busy)
+
+def first(hits, stats):
+    return hits[0]
+
+def pick_random(hits, stats):
+    return random.choice(hits)
+
+# holders never tried count as fastest so each one gets a chance to be measured
+def fastest(hits, stats):
+    return max(hits, key=lambda hit: stats.rates.get(hit["leaf_node"], float("inf")))
+
+def least_loaded(hits, stats):
+    return min(hits, key=lambda hit: stats.active.get(hit["leaf_node"], 0))
+
+# best holder first. copies older than the newest version seen go last, then holders with
+# every upload slot taken. the rest are ordered by the rate a new download can expect, the
+# one we measured from the holder (or it reported) split over the uploads it is running,
+# and then by distance. holders never measured count as fastest, and ties are broken at
+# random so downloads of a popular file spread over all of its holders
+def rank(hits, stats):
+    newest = max((hit.get("version", 0) for hit in hits), default=0)
+
+    def key(hit):
+        leaf_id = hit["leaf_node"]
+        uploads = max(hit.get("uploads", 0), stats.active.get(leaf_id, 0))
+        full = bool(hit.get("limit")) and uploads >= hit["limit"]
+        rate = stats.rates.get(leaf_id) or hit.get("rate") or float("inf")
+        return hit.get("version", newest) < newest, full, -rate / (uploads + 1), hit.get("hops", 0), random.random()
+
+    return sorted(hits, key=key)
+
+def ranked(hits, stats):
+    return rank(hits, stats)[0]
+
+POLICIES = {"first": first, "random": pick_random, "fastest": fastest, "least_loaded": least_loaded, "ranked": ranked}
+
+def choose(policy, hits, stats):
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown selection policy {policy}, expected one of {', '.join(POLICIES)}")
+    return POLICIES[policy](hits, stats)
+
+# every hit in the order a download tries them, the policy's pick (or the one chosen by
+# hand) first and the rest as ranked, so a busy or unreachable holder falls back to the next
+def order(policy, hits, stats, chosen=None):
+    if chosen is None:
+        chosen = choose(policy, hits, stats)
+    return [chosen] + [hit for hit in rank(hits, stats) if hit is not chosen]
+
+# the hints of a hit for printing, only the ones it has
+def describe(hit):
+    parts = []
+    if "version" in hit:
+        parts.append(f"version {hit['version']}")
+    if "hops" in hit:
+        parts.append(f"{hit['hops']} hops")
+    if "uploads" in hit:
+        parts.append(f"{hit['uploads']}/{hit['limit'] or 'unlimited'} uploads")
+    if hit.get("rate"):
+        parts.append(f"{hit['rate'] / 1e6:.2f} MB/s")
+    return f" ({', '.join(parts)})" if parts else ""
@@ -0,0 +1,522 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# simulation.py runs the real SuperPeer and LeafNode code for a config of any size inside one
+# process, with no sockets. messages go through an in memory transport that delivers each
+# one after the modeled latency of its link, on a simulated clock. every message is handled
+# on a thread of its own as usual, but the clock only moves on once every one of them is
+# done or waiting on another message, so the time a query or invalidation takes comes from
+# the latency model and not from how fast this machine is. it reports messages per query
+# and per invalidation and their simulated latency, in the same format as benchmark.py
+#   python simulation.py <config file> [--lookup=flood/dht] [--queries=n] [--ttl=n] ...
+#
+import heapq
+import itertools
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+import super_peer
+from network_setup import start_super_peer, load_config, parse_flags, leaf_homes
+from leaf_node import LeafNode
+from file import File
+from spanning_tree import SpanningTree
+from hash_ring import HashRing
+from invalidation_batcher import InvalidationBatcher
+from protocol import encode, decode, HEADER, JSON
+from connection_pool import REQUEST_TIMEOUT
+from benchmark import result, write_results
+from metrics import configure_logging
+
+DEFAULTS = {"lookup": "flood", "queries": 50, "ttl": 17, "copies": "1,8,32", "reps": 5, "latency": 20.0,
+            "jitter": 10.0, "leaf-latency": 1.0, "seed": 485, "log": "warning", "out": "simulation_results"}
+STACK_SIZE = 256 * 1024  # handler threads need little stack and there may be thousands at once
+
+log = logging.getLogger("simulation")
+
+#
+# one task waiting on the simulator for a message or a timeout
+#
+class Waiter:
+    def __init__(self):
+        self.sleeping = False
+        self.woken = False
+        self.timed_out = False
+        self.ready = None  # condition the task sleeps on, made when it blocks
+
+#
+# Simulator class, the clock and a heap of (time, seq, callback, args). tasks are threads
+# counted in active, the heap is only worked on while no task is running. every sleeping
+# task waits on a condition of its own, waking thousands of them to find the one a message
+# is for made a 200 super peer run take minutes
+#
+class Simulator:
+    def __init__(self):
+        self.now = 0.0
+        self.events = []
+        self.ids = itertools.count()
+        self.active = 0
+        self.lock = threading.RLock()
+        self.idle = threading.Condition(self.lock)  # run waits on this for active to reach 0
+        self.processed = 0
+
+    def schedule(self, delay, callback, *args):
+        with self.lock:
+            heapq.heappush(self.events, (self.now + delay, next(self.ids), callback, args))
+
+    # runs func on a new thread as a task of the simulation
+    def spawn(self, func, *args):
+        with self.lock:
+            self.active += 1
+        threading.Thread(target=self.run_task, args=(func, args), daemon=True).start()
+
+    def run_task(self, func, args):
+        try:
+            func(*args)
+        except Exception as e:
+            log.warning("Simulated task %s failed: %s", getattr(func, "__name__", func), e, exc_info=True)
+        finally:
+            with self.lock:
+                self.finished()
+
+    # caller holds self.lock
+    def finished(self):
+        self.active -= 1
+        if not self.active:
+            self.idle.notify()
+
+    # parks the calling task until the waiter is woken or timeout simulated seconds pass,
+    # returns False on a timeout. whoever wakes it counts it as active again, so the clock
+    # cannot move on between the wake and the task running
+    def block(self, waiter, timeout=None):
+        with self.lock:
+            if not waiter.woken:
+                if timeout is not None:
+                    self.schedule(max(timeout, 0), self.time_out, waiter)
+                waiter.sleeping = True
+                waiter.ready = threading.Condition(self.lock)
+                self.finished()
+                while not waiter.woken:
+                    waiter.ready.wait()
+            return not waiter.timed_out
+
+    def wake(self, waiter):
+        with self.lock:
+            if waiter.woken:
+                return
+            waiter.woken = True
+            if waiter.sleeping:
+                self.active += 1
+                waiter.ready.notify()
+
+    def time_out(self, waiter):
+        with self.lock:
+            if not waiter.woken:
+                waiter.timed_out = True
+                self.wake(waiter)
+
+    # stands in for concurrent.futures.wait inside super_peer while simulating
+    def wait(self, futures, timeout=None):
+        futures = set(futures)
+        waiter = Waiter()
+        if not any(future.done() for future in futures):
+            for future in futures:
+                future.add_done_callback(lambda _: self.wake(waiter))
+            self.block(waiter, timeout)
+        done = {future for future in futures if future.done()}
+        return done, futures - done
+
+    # works through the events in time order until there are none left
+    def run(self):
+        with self.lock:
+            while True:
+                while self.active:
+                    self.idle.wait()
+                if not self.events:
+                    return
+                at, _, callback, args = heapq.heappop(self.events)
+                # the timeout of a task that got its message long ago would only move the clock
+                if callback == self.time_out and args[0].woken:
+                    continue
+                self.now = max(self.now, at)
+                self.processed += 1
+                callback(*args)
+
+#
+# stands in for the time module inside super_peer, so query deadlines are simulated seconds
+#
+class SimClock:
+    def __init__(self, sim):
+        self.sim = sim
+
+    def time(self):
+        return self.sim.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+#
+# stands in for a super peer's forward pool, each forward is a task of the simulation
+#
+class SimExecutor:
+    def __init__(self, sim):
+        self.sim = sim
+
+    def submit(self, func, *args):
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.sim.spawn(run)
+        return future
+
+#
+# replaces the wakeup event of an invalidation batcher, the batch goes out interval
+# simulated seconds after the first entry instead of on a timer thread
+#
+class SimWakeup:
+    def __init__(self, sim, batcher):
+        self.sim = sim
+        self.batcher = batcher
+        self.scheduled = False
+
+    def set(self):
+        if not self.scheduled:
+            self.scheduled = True
+            self.sim.schedule(self.batcher.interval, self.fire)
+
+    def fire(self):
+        self.scheduled = False
+        self.sim.spawn(self.batcher.send_pending)
+
+def sim_batcher(sim, flush):
+    batcher = InvalidationBatcher(flush, start=False)
+    batcher.wakeup = SimWakeup(sim, batcher)
+    return batcher
+
+#
+# the replies of one request, read by the task that sent it
+#
+class Inbox:
+    def __init__(self):
+        self.replies = deque()
+        self.waiter = None
+
+    def get(self, sim, deadline):
+        while not self.replies:
+            self.waiter = Waiter()
+            if deadline <= sim.now or not sim.block(self.waiter, deadline - sim.now):
+                if not self.replies:
+                    return None
+        return self.replies.popleft()
+
+#
+# stands in for a ConnectionPool, same send, request and stream calls over the transport
+#
+class SimPool:
+    def __init__(self, transport, owner):
+        self.transport = transport
+        self.owner = owner  # node id of the node this pool belongs to
+        self.ids = itertools.count(1)
+        self.pending = {}  # {req_id: Inbox}
+        self.connections = {}
+
+    def send(self, port, message):
+        self.transport.send(self.owner, port, message)
+
+    def request(self, port, message, timeout=REQUEST_TIMEOUT):
+        replies = self.stream(port, message, timeout)
+        try:
+            while True:
+                next(replies)
+        except StopIteration as done:
+            return done.value
+
+    def stream(self, port, message, timeout=REQUEST_TIMEOUT):
+        sim = self.transport.sim
+        req_id = next(self.ids)
+        inbox = self.pending[req_id] = Inbox()
+        deadline = sim.now + timeout
+        try:
+            self.transport.send(self.owner, port, dict(message, req_id=req_id), self)
+            while True:
+                reply = inbox.get(sim, deadline)
+                if reply is None:
+                    raise TimeoutError(f"Stream from port {port} did not finish after {timeout} seconds")
+                if not reply.get("more"):
+                    return reply["reply"]
+                yield reply["reply"]
+        finally:
+            self.pending.pop(req_id, None)
+
+    # called by the simulator when a reply arrives
+    def deliver(self, reply):
+        inbox = self.pending.get(reply["req_id"])
+        if inbox is None:
+            return
+        inbox.replies.append(reply)
+        if inbox.waiter is not None:
+            self.transport.sim.wake(inbox.waiter)
+
+    def stats(self):
+        return {"pending": len(self.pending)}
+
+#
+# what a handler writes its replies to, each frame goes back to the pool that asked
+#
+class SimSocket:
+    def __init__(self, transport, sender, pool):
+        self.transport = transport
+        self.sender = sender
+        self.pool = pool
+
+    def sendall(self, data):
+        _, codec, length = HEADER.unpack(data[:HEADER.size])
+        reply = decode(data[HEADER.size:HEADER.size + length], codec)
+        if self.pool is not None and isinstance(reply, dict) and "req_id" in reply:
+            self.transport.reply(self.sender, self.pool, reply)
+
+    def send(self, data):
+        self.sendall(data)
+        return len(data)
+
+#
+# Transport class, {port: (node id, node)} plus the latency of every link. messages are
+# encoded and decoded on the way so a handler gets its own copy, as it would from a socket
+#
+class SimTransport:
+    def __init__(self, sim, latency=0.02, jitter=0.01, leaf_latency=0.001, seed=485):
+        self.sim = sim
+        self.nodes = {}
+        self.latency = latency
+        self.jitter = jitter
+        self.leaf_latency = leaf_latency
+        self.seed = seed
+        self.links = {}  # {(node id, node id): seconds}
+        self.counts = Counter()  # messages sent by type, replies under "reply"
+        self.watchers = []  # called with (node id, message) on every delivery
+
+    def add(self, node_id, port, node):
+        self.nodes[port] = (node_id, node)
+
+    # the same every run for a pair of super peers, anything with a leaf on it is local
+    def link_latency(self, a, b):
+        if not (a.startswith("SP") and b.startswith("SP")):
+            return self.leaf_latency
+        link = (a, b) if a < b else (b, a)
+        latency = self.links.get(link)
+        if latency is None:
+            rng = random.Random(f"{self.seed}-{link[0]}-{link[1]}")
+            latency = self.links[link] = max(self.latency + rng.uniform(-self.jitter, self.jitter), 0.0)
+        return latency
+
+    def send(self, sender, port, message, pool=None):
+        target = self.nodes.get(port)
+        if target is None:
+            raise ConnectionRefusedError(f"Nothing listening on simulated port {port}")
+        with self.sim.lock:
+            self.counts[message.get("type")] += 1
+        data = encode(message, JSON)
+        self.sim.schedule(self.link_latency(sender, target[0]), self.deliver, target, data, SimSocket(self, target[0], pool))
+
+    def deliver(self, target, data, sock):
+        node_id, node = target
+        message = decode(data[HEADER.size:], JSON)
+        for watch in self.watchers:
+            watch(node_id, message)
+        self.sim.spawn(node.handle_request, message, sock, JSON)
+
+    def reply(self, sender, pool, reply):
+        with self.sim.lock:
+            self.counts["reply"] += 1
+        self.sim.schedule(self.link_latency(sender, pool.owner), pool.deliver, reply)
+
+#
+# Simulation class, every node of a config running on one transport
+#
+class Simulation:
+    def __init__(self, config, lookup='flood', latency=0.02, jitter=0.01, leaf_latency=0.001, seed=485):
+        self.sim = Simulator()
+        self.transport = SimTransport(self.sim, latency, jitter, leaf_latency, seed)
+        self.rng = random.Random(seed)
+        # query deadlines in super_peer follow the simulated clock, close() puts the real
+        # clock and the default thread stack size back
+        self.saved = (super_peer.time, super_peer.wait)
+        super_peer.time = SimClock(self.sim)
+        super_peer.wait = self.sim.wait
+        self.stack_size = threading.stack_size(STACK_SIZE)
+        # leaf directories go to a scratch directory that is removed at the end
+        self.home = os.getcwd()
+        self.scratch = tempfile.mkdtemp(prefix="simulation_")
+        os.chdir(self.scratch)
+        try:
+            self.build(config, lookup)
+        except BaseException:
+            self.close()
+            raise
+
+    # every node with the 'sim' engine, talking through the transport instead of sockets
+    def build(self, config, lookup):
+        tree = SpanningTree({sp_config["peer_id"]: sp_config["neighbors"] for sp_config in config["super_peers"]})
+        ring = HashRing(sorted(sp_config["peer_id"] for sp_config in config["super_peers"])) if lookup == 'dht' else None
+        homes = leaf_homes(config)
+        self.super_peers = {}
+        for sp_config in config["super_peers"]:
+            sp = start_super_peer(config, sp_config["peer_id"], 'push', 'sim', 'json', lookup, tree, ring, homes)
+            sp.pool = SimPool(self.transport, sp.peer_id)
+            sp.forward_pool = SimExecutor(self.sim)
+            sp.invalidations = sim_batcher(self.sim, sp.flush_invalidations)
+            sp.query_cache.ttl = 0  # measure the network, not the query cache
+            self.super_peers[sp.peer_id] = sp
+            self.transport.add(sp.peer_id, sp_config["port"], sp)
+
+        ports = {sp_config["peer_id"]: sp_config["port"] for sp_config in config["super_peers"]}
+        self.leaves = {}
+        for ln_config in config["leaf_nodes"]:
+            node_id = ln_config["node_id"]
+            files = list(ln_config["files"])
+            leaf = LeafNode(node_id, ports[ln_config["connected_super_peer"]], ln_config["connected_super_peer"],
+                            {f: File(f, node_id, True, node_id) for f in files}, files, ln_config["port"],
+                            'push', 'sim', interactive=False)
+            leaf.pool = SimPool(self.transport, node_id)
+            leaf.invalidations = sim_batcher(self.sim, leaf.send_invalidations)
+            self.leaves[node_id] = leaf
+            self.transport.add(node_id, ln_config["port"], leaf)
+        for leaf in self.leaves.values():
+            leaf.register_files(republish=True)
+        self.sim.run()
+
+    def close(self):
+        os.chdir(self.home)
+        shutil.rmtree(self.scratch, ignore_errors=True)
+        super_peer.time, super_peer.wait = self.saved
+        threading.stack_size(self.stack_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # one query from a leaf, times in simulated milliseconds
+    def query(self, leaf, file_name, ttl):
+        record = {"first_hit_ms": None, "hits": 0}
+
+        def run():
+            start = self.sim.now
+            for _ in leaf.stream_query(file_name, ttl):
+                if record["first_hit_ms"] is None:
+                    record["first_hit_ms"] = (self.sim.now - start) * 1000
+                record["hits"] += 1
+            record["query_ms"] = (self.sim.now - start) * 1000
+
+        before = Counter(self.transport.counts)
+        self.sim.spawn(run)
+        self.sim.run()
+        record["messages"] = sum((self.transport.counts - before).values())
+        return record
+
+    # queries for files another leaf has, asked from random leaves
+    def queries(self, count, ttl):
+        ids = sorted(self.leaves)
+        first, total, hits, messages = [], [], [], []
+        for _ in range(count):
+            asker = self.leaves[self.rng.choice(ids)]
+            owner = self.leaves[self.rng.choice([n for n in ids if n != asker.node_id])]
+            record = self.query(asker, self.rng.choice(owner.files.names()), ttl)
+            if record["first_hit_ms"] is not None:
+                first.append(record["first_hit_ms"])
+            total.append(record["query_ms"])
+            hits.append(record["hits"])
+            messages.append(record["messages"])
+        return {"first_hit_ms": first, "query_ms": total, "hits": hits, "messages": messages}
+
+    # k leaves get a copy of a file, its origin edits it and every copy has to hear about it.
+    # the time is until the last INVALIDATION reached a leaf with a copy
+    def invalidation(self, copies):
+        ids = sorted(self.leaves)
+        origin = self.leaves[self.rng.choice(ids)]
+        file_name = self.rng.choice(origin.files.names())
+        holders = [self.leaves[n] for n in self.rng.sample([n for n in ids if n != origin.node_id], copies)]
+        for holder in holders:
+            open(os.path.join(holder.directory, file_name), "wb").close()
+            holder.add_copy(file_name, origin.node_id, origin.files[file_name].version)
+        self.sim.run()  # subscriptions reach every super peer
+
+        arrived = {}
+        holder_ids = {holder.node_id for holder in holders}
+
+        def watch(node_id, message):
+            if node_id in holder_ids and message.get("type") == "INVALIDATION" and node_id not in arrived:
+                if any(entry["file_name"] == file_name for entry in message.get("files", [])):
+                    arrived[node_id] = self.sim.now
+
+        self.transport.watchers.append(watch)
+        before = Counter(self.transport.counts)
+        start = self.sim.now
+        self.sim.spawn(origin.edit_file, file_name, "simulated edit")
+        self.sim.run()
+        self.transport.watchers.remove(watch)
+        sent = self.transport.counts - before
+        return {"all_invalidated_ms": (max(arrived.values()) - start) * 1000 if len(arrived) == copies else None,
+                "invalidation_messages": sent["INVALIDATION"], "messages": sum(sent.values())}
+
+    def stats(self):
+        return {"events": self.sim.processed, "clock": self.sim.now, "messages": dict(self.transport.counts)}
+
+# every scenario on one config, results in the format of benchmark.py
+def run_simulation(config_file, options):
+    topology = os.path.splitext(os.path.basename(config_file))[0]
+    lookup = options["lookup"]
+    start = time.time()
+    results = []
+    with Simulation(load_config(config_file), lookup, options["latency"] / 1000, options["jitter"] / 1000,
+                    options["leaf-latency"] / 1000, options["seed"]) as simulation:
+        print(f"Started {len(simulation.super_peers)} super peers and {len(simulation.leaves)} leaves in {time.time() - start:.2f} seconds")
+        measured = simulation.queries(options["queries"], options["ttl"])
+        for metric, values in measured.items():
+            results.append(result("sim_query", topology, lookup, options["ttl"], metric, values))
+        for k in [int(k) for k in options["copies"].split(",")]:
+            delays, invalidations, messages = [], [], []
+            for _ in range(options["reps"]):
+                measured = simulation.invalidation(min(k, len(simulation.leaves) - 1))
+                if measured["all_invalidated_ms"] is not None:
+                    delays.append(measured["all_invalidated_ms"])
+                invalidations.append(measured["invalidation_messages"])
+                messages.append(measured["messages"])
+            results.append(result("sim_invalidation", topology, lookup, k, "all_invalidated_ms", delays))
+            results.append(result("sim_invalidation", topology, lookup, k, "invalidation_messages", invalidations))
+            results.append(result("sim_invalidation", topology, lookup, k, "messages", messages))
+        stats = simulation.stats()
+        print(f"Simulated {stats['clock']:.2f} seconds, {stats['events']} events in {time.time() - start:.2f} seconds")
+    return results
+
+#
+# main
+#
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python simulation.py <config file> [--lookup=flood/dht] [--queries=n] [--ttl=n] [--copies=k,k,...] "
+              "[--reps=n] [--latency=ms per super peer link] [--jitter=ms] [--leaf-latency=ms] [--seed=n] "
+              "[--log=debug/info/warning] [--out=<results file without extension>]")
+        sys.exit(1)
+
+    options = parse_flags(sys.argv[2:], DEFAULTS)
+    configure_logging(options["log"])
+    results = run_simulation(sys.argv[1], options)
+    for row in results:
+        print(f"  {row['scenario']:<17} {row['param']:>5} {row['metric']:<22} p50 {row['p50']:10.3f}  p90 {row['p90']:10.3f}  p99 {row['p99']:10.3f}")
+    write_results(results, options)
+    # leftover daemon threads of the nodes are not waited for
+    os._exit(0)
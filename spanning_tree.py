@@ -0,0 +1,92 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# spanning_tree.py gives every super peer the same broadcast trees over the topology in the
+# config file. the tree for a message is rooted at the super peer that started it and built
+# breadth first with neighbors in sorted order, so each peer can work out its own children
+# without asking anyone and a broadcast reaches all N peers with N-1 messages. links that
+# failed to carry a message are listed in the broadcasts this peer starts for a while, so
+# every peer builds the same tree around them
+#
+import threading
+import time
+from collections import deque
+
+DOWN_FOR = 30  # seconds a failed link is left out before it is tried again
+
+#
+# Spanning tree class, topology {peer_id: [neighbor ids]} plus one cached tree per root
+#
+class SpanningTree:
+    def __init__(self, topology, down_for=DOWN_FOR):
+        self.topology = {peer: sorted(neighbors) for peer, neighbors in topology.items()}
+        self.down_for = down_for
+        self.down = {}  # {(peer_id, peer_id): time the link may be tried again}
+        self.trees = {}  # {root: {peer_id: [children]}} for trees with no broken links
+        self.lock = threading.Lock()
+
+    # the peers this node forwards a broadcast from root to. avoid lists links the sender
+    # found broken, every peer leaves them out so they all agree on the repaired tree. with
+    # targets only children that lead to one of those peers are returned
+    def children(self, root, node, avoid=(), targets=None):
+        tree = self.rooted(root, avoid)
+        children = tree.get(node, [])
+        if targets is None:
+            return list(children)
+        targets = set(targets)
+        return [child for child in children if self.reaches(tree, child, targets)]
+
+    # the next peer on the way from node up to root, None at the root or for a peer the tree
+    # does not reach
+    def parent(self, root, node):
+        for peer, children in self.rooted(root).items():
+            if node in children:
+                return peer
+        return None
+
+    # trees with no broken links are built once and kept
+    def rooted(self, root, avoid=()):
+        with self.lock:
+            if avoid:
+                return self.build(root, {tuple(link) for link in avoid})
+            tree = self.trees.get(root)
+            if tree is None:
+                tree = self.build(root)
+                self.trees[root] = tree
+            return tree
+
+    # whether any target is in the subtree under peer
+    def reaches(self, tree, peer, targets):
+        stack = [peer]
+        while stack:
+            peer = stack.pop()
+            if peer in targets:
+                return True
+            stack.extend(tree.get(peer, []))
+        return False
+
+    def build(self, root, avoid=()):
+        tree = {root: []}
+        queue = deque([root])
+        while queue:
+            peer = queue.popleft()
+            for neighbor in self.topology.get(peer, []):
+                link = (peer, neighbor)
+                if neighbor not in tree and link not in avoid and link[::-1] not in avoid:
+                    tree[peer].append(neighbor)
+                    tree[neighbor] = []
+                    queue.append(neighbor)
+        return tree
+
+    # a neighbor did not take a message, broadcasts started here avoid that link for a while
+    def mark_down(self, node, peer):
+        with self.lock:
+            self.down[(node, peer)] = time.time() + self.down_for
+
+    def down_links(self):
+        with self.lock:
+            now = time.time()
+            for link in [link for link, until in self.down.items() if until <= now]:
+                del self.down[link]
+            return [list(link) for link in self.down]
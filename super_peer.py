@@ -4,100 +4,517 @@
 # super_peer.py creates a super peer class responsible for handling queries
 # and communication with leaf nodes mostly regarding queries
 #
+import asyncio
 import socket
-import json
+import logging
 import threading
-import traceback
 import os
+import time
+import itertools
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
+from contextlib import aclosing
+from async_server import AsyncServer
+from protocol import send_message, recv_message, write_message, wrap_reply, LockedSocket, CODECS, LEGACY
+from connection_pool import ConnectionPool
+from query_cache import QueryCache
+from hash_ring import HashRing
+from message_log import MessageLog
+from invalidation_batcher import InvalidationBatcher, invalidation_entries
+from spanning_tree import SpanningTree
+from interest_table import InterestTable
+from metrics import Metrics, MeteredSocket
 HOST = 'localhost'
+QUERY_TIMEOUT = 5  # seconds a query may spend flooding before hits are returned
+HOP_MARGIN = 0.25  # seconds each hop keeps for itself to answer upstream in time
+CANCEL_CHECK = 0.05  # how often a waiting query looks for a cancel
+
+log = logging.getLogger("super_peer")
+
+#
+# stand-in for a neighbor super peer, which may live in another process
+#
+class RemotePeer:
+    def __init__(self, peer_id, port):
+        self.peer_id = peer_id
+        self.port = port
+
+#
+# streams QueryHits back to whoever asked as soon as they are found. once the query is
+# finished the stream goes quiet, so a neighbor answering late cannot write after "done"
+#
+class HitStream:
+    def __init__(self, request, send):
+        self.request = request
+        self.send = send
+        self.lock = threading.Lock()
+        self.open = True
+
+    def emit(self, hit):
+        with self.lock:
+            if self.open:
+                self.send(wrap_reply(self.request, hit, more=True))
+
+    def finish(self, hits):
+        with self.lock:
+            self.open = False
+            self.send(wrap_reply(self.request, {"type": "QueryDone", "hits": hits}))
 
 #
 # Super Peer class
 #
 class SuperPeer:
-    def __init__(self, peer_id, port, mode):
+    def __init__(self, peer_id, port, mode, engine='thread', codec='json', lookup='flood'):
         self.peer_id = peer_id
         self.port = port
         self.mode = mode
+        self.engine = engine
+        self.codec = CODECS[codec]  # encoding used for messages this peer starts
+        # counters, latencies and query traces, answered to STATS
+        self.metrics = Metrics(peer_id)
+        # keep-alive connections to neighbors and leaves, simulation.py replaces it with its own
+        self.pool = ConnectionPool(self.codec, metrics=self.metrics, sweep=engine != 'sim')
         self.leaf_nodes = []  # {leaf_id: LeafNode}
-        self.neighbor_peers = []  # [SuperPeer]
-        self.registered_files = {}  # {file_name: [leaf_ids]}
-        self.back_prop = []
-        self.message_log = {}  # Tracks message IDs to prevent duplicate processing
+        self.neighbor_peers = []  # [RemotePeer]
+        self.registered_files = {}  # {file_name: set of leaf_ids}
+        self.leaf_files = {}  # {leaf_id: set of file_names}, the same registry by leaf
+        self.leaf_seq = {}  # {leaf_id: sequence number of the last registration applied}
+        # what QueryHits for our leaves say about them, so the asking leaf can pick a holder
+        self.leaf_versions = {}  # {leaf_id: {file_name: version}} from registrations and edits
+        self.leaf_load = {}  # {leaf_id: {"uploads", "rate", "limit"}} from the last LOAD_REPORT
+        self.leaf_origins = {}  # {leaf_id: {file_name: origin}} for the copies our leaves hold
+        self.resyncing = set()  # leaves asked for their full list that have not sent it yet
+        self.message_log = MessageLog()  # Tracks message IDs to prevent duplicate processing
+        self.cancelled = MessageLog()  # message IDs of queries the asking leaf no longer needs
+        self.invalidated = MessageLog()  # {"origin_file": newest version} already passed on
+        self.invalidations = InvalidationBatcher(self.flush_invalidations, start=engine != 'sim')
+        self.session = os.urandom(3).hex()  # keeps batch ids of a restarted peer unique
+        self.batch_ids = itertools.count(1)
+        self.query_cache = QueryCache()  # recent answers for queries from our own leaves
+        self.lookup = lookup  # 'flood' asks the neighbors, 'dht' asks the owner of the file name
+        self.peer_ports = {}  # {peer_id: port} of every super peer, used in dht mode
+        self.ring = None
+        self.file_index = {}  # {file_name: {leaf_id: super_peer_id}} for names this peer owns
+        self.index_origins = {}  # {file_name: {leaf_id: origin}} for the indexed copies
+        self.tree = None  # broadcast trees over the whole topology, without it invalidations flood
+        self.interest = InterestTable()  # which super peers have leaves holding copies of a file
+        self.leaf_homes = {}  # {leaf_id: super_peer_id} from the config, where an origin's invalidations start
         # ensures thread handling for multiple queries
         self.lock = threading.Lock()
-        threading.Thread(target=self.start_server).start()
+        # forwards a query to every neighbor at the same time
+        self.forward_pool = ThreadPoolExecutor(max_workers=32)
+        self.metrics.gauge("pooled_connections", lambda: len(self.pool.connections))
+        self.metrics.gauge("registered_files", lambda: len(self.registered_files))
+        self.ready = threading.Event()  # set once the server socket is listening
+        if self.engine == 'asyncio':
+            # single event loop for every connection instead of a thread each
+            self.server = AsyncServer(self, self.port)
+            self.ready = self.server.ready
+            threading.Thread(target=self.server.run).start()
+        elif self.engine != 'sim':
+            threading.Thread(target=self.start_server).start()
+        # with the 'sim' engine simulation.py delivers every message itself, there is no server
 
     # Initilizes server on port defined in JSON config file
     def start_server(self):
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # lets a restarted node rebind while its old connections sit in TIME_WAIT
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server_socket.bind((HOST, self.port))
         server_socket.listen()
-        print(f"Super-peer {self.peer_id} server started on port {self.port}")
+        self.ready.set()
+        log.info("Super-peer %s server started on port %s", self.peer_id, self.port)
 
         while True:
             client_socket, address = server_socket.accept()
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client_socket = MeteredSocket(client_socket, self.metrics)
             threading.Thread(target=self.handle_connection, args=(client_socket, address)).start()
 
+    # pooled connections stay open and carry many requests, legacy ones carry exactly one
+    def handle_connection(self, client_socket, address):
+        reply_socket = LockedSocket(client_socket)
+        measure = self.metrics.measure
+        self.metrics.connected(1)
+        try:
+            while True:
+                request, codec = recv_message(client_socket)
+                if request is None:
+                    break
+                if codec == LEGACY:
+                    measure(request.get("type"), self.handle_request, request, client_socket, codec)
+                    break
+                if request["type"] == "file_query":
+                    # a query waits on other peers, keep reading this connection meanwhile
+                    threading.Thread(target=measure, args=("file_query", self.handle_request, request, reply_socket, codec)).start()
+                else:
+                    measure(request["type"], self.handle_request, request, reply_socket, codec)
+        except (OSError, ValueError) as e:
+            log.warning("Super-peer %s dropped connection from %s: %s", self.peer_id, address, e)
+        finally:
+            self.metrics.connected(-1)
+        client_socket.close()
+
     # This is specifically for handling requests from leaf nodes
     # Either queries or file transfers
-    def handle_connection(self, client_socket, address):
-        data = client_socket.recv(1024).decode()
-        request = json.loads(data)
-        print(f'Request recieved at {self.peer_id}: {request}')
+    def handle_request(self, request, client_socket, codec):
+        log.debug("Request recieved at %s: %s", self.peer_id, request)
         response = []
-        huh = []
-        back_prop = []
         # print(f'message log: {self.message_log}')
 
-        if request["type"] == "file_query":
-            self.handle_query(request, response, back_prop)
-            client_socket.send(json.dumps(response).encode())  
-        elif request["type"] == "queryhit_back":
-            huh = self.handle_backprop(response, back_prop)
+        if request["type"] == "file_query" and request.get("stream"):
+            stream = HitStream(request, lambda m: send_message(client_socket, m, codec))
+            self.handle_query(request, response, stream.emit)
+            stream.finish(len(response))
+        elif request["type"] == "file_query":
+            self.handle_query(request, response)
+            send_message(client_socket, wrap_reply(request, response), codec)
+        elif request["type"] == "QUERY_CANCEL":
+            self.cancel_query(request)
+        elif request["type"] == "INDEX_PUBLISH":
+            self.update_index(request)
+        elif request["type"] == "INDEX_LOOKUP":
+            send_message(client_socket, wrap_reply(request, self.index_hits(request["file_name"])), codec)
         elif request["type"] == "INVALIDATION":
             self.handle_invalidation(request, client_socket)
         elif request["type"] == "register_files":
-            self.registered_files.clear()
-            for f in request["files"]:
-                self.registered_files[f] = request["node_id"]
-            # print(f'self.registered_files for {self.peer_id}: {self.registered_files}')
+            self.register_files(request)
+        elif request["type"] == "REGISTER_DELTA":
+            self.register_delta(request)
+        elif request["type"] == "LOAD_REPORT":
+            self.update_load(request)
         elif request["type"] == "PULL":
-            self.handle_pull_request(request, client_socket)
+            self.handle_pull_request(request, client_socket, codec)
+        elif request["type"] == "PULL_BATCH":
+            send_message(client_socket, wrap_reply(request, self.pull_batch_status(request)), codec)
         elif request["type"] == "CLEANUP":
             self.cleanup(request)
-        client_socket.close()
+        elif request["type"] == "SUBSCRIBE":
+            self.subscribe(request)
+        elif request["type"] == "PING":
+            send_message(client_socket, wrap_reply(request, {"type": "PONG"}), codec)
+        elif request["type"] == "STATS":
+            send_message(client_socket, wrap_reply(request, self.stats()), codec)
+
+    # coroutine version of handle_connection used by the asyncio engine
+    # anything that opens sockets to other nodes runs on the server's worker pool, except
+    # queries, which await their neighbors on the loop
+    async def handle_request_async(self, request, writer, codec):
+        log.debug("Request recieved at %s: %s", self.peer_id, request)
+
+        if request["type"] == "file_query" and request.get("stream"):
+            response = []
+            loop = self.server.loop
+            stream = HitStream(request, lambda m: loop.call_soon_threadsafe(write_message, writer, m, codec))
+            await self.handle_query_async(request, response, stream.emit)
+            stream.finish(len(response))
+        elif request["type"] == "file_query":
+            response = []
+            await self.handle_query_async(request, response)
+            write_message(writer, wrap_reply(request, response), codec)
+        elif request["type"] == "QUERY_CANCEL":
+            await self.server.run_blocking(self.cancel_query, request)
+        elif request["type"] == "INDEX_PUBLISH":
+            await self.server.run_in_order(self.update_index, request)
+        elif request["type"] == "INDEX_LOOKUP":
+            write_message(writer, wrap_reply(request, self.index_hits(request["file_name"])), codec)
+        elif request["type"] == "INVALIDATION":
+            await self.server.run_blocking(self.handle_invalidation, request, None)
+        elif request["type"] == "register_files":
+            await self.server.run_in_order(self.register_files, request)
+        elif request["type"] == "REGISTER_DELTA":
+            # deltas are numbered, running them out of order would look like a lost one
+            await self.server.run_in_order(self.register_delta, request)
+        elif request["type"] == "LOAD_REPORT":
+            self.update_load(request)
+        elif request["type"] == "PULL":
+            response = await self.server.run_blocking(self.pull_status, request)
+            write_message(writer, wrap_reply(request, response), codec)
+        elif request["type"] == "PULL_BATCH":
+            response = await self.server.run_blocking(self.pull_batch_status, request)
+            write_message(writer, wrap_reply(request, response), codec)
+        elif request["type"] == "CLEANUP":
+            await self.server.run_blocking(self.cleanup, request)
+        elif request["type"] == "SUBSCRIBE":
+            await self.server.run_blocking(self.subscribe, request)
+        elif request["type"] == "PING":
+            write_message(writer, wrap_reply(request, {"type": "PONG"}), codec)
+        elif request["type"] == "STATS":
+            write_message(writer, wrap_reply(request, self.stats()), codec)
+
+    # what this peer counted about itself and its parts, the reply to STATS
+    def stats(self):
+        return dict(self.metrics.stats(), pool=self.pool.stats(), query_cache=self.query_cache.stats(),
+                    message_log=self.message_log.stats(), invalidations=self.invalidations.stats(),
+                    interest=self.interest.stats())
+
+    # full list of a leaf's files, replaces what was registered for that leaf only. sent when
+    # the leaf starts and whenever this peer lost track of its updates
+    def register_files(self, request):
+        leaf_id = request["node_id"]
+        files = set(request["files"])
+        with self.lock:
+            old_files = self.leaf_files.get(leaf_id, set())
+            added, removed = files - old_files, old_files - files
+            self.apply_registration(leaf_id, added, removed)
+            self.leaf_versions[leaf_id] = dict(request.get("versions", {}))
+            self.leaf_origins[leaf_id] = dict(request.get("origins", {}))
+            self.leaf_seq[leaf_id] = request.get("seq")
+            self.resyncing.discard(leaf_id)
+        # a leaf resyncing after a super peer restarted publishes every file again, the
+        # restarted peer lost the index entries it owned
+        self.publish_registration(leaf_id, files if request.get("republish") else added, removed)
+
+    # files a leaf gained or lost since its last registration. an update that does not
+    # follow the last one applied means one went missing, the leaf is asked for its full list
+    def register_delta(self, request):
+        leaf_id = request["node_id"]
+        with self.lock:
+            last = self.leaf_seq.get(leaf_id)
+            in_order = last is not None and request["seq"] == last + 1
+            if in_order:
+                added = set(request["add"]) - self.leaf_files.get(leaf_id, set())
+                removed = set(request["remove"]) & self.leaf_files.get(leaf_id, set())
+                self.apply_registration(leaf_id, added, removed)
+                versions = request.get("versions", {})
+                self.leaf_versions.setdefault(leaf_id, {}).update(versions)
+                self.leaf_origins.setdefault(leaf_id, {}).update(request.get("origins", {}))
+                # cached hits still carry the version a refreshed copy had before
+                for f in versions:
+                    self.query_cache.invalidate(f)
+                self.leaf_seq[leaf_id] = request["seq"]
+            else:
+                ask = leaf_id not in self.resyncing
+                self.resyncing.add(leaf_id)
+        if in_order:
+            self.publish_registration(leaf_id, added, removed)
+        elif ask:
+            self.request_resync(leaf_id, last, request["seq"])
+
+    # caller holds self.lock
+    def apply_registration(self, leaf_id, added, removed):
+        files = self.leaf_files.setdefault(leaf_id, set())
+        for f in added:
+            self.registered_files.setdefault(f, set()).add(leaf_id)
+            files.add(f)
+        for f in removed:
+            leaves = self.registered_files.get(f, set())
+            leaves.discard(leaf_id)
+            if not leaves:
+                self.registered_files.pop(f, None)
+            files.discard(f)
+            self.leaf_versions.get(leaf_id, {}).pop(f, None)
+            self.leaf_origins.get(leaf_id, {}).pop(f, None)
+        # anything registered or dropped here may be answered differently
+        for f in added | removed:
+            self.query_cache.invalidate(f)
+
+    # how busy a leaf is, sent by the leaf when its uploads change
+    def update_load(self, report):
+        with self.lock:
+            self.leaf_load[report["node_id"]] = {"uploads": report["uploads"], "rate": report["rate"],
+                                                 "limit": report["limit"]}
+
+    # a QueryHit for one of our leaves with the version it has, where the file came from and
+    # its last reported load
+    def leaf_hit(self, leaf_id, file_name, path):
+        hit = {"type": "QueryHit", "leaf_node": leaf_id, "file_name": file_name, "Done": False,
+               "path": path, "hops": len(path) - 1,
+               "origin": self.leaf_origins.get(leaf_id, {}).get(file_name, leaf_id)}
+        hit.update(self.leaf_load.get(leaf_id, {}))
+        version = self.leaf_versions.get(leaf_id, {}).get(file_name)
+        if version is not None:
+            hit["version"] = version
+        return hit
+
+    def publish_registration(self, leaf_id, added, removed):
+        if self.lookup == 'dht' and self.ring and (added or removed):
+            self.publish_index(leaf_id, added, removed)
+
+    def request_resync(self, leaf_id, last, seq):
+        self.metrics.incr("registration_resyncs")
+        log.info("Super-peer %s expected registration %s from %s after %s, asking for its full list.", self.peer_id, seq, leaf_id, last)
+        try:
+            self.pool.send(6000 + int(leaf_id[1:]), {"type": "RESYNC", "super_peer": self.peer_id})
+        except OSError as e:
+            with self.lock:
+                self.resyncing.discard(leaf_id)
+            log.warning("Super-peer %s could not ask %s to resync: %s", self.peer_id, leaf_id, e)
+
+    # learns the full super peer topology so invalidations can follow a spanning tree
+    def set_topology(self, topology):
+        self.tree = SpanningTree(topology)
+
+    # dht mode, learns every super peer so file names can be mapped to the peer indexing them
+    def join_ring(self, peer_ports):
+        self.peer_ports = dict(peer_ports)
+        self.ring = HashRing(sorted(self.peer_ports))
+
+    # tells the owner of each file name which of our leaves gained or lost it
+    def publish_index(self, leaf_id, added, removed):
+        updates = {}
+        for f in added:
+            updates.setdefault(self.ring.owner(f), {"add": [], "remove": []})["add"].append(f)
+        for f in removed:
+            updates.setdefault(self.ring.owner(f), {"add": [], "remove": []})["remove"].append(f)
+
+        for owner, change in updates.items():
+            origins = self.leaf_origins.get(leaf_id, {})
+            message = {"type": "INDEX_PUBLISH", "leaf_node": leaf_id, "super_peer": self.peer_id,
+                       "add": change["add"], "remove": change["remove"],
+                       "origins": {f: origins[f] for f in change["add"] if f in origins}}
+            if owner == self.peer_id:
+                self.update_index(message)
+                continue
+            try:
+                self.pool.send(self.peer_ports[owner], message)
+            except Exception as e:
+                log.warning("Super-peer %s could not publish index entries to %s: %s", self.peer_id, owner, e)
+
+    def update_index(self, message):
+        leaf_id = message["leaf_node"]
+        with self.lock:
+            for f in message["add"]:
+                self.file_index.setdefault(f, {})[leaf_id] = message["super_peer"]
+                self.index_origins.setdefault(f, {})[leaf_id] = message.get("origins", {}).get(f, leaf_id)
+                self.query_cache.invalidate(f)
+            for f in message["remove"]:
+                holders = self.file_index.get(f, {})
+                holders.pop(leaf_id, None)
+                self.index_origins.get(f, {}).pop(leaf_id, None)
+                if not holders:
+                    self.file_index.pop(f, None)
+                    self.index_origins.pop(f, None)
+                self.query_cache.invalidate(f)
+
+    def index_hits(self, file_name):
+        origins = self.index_origins.get(file_name, {})
+        return [{"type": "QueryHit", "leaf_node": leaf_id, "file_name": file_name, "Done": False,
+                 "origin": origins.get(leaf_id, leaf_id)}
+                for leaf_id in self.file_index.get(file_name, {})]
+
+    # dht mode, a single request to the super peer that owns the file name
+    def lookup_index(self, file_name, response, emit):
+        owner = self.ring.owner(file_name)
+        try:
+            if owner == self.peer_id:
+                query_hits = self.index_hits(file_name)
+            else:
+                lookup = {"type": "INDEX_LOOKUP", "file_name": file_name}
+                query_hits = self.pool.request(self.peer_ports[owner], lookup, QUERY_TIMEOUT)
+        except Exception as e:
+            log.warning("Super-peer %s could not reach index owner %s, flooding instead: %s", self.peer_id, owner, e)
+            return False
+        self.add_index_hits(file_name, owner, query_hits, response, emit)
+        return True
+
+    # lookup_index for the asyncio engine, the owner's answer is awaited on the loop
+    async def lookup_index_async(self, file_name, response, emit):
+        owner = self.ring.owner(file_name)
+        try:
+            if owner == self.peer_id:
+                query_hits = self.index_hits(file_name)
+            else:
+                lookup = {"type": "INDEX_LOOKUP", "file_name": file_name}
+                query_hits = await self.pool.request_async(self.peer_ports[owner], lookup, QUERY_TIMEOUT)
+        except Exception as e:
+            log.warning("Super-peer %s could not reach index owner %s, flooding instead: %s", self.peer_id, owner, e)
+            return False
+        self.add_index_hits(file_name, owner, query_hits, response, emit)
+        return True
+
+    def add_index_hits(self, file_name, owner, query_hits, response, emit):
+        log.debug("Super-peer %s found %d holders of %s at index owner %s.", self.peer_id, len(query_hits), file_name, owner)
+        for hit in query_hits:
+            response.append(hit)
+            if emit:
+                emit(hit)
 
     # responsible for cleaning up super peer after a file removal
+    # one of our leaves discarded its copy. the origin's super peer only needs to hear about
+    # it once our last leaf holding the file is gone, then the cleanup goes the way the
+    # SUBSCRIBE went and we are dropped from the file's interest
     def cleanup(self, message):
         file_name = message["file_name"]
-        # print(f'message ID: {self.message_log}')
-        msg_id = message["msg_id"]
+        # a copy of the file was discarded, cached holders are out of date
+        self.query_cache.invalidate(file_name)
+        if "root" not in message and "home" not in message:
+            if "node_id" in message and self.interest.unsubscribe(file_name, self.peer_id, message["node_id"]):
+                self.toward_origin({"type": "CLEANUP", "msg_id": f"{self.peer_id}_UNSUB_{self.session}-{next(self.batch_ids)}",
+                                    "file_name": file_name, "super_peer": self.peer_id}, message.get("origin_node"))
+            log.debug("Super-peer %s processed CLEANUP for %s from %s.", self.peer_id, file_name, message.get("node_id"))
+            return
+        if not self.message_log.add(message["msg_id"]):
+            return
+        if message.get("home", self.peer_id) != self.peer_id:
+            self.route(message)
+            return
+        self.interest.drop(file_name, message["super_peer"])
+        log.debug("Super-peer %s dropped %s from the interest in %s.", self.peer_id, message["super_peer"], file_name)
+        if "root" in message:
+            self.broadcast(message)
 
-        if msg_id in self.message_log:
-            del self.message_log[msg_id]
-            print(f"Super-peer {self.peer_id} removed {msg_id} for {file_name} from message log.")
-        
-        else:
-            print(f"Message ID {msg_id} not found in message log. No cleanup needed.")
-        self.propagate_cleanup(message)
-        
-    def propagate_cleanup(self, message):
-        msg_id = message["msg_id"]
-        for neighbor in self.neighbor_peers:
-            if msg_id in neighbor.message_log:
-                del neighbor.message_log[msg_id]
-                try:
-                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                        s.connect((HOST, neighbor.port))
-                        s.send(json.dumps(message).encode())
-                    print(f"Super-peer {self.peer_id} propagated CLEANUP for {message['file_name']} to neighbor {neighbor.peer_id}.")
-                except Exception as e:
-                    print(f"Error propagating CLEANUP to neighbor {neighbor.peer_id}: {e}")
+    # a leaf downloaded a copy, invalidations for the file must now reach this super peer.
+    # the origin's super peer is the one that sends them, so only the first of our leaves
+    # to subscribe is passed on, up the spanning tree to that super peer
+    # a leaf subscribing again after a super peer restarted is passed on even if we knew it,
+    # so the restarted peer learns it too
+    def subscribe(self, message):
+        if "root" not in message and "home" not in message:
+            if self.interest.subscribe(message["file_name"], self.peer_id, message["node_id"]) or message.get("again"):
+                self.toward_origin({"type": "SUBSCRIBE", "msg_id": f"{self.peer_id}_SUB_{self.session}-{next(self.batch_ids)}",
+                                    "file_name": message["file_name"], "node_id": message["node_id"],
+                                    "super_peer": self.peer_id}, message.get("origin_node"))
+            return
+        if not self.message_log.add(message["msg_id"]):
+            return
+        if message.get("home", self.peer_id) != self.peer_id:
+            self.route(message)
+            return
+        self.interest.subscribe(message["file_name"], message["super_peer"], message["node_id"])
+        if "root" in message:
+            self.broadcast(message)
 
+    # sends a SUBSCRIBE or CLEANUP we started to the super peer of the file's origin. when
+    # that is us nobody else needs it. without a tree or for an origin that is not in the
+    # config every super peer is told with a broadcast
+    def toward_origin(self, message, origin_node):
+        home = self.leaf_homes.get(origin_node)
+        if home == self.peer_id:
+            return
+        if home is None or not self.tree:
+            self.broadcast(dict(message, root=self.peer_id))
+            return
+        self.message_log.add(message["msg_id"])
+        self.route(dict(message, home=home))
 
+    # passes a message one hop up the spanning tree rooted at its home. if that hop cannot
+    # be reached it is broadcast from here under a new id instead, around the broken link
+    def route(self, message):
+        parent = self.tree.parent(message["home"], self.peer_id)
+        port = next((neighbor.port for neighbor in self.neighbor_peers if neighbor.peer_id == parent), None)
+        try:
+            if port is None:
+                raise OSError(f"no link towards {message['home']}")
+            self.pool.send(port, message)
+            self.metrics.incr("routed_sends")
+            log.debug("Super-peer %s routed %s %s to %s.", self.peer_id, message["type"], message["msg_id"], parent)
+        except OSError as e:
+            log.warning("Super-peer %s could not route %s towards %s: %s", self.peer_id, message["type"], message["home"], e)
+            if parent is not None:
+                self.tree.mark_down(self.peer_id, parent)
+            flood = {k: v for k, v in message.items() if k != "home"}
+            self.broadcast(dict(flood, msg_id=f"{message['msg_id']}_R{self.peer_id}", root=self.peer_id,
+                                avoid=self.tree.down_links()))
+
+    def handle_pull_request(self, message, client_socket, codec):
+        response = self.pull_status(message)
+        # Send the response back to the requesting leaf node
+        send_message(client_socket, wrap_reply(message, response), codec)
 
-    def handle_pull_request(self, message, client_socket):
+    # asks the origin leaf node for its version and compares it to the cached one
+    def pull_status(self, message):
         filename = message["file_name"]
         cached_version = message["cached_version"]
 
@@ -106,25 +523,19 @@ class SuperPeer:
 
         if not origin_leaf_node:
             # File not found in registry
-            response = {"status": "STALE"}
-            client_socket.send(json.dumps(response).encode())
-            return
+            return {"status": "STALE"}
 
         # Query the origin leaf node for the current version
         origin_port = 6000 + int(origin_leaf_node[1:])  # Assuming ports are derived from leaf node IDs
         # print(f'origin port: {origin_port}')
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                pull_query = {
-                    "type": "VERSION_REQUEST",
-                    "file_name": filename
-                }
-                s.connect((HOST, origin_port))
-                s.send(json.dumps(pull_query).encode())
-                
-                # Receive the response from the origin leaf node
-                origin_response = json.loads(s.recv(1024).decode())
-                origin_version = origin_response.get("version")
+            pull_query = {
+                "type": "VERSION_REQUEST",
+                "file_name": filename
+            }
+            # Receive the response from the origin leaf node
+            origin_response = self.pool.request(origin_port, pull_query)
+            origin_version = origin_response.get("version")
 
             # Compare the cached version with the origin version
             if cached_version < origin_version:
@@ -133,32 +544,109 @@ class SuperPeer:
                 response = {"status": "VALID", "file_name": filename}
 
         except Exception as e:
-            print(f"Error querying origin leaf node for {filename}: {e}")
+            log.warning("Error querying origin leaf node for %s: %s", filename, e, exc_info=True)
             response = {"status": "STALE"}
-            traceback.print_exc()
 
-        # Send the response back to the requesting leaf node
-        client_socket.send(json.dumps(response).encode())
+        return response
+
+    # checks every cached copy a leaf holds in one go. the copies are grouped by origin and
+    # each origin gets a single VERSION_BATCH, all origins are asked at the same time
+    def pull_batch_status(self, message):
+        by_origin = {}
+        status = {}
+        for entry in message["files"]:
+            if entry.get("origin_node"):
+                by_origin.setdefault(entry["origin_node"], []).append(entry)
+            else:
+                status[entry["file_name"]] = "STALE"
+
+        leases = {}
+        futures = {}
+        for origin, entries in by_origin.items():
+            origin_port = 6000 + int(origin[1:])
+            query = {"type": "VERSION_BATCH", "files": [e["file_name"] for e in entries]}
+            futures[self.forward_pool.submit(self.pool.request, origin_port, query)] = origin
+
+        for future in as_completed(futures):
+            origin = futures[future]
+            try:
+                reply = future.result()
+                versions = reply["versions"]
+                leases.update(reply.get("leases", {}))
+            except Exception as e:
+                log.warning("Error querying origin leaf node %s for versions: %s", origin, e)
+                versions = {}
+            for entry in by_origin[origin]:
+                origin_version = versions.get(entry["file_name"])
+                if origin_version is None or entry["cached_version"] < origin_version:
+                    status[entry["file_name"]] = "STALE"
+                else:
+                    status[entry["file_name"]] = "VALID"
+        self.metrics.incr("version_checks", len(status))
+        log.debug("Super-peer %s checked %d copies for %s with %d origin requests.", self.peer_id, len(status), message["node_id"], len(by_origin))
+        return {"status": status, "leases": leases}
 
     # responsible for handling invalidation requests
+    # a message may carry invalidations for many files. each file is only acted on when its
+    # version is newer than any seen here before. invalidations from our own leaves are batched
+    # and sent out with this peer as the root, ones from other peers are passed down their tree
     def handle_invalidation(self, message, client_socket):
-        origin = message["origin_server_id"]
 
         # Avoid processing duplicate invalidation messages
-        if message["msg_id"] in self.message_log:
+        if not self.message_log.add(message["msg_id"]):
             return
-        self.message_log[message["msg_id"]] = True
 
-        filename = message["file_name"]
+        to_leaves = {}
+        for entry in invalidation_entries(message):
+            filename = entry["file_name"]
+            origin = entry["origin_server_id"]
+            key = f"{origin}_{filename}"
+            with self.lock:
+                # one of our leaves edited its own file, its hits now have this version
+                if filename in self.leaf_versions.get(origin, {}):
+                    self.leaf_versions[origin][filename] = max(self.leaf_versions[origin][filename], entry["version_number"])
+                if self.invalidated.get(key, 0) >= entry["version_number"]:
+                    continue
+                self.invalidated[key] = entry["version_number"]
+            self.query_cache.invalidate(filename)
 
-        # Check if the file is registered
-        if filename in self.registered_files and self.registered_files[filename] != origin:
+            # Check if the file is registered, or one of our leaves subscribed to it
+            holders = self.interest.leaves(filename, self.peer_id)
+            with self.lock:
+                holders.update(self.registered_files.get(filename, ()))
+            holders.discard(origin)
             # Get the list of leaf nodes holding this file
-            leaf_nodes_with_file = self.registered_files[filename]
-            # Notify leaf nodes to discard the file
-            self.send_invalidation_to_leaf_node(leaf_nodes_with_file, message, client_socket)
+            for leaf_node_id in holders:
+                to_leaves.setdefault(leaf_node_id, []).append(entry)
+
+            # Propagate invalidation to neighbors with the next batch
+            if "root" not in message:
+                self.invalidations.add(entry)
+
+        # Notify leaf nodes to discard the file, one message per leaf
+        for leaf_node_id, entries in to_leaves.items():
+            self.send_invalidation_to_leaf_node(leaf_node_id, self.invalidation_message(entries), client_socket)
 
-        # Propagate invalidation to neighbors
+        if "root" in message:
+            self.propagate_invalidation(message)
+
+    def invalidation_message(self, entries):
+        return {"type": "INVALIDATION", "msg_id": f"{self.peer_id}_INV_{self.session}-{next(self.batch_ids)}",
+                "origin_server_id": self.peer_id, "files": entries}
+
+    # called by the batcher with every file invalidated since the last flush
+    # only super peers with leaves holding a copy need the batch, the tree is cut down to the
+    # paths leading to them
+    def flush_invalidations(self, entries):
+        message = dict(self.invalidation_message(entries), root=self.peer_id)
+        if self.tree:
+            targets = self.interest.peers(entry["file_name"] for entry in entries) - {self.peer_id}
+            if not targets:
+                log.debug("Super-peer %s has no other super peers holding copies, invalidation stays here.", self.peer_id)
+                return
+            message["targets"] = sorted(targets)
+            if self.tree.down_links():
+                message["avoid"] = self.tree.down_links()
         self.propagate_invalidation(message)
 
     # tell leave nodes to discard file
@@ -166,78 +654,300 @@ class SuperPeer:
         if leaf_node_id in self.leaf_nodes:
             port = 6000 + int(leaf_node_id[1:])
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect((HOST, port))
-                    s.send(json.dumps(message).encode())
-                print(f"Super-peer {self.peer_id} sent invalidation for {message['file_name']} to Leaf-node {leaf_node_id}.")
+                self.pool.send(port, message)
+                self.metrics.incr("invalidations_to_leaves")
+                if log.isEnabledFor(logging.DEBUG):
+                    names = ", ".join(entry["file_name"] for entry in message["files"])
+                    log.debug("Super-peer %s sent invalidation for %s to Leaf-node %s.", self.peer_id, names, leaf_node_id)
             except ConnectionRefusedError:
-                print(f"Super-peer {self.peer_id} could not connect to Leaf-node {leaf_node_id}. Skipping invalidation.")
-                traceback.print_exc()
+                log.warning("Super-peer %s could not connect to Leaf-node %s. Skipping invalidation.", self.peer_id, leaf_node_id)
             except Exception as e:
-                print(f"Error while sending invalidation to Leaf-node {leaf_node_id}: {e}")
-                traceback.print_exc()
+                log.warning("Error while sending invalidation to Leaf-node %s: %s", leaf_node_id, e, exc_info=True)
 
-    # send invalidation message to neighboring peers
     def propagate_invalidation(self, message):
-        for neighbor in self.neighbor_peers:
-            # print(f'sending to neighbor: {neighbor.port}')
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((HOST, neighbor.port))
-                s.send(json.dumps(message).encode())
-        print(f"Super-peer {self.peer_id} propagated invalidation for {message['file_name']} to neighbors.")
+        self.broadcast(message)
+
+    # send a message to our children in the tree rooted where it started, or to every
+    # neighbor when no topology is known. if a child cannot be reached the message is
+    # sent again under a new id, down a tree rooted here that goes around the broken link
+    def broadcast(self, message):
+        self.message_log.add(message["msg_id"])
+        if self.tree:
+            ports = {neighbor.peer_id: neighbor.port for neighbor in self.neighbor_peers}
+            children = self.tree.children(message["root"], self.peer_id, message.get("avoid", ()), message.get("targets"))
+            targets = [(child, ports[child]) for child in children if child in ports]
+        else:
+            targets = [(neighbor.peer_id, neighbor.port) for neighbor in self.neighbor_peers]
+        unreachable = []
+        for peer_id, port in targets:
+            # print(f'sending to neighbor: {port}')
+            try:
+                self.pool.send(port, message)
+            except OSError as e:
+                log.warning("Super-peer %s could not reach %s with %s: %s", self.peer_id, peer_id, message["type"], e)
+                unreachable.append(peer_id)
+        self.metrics.incr("broadcast_sends", len(targets) - len(unreachable))
+        log.debug("Super-peer %s propagated %s %s to %d neighbors.", self.peer_id, message["type"], message["msg_id"], len(targets) - len(unreachable))
+        if unreachable and self.tree:
+            for peer_id in unreachable:
+                self.tree.mark_down(self.peer_id, peer_id)
+            avoid = self.tree.down_links() + message.get("avoid", [])
+            repair = dict(message, msg_id=f"{message['msg_id']}_R{self.peer_id}", root=self.peer_id, avoid=avoid)
+            self.broadcast(repair)
 
         # recursivly check super nodes for the specific query
         # with the TTL restraint
 
-    def handle_query(self, query, response, back_prop):
-        ttl = query["TTL"]
-        message_id = query["message_id"]
-        leaf_node, file_name = query["message_id"].split("_")
-
-        # Check locally for file
-        back_prop.append(self.peer_id)
-        # print(f'self.backprop: {self.back_prop}')
-        # print(f"self.registered_files: {self.registered_files}")
-
-        if file_name in self.registered_files:
-            # print(f'queryhit found at {self.peer_id}')
-            response.append({"type" : "QueryHit",
-                             "leaf_node": self.registered_files[file_name], 
-                             "file_name": file_name,
-                             "Done": False})
-            back_prop.append('Query_Hit!')
-        # print(f'reponse in handle query{response}')
+    # emit, when given, is called with each QueryHit as soon as it is known. a query carries
+    # the path of super peers it went through and every hit the path to the peer that found it
+    def handle_query(self, query, response, emit=None):
+        path = query.get("path", []) + [self.peer_id]
+        start = time.time()
+        if self.answer_from_cache(query, path, response, emit, start):
+            return
+        if self.use_index(query) and self.lookup_index(query["file_name"], response, emit):
+            self.cache_answer(query, response)
+            self.trace_query(query, path, response, start, "dht")
+            return
+        forward = self.answer_locally(query, path, response, emit)
+        if forward is None:
+            return
+        if forward:
+            self.propagate_query(query, path, response, emit)
+            self.cache_answer(query, response)
+        self.trace_query(query, path, response, start, "flood")
+
+    # handle_query for the asyncio engine. the lookups are in memory and run on the loop, the
+    # waits for the index owner and the neighbors are awaited there as well, so queries
+    # waiting on the network never hold the workers that disk reads and updates need
+    async def handle_query_async(self, query, response, emit=None):
+        path = query.get("path", []) + [self.peer_id]
+        start = time.time()
+        if self.answer_from_cache(query, path, response, emit, start):
+            return
+        if self.use_index(query) and await self.lookup_index_async(query["file_name"], response, emit):
+            self.cache_answer(query, response)
+            self.trace_query(query, path, response, start, "dht")
+            return
+        forward = self.answer_locally(query, path, response, emit)
+        if forward is None:
+            return
+        if forward:
+            await self.propagate_query_async(query, path, response, emit)
+            self.cache_answer(query, response)
+        self.trace_query(query, path, response, start, "flood")
+
+    # a query straight from one of our leaves may already be answered in the cache
+    def answer_from_cache(self, query, path, response, emit, start):
+        if "from_peer" in query:
+            return False
+        file_name = query["file_name"]
+        cached = self.query_cache.get(file_name)
+        if cached is None:
+            return False
+        log.debug("Super-peer %s answered '%s' from its query cache.", self.peer_id, file_name)
+        # our own leaves may have reported a different load since the answer was cached
+        with self.lock:
+            cached = [self.leaf_hit(hit["leaf_node"], file_name, hit["path"]) if hit["leaf_node"] in self.leaf_files
+                      and "path" in hit else hit for hit in cached]
+        self.metrics.incr("query_cache_hits")
+        response.extend(cached)
+        if emit:
+            for hit in cached:
+                emit(hit)
+        self.trace_query(query, path, response, start, "cache")
+        return True
+
+    def use_index(self, query):
+        return "from_peer" not in query and self.lookup == 'dht' and self.ring is not None
 
+    # adds the hits of our own leaves and says whether the query goes on to the neighbors,
+    # None if another path already brought it here and the hits went back that way
+    def answer_locally(self, query, path, response, emit):
+        message_id = self.query_id(query)
+        seen = not self.message_log.add(message_id, query["origin"])
+        if seen and "from_peer" in query:
+            self.metrics.incr("duplicate_queries")
+            return None
+        with self.lock:
+            local = [self.leaf_hit(leaf_id, query["file_name"], path)
+                     for leaf_id in sorted(self.registered_files.get(query["file_name"], ()))]
+        for hit in local:
+            response.append(hit)
+            if emit:
+                emit(hit)
+            self.metrics.incr("query_hits")
         # Forward query if TTL >= 0
-        if ttl >= 0 and message_id not in self.message_log:
-            self.message_log[message_id] = query["origin"]
-            query["TTL"] -= 1
-            self.propagate_query(query, response, back_prop)
-
-    # looks for next super peer that hasnt been checked yet in neighbor peers
-    def propagate_query(self, query, response, back_prop):
-        m_id = query["message_id"]
+        return query["TTL"] >= 0 and not seen and message_id not in self.cancelled
+
+    # leaves from before ids had a session and sequence part send <leaf>_<file>, the same id for
+    # every query of a file, and a repeat within the message log's max_age would never be
+    # forwarded. the first super peer gives such a query an id of its own
+    def query_id(self, query):
+        if "from_peer" not in query and query["message_id"] == f"{query['origin']}_{query['file_name']}":
+            query["message_id"] = f"{query['message_id']}_{self.peer_id}_{self.session}-{next(self.batch_ids)}"
+            self.metrics.incr("legacy_query_ids")
+        return query["message_id"]
+
+    # only a complete answer for one of our leaves is worth caching, a cancelled query
+    # stopped early
+    def cache_answer(self, query, response):
+        if "from_peer" not in query and response and query["message_id"] not in self.cancelled:
+            self.query_cache.put(query["file_name"], response)
+
+    # what this peer did with one query, kept under the query's message id. the peer the
+    # leaf asked ends up with the path to every hit
+    def trace_query(self, query, path, hits, start, lookup):
+        self.metrics.trace(query["message_id"], file_name=query["file_name"], origin=query["origin"],
+                           path=path, lookup=lookup, ms=(time.time() - start) * 1000,
+                           hits=[{"leaf_node": hit["leaf_node"], "path": hit.get("path", path)} for hit in hits])
+
+    # the copy of a query passed on to the neighbors, one hop shorter and with the time
+    # budget this peer has left
+    def forward_query(self, query, path, budget, stream):
+        forward = {k: v for k, v in query.items() if k != "req_id"}
+        forward["TTL"] = query["TTL"] - 1
+        forward["from_peer"] = self.peer_id
+        forward["timeout"] = budget
+        forward["stream"] = stream
+        forward["path"] = path
+        return forward
+
+    # sends the query to every neighbor except the one it came from, all at once, and
+    # collects whatever hits come back before the query's time budget runs out
+    def propagate_query(self, query, path, response, emit=None):
+        budget = query.get("timeout", QUERY_TIMEOUT) - HOP_MARGIN
+        if budget <= 0:
+            return
+        forward = self.forward_query(query, path, budget, emit is not None)
+
+        futures = {}
+        for neighbor in self.neighbor_peers:
+            if neighbor.peer_id != query.get("from_peer"):
+                futures[self.forward_pool.submit(self.ask_neighbor, neighbor, forward, budget, emit)] = neighbor
+        self.metrics.incr("queries_forwarded", len(futures))
+
+        # wait in small steps so a cancel from the leaf stops the wait right away
+        deadline = time.time() + budget
+        late = set(futures)
+        while late and time.time() < deadline and query["message_id"] not in self.cancelled:
+            _, late = wait(late, timeout=min(CANCEL_CHECK, max(deadline - time.time(), 0)))
+        self.collect_answers(query, futures, late, response)
+
+    # propagate_query for the asyncio engine, every neighbor is asked by a task on the loop
+    async def propagate_query_async(self, query, path, response, emit=None):
+        budget = query.get("timeout", QUERY_TIMEOUT) - HOP_MARGIN
+        if budget <= 0:
+            return
+        forward = self.forward_query(query, path, budget, emit is not None)
+
+        tasks = {}
         for neighbor in self.neighbor_peers:
-            if m_id not in neighbor.message_log:
-                # neighbor.message_log[m_id] = query["origin"]
-                neighbor.handle_query(query, response, back_prop)
-
-    # back propagation functionality
-    def handle_backprop(self, query, back_prop):
-        # m_id = query["message_id"]
-        sp = query["super_node"]
-        if back_prop[-1] == "Query_Hit!":
-            for n in self.neighbor_peers:
-                if n.peer_id == sp:
-                    query["Done"] == True
+            if neighbor.peer_id != query.get("from_peer"):
+                tasks[asyncio.ensure_future(self.ask_neighbor_async(neighbor, forward, budget, emit))] = neighbor
+        self.metrics.incr("queries_forwarded", len(tasks))
+
+        deadline = time.time() + budget
+        late = set(tasks)
+        while late and time.time() < deadline and query["message_id"] not in self.cancelled:
+            _, late = await asyncio.wait(late, timeout=min(CANCEL_CHECK, max(deadline - time.time(), 0)))
+        self.collect_answers(query, tasks, late, response)
+        # nothing waits on a late neighbor any more, its request gives up its reply slot
+        for task in late:
+            task.cancel()
+
+    # adds the hits of every neighbor that answered in time, asked holds the futures or
+    # tasks of every neighbor and late the ones still running
+    def collect_answers(self, query, asked, late, response):
+        for future in set(asked) - late:
+            try:
+                response.extend(future.result())
+            except Exception as e:
+                log.warning("Super-peer %s got no answer from %s: %s", self.peer_id, asked[future].peer_id, e)
+        if late and query["message_id"] in self.cancelled:
+            log.debug("Super-peer %s stopped waiting on %d neighbors, query was cancelled.", self.peer_id, len(late))
+            return
+        for future in late:
+            self.metrics.incr("query_timeouts")
+            log.warning("Super-peer %s gave up waiting on %s.", self.peer_id, asked[future].peer_id)
+
+    # asks one neighbor, hits from a streamed answer are passed on the moment they arrive
+    def ask_neighbor(self, neighbor, query, budget, emit):
+        if not emit:
+            return self.pool.request(neighbor.port, query, budget)
+        hits = []
+        for hit in self.pool.stream(neighbor.port, query, budget):
+            if query["message_id"] in self.cancelled:
+                break
+            hits.append(hit)
+            emit(hit)
+        return hits
+
+    async def ask_neighbor_async(self, neighbor, query, budget, emit):
+        if not emit:
+            return await self.pool.request_async(neighbor.port, query, budget)
+        hits = []
+        async with aclosing(self.pool.stream_async(neighbor.port, query, budget)) as stream:
+            async for hit in stream:
+                if query["message_id"] in self.cancelled:
                     break
-                                     
+                hits.append(hit)
+                emit(hit)
+        return hits
+
+    # the leaf has what it needs, stop forwarding and tell the neighbors to stop as well
+    def cancel_query(self, message):
+        message_id = message["message_id"]
+        if not self.cancelled.add(message_id):
+            return
+        log.debug("Super-peer %s cancelled query %s.", self.peer_id, message_id)
+        for neighbor in self.neighbor_peers:
+            try:
+                self.pool.send(neighbor.port, message)
+            except Exception as e:
+                log.warning("Error propagating QUERY_CANCEL to neighbor %s: %s", neighbor.peer_id, e)
 
     # adds leaf nodes to superpeers
     def add_leaf_node(self, leaf_node):
         self.leaf_nodes[leaf_node.node_id] = leaf_node
-        for file in leaf_node.files:
-            if file not in self.registered_files:
-                self.registered_files[file] = []
-            self.registered_files[file].append(leaf_node.node_id)
-        print(f"Leaf-node {leaf_node.node_id} registered with Super-peer {self.peer_id}.")
+        with self.lock:
+            self.apply_registration(leaf_node.node_id, set(leaf_node.files), set())
+        log.info("Leaf-node %s registered with Super-peer %s.", leaf_node.node_id, self.peer_id)
+
+#
+# main
+#
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python super_peer.py <all_to_all.json/linear.json> <peer_id> [--mode=push/pull] [--engine=thread/asyncio] "
+              "[--codec=json/binary] [--lookup=flood/dht] [--flush=<seconds>] [--batch=<n>] [--log=debug/info/warning] "
+              "[--metrics=<stats file>]")
+        sys.exit(1)
+
+    from invalidation_batcher import FLUSH_INTERVAL, MAX_BATCH
+    from network_setup import start_super_peer, load_config, parse_flags
+    from metrics import configure_logging
+
+    config_file, peer_id = sys.argv[1:3]
+    options = parse_flags(sys.argv[3:], {"mode": "push", "engine": "thread", "codec": "json", "lookup": "flood",
+                                         "flush": FLUSH_INTERVAL, "batch": MAX_BATCH, "log": "info", "metrics": ""})
+    configure_logging(options["log"])
+    super_peer = start_super_peer(load_config(config_file), peer_id, options["mode"], options["engine"],
+                                  options["codec"], options["lookup"], flush=options["flush"], batch=options["batch"])
+    if options["metrics"]:
+        super_peer.metrics.start_dump(options["metrics"], super_peer.stats)
+
+    # invalidations still waiting in the batch go out before the process ends
+    def stop(signum, frame):
+        super_peer.invalidations.send_pending()
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    if not super_peer.ready.wait(10):
+        log.error("Super-peer %s could not start its server on port %s.", peer_id, super_peer.port)
+        os._exit(1)
+    # the launcher waits for this line before starting anything that talks to this peer
+    print(f"READY {peer_id} {super_peer.port}", flush=True)
+    while True:
+        signal.pause()
@@ -0,0 +1,216 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# swarm.py downloads one file from every leaf node that answered the query at once. the
+# file is split into fixed size chunks, each holder gets a worker that keeps taking the next
+# missing chunk, so fast holders end up serving most of the file. every chunk is checked
+# against the sha256 list from the holder's manifest before it is written, and the chunks
+# already done are kept in a chunk map next to the partial file so a download that was
+# interrupted picks up where it stopped
+#
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from protocol import send_message, recv_message, recv_exact
+from metrics import MeteredSocket
+
+HOST = 'localhost'
+CHUNK_SIZE = 1024 * 1024
+MAX_FAILURES = 3  # bad or failed chunks before a holder is dropped from the swarm
+SLOW_RATIO = 4  # a holder this many times slower than the fastest one stops taking new chunks
+MIN_SAMPLES = 2  # chunks a holder must finish before it is judged slow
+
+log = logging.getLogger("swarm")
+
+# sha256 of every chunk of a file, what holders send back for a file_manifest request
+def chunk_hashes(file_path, chunk_size=CHUNK_SIZE):
+    hashes = []
+    with open(file_path, "rb") as file:
+        while True:
+            data = file.read(chunk_size)
+            if not data:
+                break
+            hashes.append(hashlib.sha256(data).hexdigest())
+    return hashes
+
+#
+# one holder of the file and how it has been doing
+#
+class Holder:
+    def __init__(self, leaf_id):
+        self.leaf_id = leaf_id
+        self.port = 6000 + int(leaf_id[1:])
+        self.chunks = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.failures = 0
+        self.dropped = False
+
+    def rate(self):
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+#
+# Swarm download class, one per file being fetched
+#
+class SwarmDownload:
+    def __init__(self, leaf, file_name, holders, chunk_size=CHUNK_SIZE):
+        self.leaf = leaf
+        self.file_name = file_name
+        self.holders = [Holder(h) for h in dict.fromkeys(holders)]
+        self.chunk_size = chunk_size
+        self.file_path = os.path.join(leaf.directory, file_name)
+        self.partial_path = self.file_path + ".part"
+        self.map_path = os.path.join(leaf.directory, f".{file_name}.chunks")
+        self.lock = threading.Lock()
+        self.size = 0
+        self.hashes = []
+        self.version = 1  # version of the file the manifest describes
+        self.done = set()
+        self.in_flight = {}  # {chunk index: number of workers fetching it}
+        self.fd = None
+
+    # runs the download, returns the number of bytes fetched over the network
+    def run(self):
+        manifest = self.get_manifest()
+        self.size = manifest["size"]
+        self.hashes = manifest["hashes"]
+        self.version = manifest.get("version", 1)
+        self.load_chunk_map()
+        resumed = len(self.done)
+        if resumed:
+            log.info("Leaf-node %s resuming '%s' with %d of %d chunks on disk.", self.leaf.node_id, self.file_name, resumed, len(self.hashes))
+
+        flags = os.O_RDWR | os.O_CREAT
+        self.fd = os.open(self.partial_path, flags, 0o644)
+        try:
+            if os.fstat(self.fd).st_size != self.size:
+                os.ftruncate(self.fd, self.size)
+            workers = [threading.Thread(target=self.worker, args=(h,)) for h in self.holders]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+        finally:
+            os.close(self.fd)
+
+        missing = len(self.hashes) - len(self.done)
+        if missing:
+            raise ConnectionError(f"Swarm for '{self.file_name}' stopped with {missing} chunks missing")
+        os.replace(self.partial_path, self.file_path)
+        os.remove(self.map_path)
+        for h in self.holders:
+            log.info("  %s: %d chunks, %.2f MB/s, %d failures", h.leaf_id, h.chunks, h.rate() / 1e6, h.failures)
+        return sum(h.bytes for h in self.holders)
+
+    # every holder is asked in turn until one returns a manifest
+    def get_manifest(self):
+        request = {"type": "file_manifest", "file_name": self.file_name, "chunk_size": self.chunk_size}
+        for h in self.holders:
+            try:
+                reply = self.leaf.pool.request(h.port, request)
+            except (OSError, TimeoutError) as e:
+                log.warning("Leaf-node %s could not get a manifest from %s: %s", self.leaf.node_id, h.leaf_id, e)
+                continue
+            if reply.get("status") == "OK":
+                return reply
+        raise ConnectionError(f"No holder of '{self.file_name}' sent a manifest")
+
+    # a chunk map is only trusted when it was written for the same version of the file
+    def load_chunk_map(self):
+        if not (os.path.exists(self.map_path) and os.path.exists(self.partial_path)):
+            return
+        try:
+            with open(self.map_path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get("size") == self.size and saved.get("hashes") == self.hashes \
+                and saved.get("chunk_size") == self.chunk_size:
+            self.done = set(saved["done"])
+
+    # written to a temporary file and renamed so a crash never leaves half a map behind
+    def save_chunk_map(self):
+        state = {"size": self.size, "chunk_size": self.chunk_size,
+                 "hashes": self.hashes, "done": sorted(self.done)}
+        tmp_path = self.map_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.map_path)
+
+    # picks the next missing chunk nobody is fetching. once none are left an idle worker
+    # takes a copy of a chunk still in flight, so the last chunks are not stuck on a slow holder
+    def next_chunk(self):
+        with self.lock:
+            missing = [i for i in range(len(self.hashes)) if i not in self.done]
+            if not missing:
+                return None
+            for i in missing:
+                if i not in self.in_flight:
+                    self.in_flight[i] = 1
+                    return i
+            i = min(missing, key=lambda c: self.in_flight.get(c, 0))
+            self.in_flight[i] = self.in_flight.get(i, 0) + 1
+            return i
+
+    def release_chunk(self, index):
+        with self.lock:
+            count = self.in_flight.get(index, 0) - 1
+            if count > 0:
+                self.in_flight[index] = count
+            else:
+                self.in_flight.pop(index, None)
+
+    def too_slow(self, holder):
+        with self.lock:
+            rates = [h.rate() for h in self.holders if not h.dropped and h.chunks >= MIN_SAMPLES]
+        return holder.chunks >= MIN_SAMPLES and len(rates) > 1 and holder.rate() * SLOW_RATIO < max(rates)
+
+    def worker(self, holder):
+        while not holder.dropped:
+            if self.too_slow(holder):
+                log.info("Leaf-node %s stopped taking chunks from slow holder %s.", self.leaf.node_id, holder.leaf_id)
+                holder.dropped = True
+                break
+            index = self.next_chunk()
+            if index is None:
+                break
+            try:
+                self.fetch_chunk(holder, index)
+            except (OSError, ValueError) as e:
+                holder.failures += 1
+                log.warning("Chunk %d of '%s' from %s failed: %s", index, self.file_name, holder.leaf_id, e)
+                if holder.failures >= MAX_FAILURES:
+                    holder.dropped = True
+            finally:
+                self.release_chunk(index)
+
+    # fetches one byte range with a file_transfer request and writes it in place
+    def fetch_chunk(self, holder, index):
+        offset = index * self.chunk_size
+        length = min(self.chunk_size, self.size - offset)
+        start = time.time()
+        with socket.create_connection((HOST, holder.port)) as raw:
+            s = MeteredSocket(raw, self.leaf.metrics)
+            request = {"type": "file_transfer", "file_name": self.file_name, "requester": self.leaf.node_id,
+                       "offset": offset, "length": length}
+            send_message(s, request, self.leaf.codec)
+            response, _ = recv_message(s)
+            if not response or response.get("status") != "SENDING" or response.get("size") != length:
+                raise ValueError(f"holder did not send the range, replied {response}")
+            data = recv_exact(s, length)
+        if hashlib.sha256(data).hexdigest() != self.hashes[index]:
+            raise ValueError("hash does not match the manifest")
+        with self.lock:
+            if index in self.done:
+                return  # another worker finished the same chunk first
+            os.pwrite(self.fd, data, offset)
+            self.done.add(index)
+            self.save_chunk_map()
+            holder.chunks += 1
+            holder.bytes += length
+            holder.seconds += time.time() - start
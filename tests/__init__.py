@@ -0,0 +1,7 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# unit tests for the parts of a node that work without a network, run with python -m pytest
+# from the project directory
+#
@@ -0,0 +1,90 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_chunk_store.py keeps copies in a chunk store under a temporary directory and checks
+# chunks are stored once, shared between files and deleted with the last file using them
+#
+import hashlib
+import os
+from chunk_store import ChunkStore
+
+CHUNK = 16
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+def digests(data):
+    return [hashlib.sha256(data[i:i + CHUNK]).hexdigest() for i in range(0, len(data), CHUNK)]
+
+def test_keep_splits_into_chunks(tmp_path):
+    store = ChunkStore(str(tmp_path / ".chunks"), chunk_size=CHUNK)
+    data = bytes(range(40))
+    store.keep("file1.txt", write(tmp_path, "file1.txt", data))
+    assert "file1.txt" in store
+    assert store.manifests["file1.txt"] == digests(data)
+    assert b"".join(store.get(d) for d in digests(data)) == data
+    assert store.stats() == {"files": 1, "chunks": 3, "references": 3}
+
+# an appended line only changes the last chunk, the others are stored once for both files
+def test_chunks_shared_between_files(tmp_path):
+    store = ChunkStore(str(tmp_path / ".chunks"), chunk_size=CHUNK)
+    old = b"a" * 16 + b"b" * 16 + b"c" * 8
+    new = old + b"d" * 8
+    store.keep("file1.txt", write(tmp_path, "file1.txt", old))
+    store.keep("file2.txt", write(tmp_path, "file2.txt", new))
+    assert store.stats() == {"files": 2, "chunks": 4, "references": 6}
+    store.release("file1.txt")
+    assert "file1.txt" not in store
+    assert all(store.has(d) for d in digests(new))
+    assert not store.has(digests(old)[2])
+    store.release("file2.txt")
+    assert not any(store.has(d) for d in digests(new))
+    assert store.stats() == {"files": 0, "chunks": 0, "references": 0}
+
+# keeping a newer copy of the same file drops the chunks only the older one used
+def test_keep_again_replaces(tmp_path):
+    store = ChunkStore(str(tmp_path / ".chunks"), chunk_size=CHUNK)
+    old = b"a" * 16 + b"b" * 16
+    new = b"a" * 16 + b"x" * 16
+    store.keep("file1.txt", write(tmp_path, "file1.txt", old))
+    store.keep("file1.txt", write(tmp_path, "file1.txt", new))
+    assert store.manifests["file1.txt"] == digests(new)
+    assert store.has(digests(new)[0]) and store.has(digests(new)[1])
+    assert not store.has(digests(old)[1])
+
+def test_put_and_get(tmp_path):
+    store = ChunkStore(str(tmp_path / ".chunks"), chunk_size=CHUNK)
+    digest = hashlib.sha256(b"hello").hexdigest()
+    assert not store.has(digest)
+    store.put(digest, b"hello")
+    store.put(digest, b"other")  # already stored, not written again
+    assert store.get(digest) == b"hello"
+    assert os.path.exists(os.path.join(str(tmp_path / ".chunks"), digest[:2], digest))
+
+def test_release_unknown_file(tmp_path):
+    store = ChunkStore(str(tmp_path / ".chunks"), chunk_size=CHUNK)
+    store.release("file1.txt")
+    assert not os.path.exists(store.index_path)
+
+# the list of kept files survives a restart, with the reference counts rebuilt from it
+def test_index_reloaded(tmp_path):
+    directory = str(tmp_path / ".chunks")
+    store = ChunkStore(directory, chunk_size=CHUNK)
+    data = b"a" * 16 + b"b" * 16
+    store.keep("file1.txt", write(tmp_path, "file1.txt", data))
+    store.keep("file2.txt", write(tmp_path, "file2.txt", data[:16]))
+    again = ChunkStore(directory, chunk_size=CHUNK)
+    assert again.manifests == store.manifests
+    assert again.stats() == store.stats()
+    again.release("file2.txt")
+    assert again.has(digests(data)[0])
+
+def test_broken_index_ignored(tmp_path):
+    directory = tmp_path / ".chunks"
+    directory.mkdir()
+    (directory / "manifests.json").write_text("{not json")
+    store = ChunkStore(str(directory), chunk_size=CHUNK)
+    assert store.stats() == {"files": 0, "chunks": 0, "references": 0}
@@ -0,0 +1,190 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_connection_pool.py runs the pool against a small peer on a local socket that answers
+# every request with a req_id, and checks connections are reused, replies find the request
+# that asked and a dropped connection is opened again
+#
+import asyncio
+import socket
+import threading
+import time
+import pytest
+import connection_pool
+from connection_pool import ConnectionPool
+from protocol import recv_message, send_message, wrap_reply
+
+#
+# a peer that replies {"n": n} to a request after its "delay", and never to a "silent" one.
+# a request with "parts" gets that many streamed replies first
+#
+class Peer:
+    def __init__(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("localhost", 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.received = []
+        self.clients = []
+        self.send_lock = threading.Lock()  # replies from several threads never interleave
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            self.clients.append(client)
+            threading.Thread(target=self.serve, args=(client,), daemon=True).start()
+
+    def serve(self, client):
+        try:
+            while True:
+                message, codec = recv_message(client)
+                if message is None:
+                    return
+                self.received.append(message)
+                if "req_id" in message and not message.get("silent"):
+                    threading.Thread(target=self.reply, args=(client, message, codec), daemon=True).start()
+        except OSError:
+            pass
+
+    def reply(self, client, message, codec):
+        time.sleep(message.get("delay", 0))
+        with self.send_lock:
+            for part in range(message.get("parts", 0)):
+                send_message(client, wrap_reply(message, part, more=True), codec)
+            send_message(client, wrap_reply(message, {"n": message.get("n")}), codec)
+
+    # drops every connection it has, as a restarted peer would
+    def drop(self):
+        for client in self.clients:
+            client.shutdown(socket.SHUT_RDWR)
+            client.close()
+        self.clients = []
+
+    def close(self):
+        self.drop()
+        self.server.close()
+
+@pytest.fixture
+def peer():
+    peer = Peer()
+    yield peer
+    peer.close()
+
+def wait_until(check, limit=3):
+    deadline = time.time() + limit
+    while not check() and time.time() < deadline:
+        time.sleep(0.01)
+    return check()
+
+def test_one_connection_reused(peer):
+    pool = ConnectionPool()
+    pool.send(peer.port, {"type": "CLEANUP", "n": 0})
+    for n in range(1, 4):
+        assert pool.request(peer.port, {"type": "PULL", "n": n}) == {"n": n}
+    assert wait_until(lambda: len(peer.received) == 4)
+    assert [m["n"] for m in peer.received] == [0, 1, 2, 3]
+    assert len(peer.clients) == 1
+    assert pool.stats()["opened"] == 1 and pool.stats()["reused"] == 3
+
+# a slow reply does not hold up the ones behind it, and each goes to its own request
+def test_replies_reach_their_request(peer):
+    pool = ConnectionPool()
+    replies = {}
+
+    def ask(n, delay):
+        replies[n] = pool.request(peer.port, {"type": "PULL", "n": n, "delay": delay})
+
+    threads = [threading.Thread(target=ask, args=(n, 0.3 if n == 0 else 0)) for n in range(5)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert replies == {n: {"n": n} for n in range(5)}
+    assert time.time() - start < 1.5
+    assert len(peer.clients) == 1
+
+def test_reconnects_after_the_peer_drops(peer):
+    pool = ConnectionPool()
+    assert pool.request(peer.port, {"type": "PULL", "n": 1}) == {"n": 1}
+    conn = pool.connections[peer.port]
+    peer.drop()
+    assert wait_until(lambda: not conn.alive)
+    assert pool.request(peer.port, {"type": "PULL", "n": 2}) == {"n": 2}
+    pool.send(peer.port, {"type": "CLEANUP", "n": 3})
+    assert wait_until(lambda: len(peer.received) == 3)
+    assert pool.stats()["opened"] == 2
+
+def test_stream(peer):
+    pool = ConnectionPool()
+    stream = pool.stream(peer.port, {"type": "file_query", "n": 7, "parts": 3})
+    parts = []
+    with pytest.raises(StopIteration) as done:
+        while True:
+            parts.append(next(stream))
+    assert parts == [0, 1, 2]
+    assert done.value.value == {"n": 7}
+    assert pool.connections[peer.port].pending == {}
+
+# coroutines wait on the event loop, a slow reply does not hold up the others
+def test_request_async(peer):
+    pool = ConnectionPool()
+
+    async def ask():
+        return await asyncio.gather(*(pool.request_async(peer.port, {"type": "PULL", "n": n, "delay": 0.3 if n == 0 else 0})
+                                      for n in range(5)))
+
+    start = time.time()
+    assert asyncio.run(ask()) == [{"n": n} for n in range(5)]
+    assert time.time() - start < 1.5
+    assert pool.connections[peer.port].pending == {}
+
+def test_stream_async(peer):
+    pool = ConnectionPool()
+
+    async def ask():
+        return [part async for part in pool.stream_async(peer.port, {"type": "file_query", "n": 7, "parts": 3})]
+
+    assert asyncio.run(ask()) == [0, 1, 2]
+    assert pool.connections[peer.port].pending == {}
+
+def test_request_async_times_out(peer):
+    pool = ConnectionPool()
+    with pytest.raises(TimeoutError):
+        asyncio.run(pool.request_async(peer.port, {"type": "PULL", "silent": True}, timeout=0.2))
+    assert pool.connections[peer.port].pending == {}
+    assert asyncio.run(pool.request_async(peer.port, {"type": "PULL", "n": 1})) == {"n": 1}
+
+def test_request_times_out(peer):
+    pool = ConnectionPool()
+    with pytest.raises(TimeoutError):
+        pool.request(peer.port, {"type": "PULL", "silent": True}, timeout=0.2)
+    # the connection is still good for the next request
+    assert pool.request(peer.port, {"type": "PULL", "n": 1}) == {"n": 1}
+
+def test_peer_not_listening():
+    port = socket.create_server(("localhost", 0)).getsockname()[1]  # closed right away
+    pool = ConnectionPool()
+    with pytest.raises(OSError):
+        pool.send(port, {"type": "CLEANUP"})
+    assert pool.stats()["failed"] == 1
+
+# a connection idle for a while is pinged before it is trusted again
+def test_idle_connection_pinged(peer, monkeypatch):
+    monkeypatch.setattr(connection_pool, "CHECK_AFTER", 0)
+    pool = ConnectionPool()
+    pool.request(peer.port, {"type": "PULL", "n": 1})
+    time.sleep(0.01)
+    pool.request(peer.port, {"type": "PULL", "n": 2})
+    assert [m["type"] for m in peer.received] == ["PULL", "PING", "PULL"]
+
+def test_idle_connection_closed(peer):
+    pool = ConnectionPool(idle_timeout=0.5)
+    pool.send(peer.port, {"type": "CLEANUP"})
+    assert wait_until(lambda: pool.stats()["evicted"] == 1)
+    assert pool.stats()["open"] == 0
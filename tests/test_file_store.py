@@ -0,0 +1,91 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_file_store.py opens a store again after changes and checks the journal replays to
+# the same files and versions, and that compaction keeps the journal short
+#
+import os
+import file_store
+from file_store import FileStore, JOURNAL
+from file import File
+
+def make_file(directory, name):
+    with open(os.path.join(directory, name), "w") as f:
+        f.write(name)
+
+def journal_lines(directory):
+    with open(os.path.join(directory, JOURNAL)) as f:
+        return f.readlines()
+
+def test_replay(tmp_path):
+    directory = str(tmp_path)
+    for name in ("file1.txt", "file2.txt", "file3.txt"):
+        make_file(directory, name)
+    store = FileStore(directory, "L1")
+    store.add(File("file1.txt", "L1", True, "L1"))
+    store.add(File("file2.txt", "L1", True, "L7"))
+    store.add(File("file3.txt", "L1", True, "L1"))
+    store["file1.txt"].increment_version()
+    store["file1.txt"].increment_version()
+    store["file2.txt"].is_copy()
+    store["file2.txt"].set_version(5)
+    store["file2.txt"].invalidate()
+    store.remove("file3.txt")
+
+    replayed = FileStore(directory, "L1")
+    assert sorted(replayed.names()) == ["file1.txt", "file2.txt"]
+    assert replayed["file1.txt"].version == 3
+    copy = replayed["file2.txt"]
+    assert (copy.version, copy.copy, copy.valid, copy.origin_node) == (5, True, False, "L7")
+    assert replayed.copies() == ["file2.txt"]
+    # changes to a replayed file are journaled too
+    replayed["file1.txt"].increment_version()
+    assert FileStore(directory, "L1")["file1.txt"].version == 4
+
+def test_replay_drops_files_gone_from_disk(tmp_path):
+    directory = str(tmp_path)
+    make_file(directory, "file1.txt")
+    make_file(directory, "file2.txt")
+    store = FileStore(directory, "L1")
+    store.add(File("file1.txt", "L1", True, "L1"))
+    store.add(File("file2.txt", "L1", True, "L1"))
+    os.remove(os.path.join(directory, "file2.txt"))
+
+    replayed = FileStore(directory, "L1")
+    assert replayed.names() == ["file1.txt"]
+    # the journal was rewritten without it
+    assert len(journal_lines(directory)) == 1
+
+# a crash part way through a line loses that change only
+def test_replay_stops_at_a_torn_line(tmp_path):
+    directory = str(tmp_path)
+    make_file(directory, "file1.txt")
+    store = FileStore(directory, "L1")
+    store.add(File("file1.txt", "L1", True, "L1"))
+    store["file1.txt"].increment_version()
+    store.journal.close()
+    with open(os.path.join(directory, JOURNAL), "a") as f:
+        f.write('{"name":"file1.txt","vers')
+
+    replayed = FileStore(directory, "L1")
+    assert replayed["file1.txt"].version == 2
+    assert len(journal_lines(directory)) == 1
+
+def test_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_store, "COMPACT_MIN", 10)
+    directory = str(tmp_path)
+    make_file(directory, "file1.txt")
+    make_file(directory, "file2.txt")
+    store = FileStore(directory, "L1")
+    store.add(File("file1.txt", "L1", True, "L1"))
+    store.add(File("file2.txt", "L1", True, "L1"))
+    for _ in range(100):
+        store["file1.txt"].increment_version()
+        assert store.lines <= 10
+    assert store.stats()["journal_lines"] == store.lines == len(journal_lines(directory))
+
+    store.compact()
+    assert len(journal_lines(directory)) == 2
+    replayed = FileStore(directory, "L1")
+    assert (replayed["file1.txt"].version, replayed["file2.txt"].version) == (101, 1)
@@ -0,0 +1,34 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_hash_ring.py checks every super peer maps a file name to the same owner, and that
+# a super peer joining only takes names over from the others
+#
+from collections import Counter
+from hash_ring import HashRing
+
+PEERS = [f"SP{i}" for i in range(1, 11)]
+NAMES = [f"file{i}.txt" for i in range(2000)]
+
+def test_owner_agrees_on_every_peer():
+    ring = HashRing(PEERS)
+    shuffled = HashRing(list(reversed(PEERS)))
+    assert all(ring.owner(name) == shuffled.owner(name) for name in NAMES)
+    assert all(ring.owner(name) in PEERS for name in NAMES)
+
+def test_names_spread_over_every_peer():
+    owners = Counter(HashRing(PEERS).owner(name) for name in NAMES)
+    assert set(owners) == set(PEERS)
+    assert min(owners.values()) > len(NAMES) / len(PEERS) / 3
+
+def test_joining_peer_only_takes_names():
+    ring = HashRing(PEERS)
+    bigger = HashRing(PEERS + ["SP11"])
+    moved = [name for name in NAMES if ring.owner(name) != bigger.owner(name)]
+    assert moved
+    assert all(bigger.owner(name) == "SP11" for name in moved)
+
+def test_single_peer_owns_everything():
+    ring = HashRing(["SP1"])
+    assert {ring.owner(name) for name in NAMES} == {"SP1"}
@@ -0,0 +1,82 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_interest_table.py checks which super peers an invalidation has to reach as leaves
+# subscribe to copies and clean them up again
+#
+from interest_table import InterestTable
+
+# only a super peer's first leaf holding the file is reported, the other super peers
+# need to hear about nothing else
+def test_subscribe_reports_first_leaf():
+    interest = InterestTable()
+    assert interest.subscribe("file1.txt", "SP1", "L1")
+    assert not interest.subscribe("file1.txt", "SP1", "L1")
+    assert not interest.subscribe("file1.txt", "SP1", "L2")
+    assert interest.subscribe("file1.txt", "SP2", "L1")
+    assert interest.subscribe("file2.txt", "SP1", "L1")
+    interest.unsubscribe("file1.txt", "SP2", "L1")
+    assert interest.subscribe("file1.txt", "SP2", "L4")
+
+def test_peers_of_several_files():
+    interest = InterestTable()
+    interest.subscribe("file1.txt", "SP1", "L1")
+    interest.subscribe("file1.txt", "SP2", "L4")
+    interest.subscribe("file2.txt", "SP3", "L7")
+    assert interest.peers(["file1.txt"]) == {"SP1", "SP2"}
+    assert interest.peers(["file1.txt", "file2.txt"]) == {"SP1", "SP2", "SP3"}
+    assert interest.peers(["file3.txt"]) == set()
+
+# a super peer stays interested until the last of its leaves cleans up, and only that
+# cleanup is reported
+def test_unsubscribe():
+    interest = InterestTable()
+    interest.subscribe("file1.txt", "SP1", "L1")
+    interest.subscribe("file1.txt", "SP1", "L2")
+    interest.subscribe("file1.txt", "SP2", "L4")
+    assert not interest.unsubscribe("file1.txt", "SP1", "L1")
+    assert interest.peers(["file1.txt"]) == {"SP1", "SP2"}
+    assert interest.unsubscribe("file1.txt", "SP1", "L2")
+    assert interest.peers(["file1.txt"]) == {"SP2"}
+    assert interest.unsubscribe("file1.txt", "SP2", "L4")
+    assert interest.peers(["file1.txt"]) == set()
+    assert interest.stats() == {"files": 0, "subscriptions": 0}
+
+def test_unsubscribe_unknown():
+    interest = InterestTable()
+    interest.subscribe("file1.txt", "SP1", "L1")
+    assert not interest.unsubscribe("file1.txt", "SP2", "L1")
+    assert not interest.unsubscribe("file2.txt", "SP1", "L1")
+    assert not interest.unsubscribe("file1.txt", "SP1", "L9")
+    assert interest.peers(["file1.txt"]) == {"SP1"}
+
+def test_stats():
+    interest = InterestTable()
+    interest.subscribe("file1.txt", "SP1", "L1")
+    interest.subscribe("file1.txt", "SP1", "L2")
+    interest.subscribe("file1.txt", "SP2", "L4")
+    interest.subscribe("file2.txt", "SP2", "L4")
+    assert interest.stats() == {"files": 2, "subscriptions": 3}
+
+# every leaf of one super peer that holds a copy, so each of them hears about a new version
+def test_leaves_of_a_super_peer():
+    interest = InterestTable()
+    interest.subscribe("file1.txt", "SP1", "L1")
+    interest.subscribe("file1.txt", "SP1", "L2")
+    interest.subscribe("file1.txt", "SP2", "L4")
+    assert interest.leaves("file1.txt", "SP1") == {"L1", "L2"}
+    assert interest.leaves("file1.txt", "SP3") == set()
+    assert interest.leaves("file2.txt", "SP1") == set()
+
+# another super peer said its last leaf holding the file is gone
+def test_drop():
+    interest = InterestTable()
+    interest.subscribe("file1.txt", "SP1", "L1")
+    interest.subscribe("file1.txt", "SP2", "L4")
+    interest.subscribe("file1.txt", "SP2", "L5")
+    interest.drop("file1.txt", "SP2")
+    assert interest.peers(["file1.txt"]) == {"SP1"}
+    interest.drop("file1.txt", "SP1")
+    interest.drop("file2.txt", "SP1")
+    assert interest.stats() == {"files": 0, "subscriptions": 0}
@@ -0,0 +1,51 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_invalidation_batcher.py runs the batcher without its timer thread and checks what
+# each flush is handed
+#
+from invalidation_batcher import InvalidationBatcher, invalidation_entries
+
+def entry(file_name, version, origin="L1"):
+    return {"file_name": file_name, "origin_server_id": origin, "version_number": version}
+
+def batcher(max_batch=64):
+    batches = []
+    return InvalidationBatcher(batches.append, max_batch=max_batch, start=False), batches
+
+def test_newest_version_wins():
+    invalidations, batches = batcher()
+    invalidations.add(entry("file1.txt", 2))
+    invalidations.add(entry("file1.txt", 5))
+    invalidations.add(entry("file1.txt", 3))
+    invalidations.send_pending()
+    assert batches == [[entry("file1.txt", 5)]]
+    assert invalidations.stats() == {"added": 3, "coalesced": 2, "batches": 1, "pending": 0}
+
+def test_same_name_from_two_origins_kept_apart():
+    invalidations, batches = batcher()
+    invalidations.add(entry("file1.txt", 2, "L1"))
+    invalidations.add(entry("file1.txt", 4, "L7"))
+    invalidations.send_pending()
+    assert sorted(batches[0], key=lambda e: e["origin_server_id"]) == [entry("file1.txt", 2, "L1"),
+                                                                       entry("file1.txt", 4, "L7")]
+
+def test_full_batch_sent_at_once():
+    invalidations, batches = batcher(max_batch=2)
+    invalidations.add(entry("file1.txt", 2))
+    assert batches == []
+    invalidations.add(entry("file2.txt", 2))
+    assert batches == [[entry("file1.txt", 2), entry("file2.txt", 2)]]
+    assert invalidations.stats()["pending"] == 0
+
+def test_nothing_pending_sends_nothing():
+    invalidations, batches = batcher()
+    invalidations.send_pending()
+    assert batches == []
+
+# older nodes send one file per INVALIDATION without a files list
+def test_entries_of_single_file_message():
+    message = dict(entry("file1.txt", 3), type="INVALIDATION", msg_id="L1_1")
+    assert invalidation_entries(message) == [entry("file1.txt", 3)]
+    assert invalidation_entries({"files": [entry("file2.txt", 4)]}) == [entry("file2.txt", 4)]
@@ -0,0 +1,146 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_leaf_node.py builds a leaf node with the 'sim' engine, so it starts no server, in a
+# temporary directory and checks what it tells its super peer when one of its files changes
+# where a swarm downloaded copy says it came from and when a copy is put together from
+# the chunks it kept
+#
+import hashlib
+import os
+import pytest
+import leaf_node as leaf_node_module
+from leaf_node import LeafNode
+from file import File
+from chunk_store import ChunkStore
+
+#
+# stands in for the leaf's connection pool and keeps every message it is given
+#
+class Pool:
+    def __init__(self):
+        self.sent = []
+        self.replies = {}  # {message type: reply} for requests
+
+    def send(self, port, message):
+        self.sent.append(message)
+
+    def request(self, port, message):
+        self.sent.append(message)
+        return self.replies[message["type"]]
+
+def leaf_node(mode, files=("file1.txt",), copies=()):
+    records = {name: File(name, "L1", True, "L1") for name in files}
+    for name in copies:
+        records[name] = File(name, "L1", True, "L2")
+        records[name].is_copy()
+    leaf = LeafNode("L1", 7001, "SP1", records, list(records), 6001, mode, engine='sim', interactive=False)
+    leaf.pool = Pool()
+    for name in records:
+        with open(f"{leaf.directory}/{name}", "w") as f:
+            f.write("text")
+    return leaf
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "L1").mkdir()
+
+def deltas(leaf):
+    return [m for m in leaf.pool.sent if m["type"] == "REGISTER_DELTA"]
+
+# a pull mode origin pushes no invalidation, its super peer still has to hear the new version
+def test_edit_in_pull_mode_sends_version():
+    leaf = leaf_node("pull")
+    leaf.edit_file("file1.txt", "a new line")
+    leaf.edit_file("file1.txt", "another line")
+    assert [d["versions"] for d in deltas(leaf)] == [{"file1.txt": 2}, {"file1.txt": 3}]
+    assert [d["seq"] for d in deltas(leaf)] == [1, 2]
+    assert all(d["add"] == [] and d["remove"] == [] for d in deltas(leaf))
+    assert leaf.invalidations.pending == {}
+
+def test_edit_in_push_mode_sends_version():
+    leaf = leaf_node("push")
+    leaf.edit_file("file1.txt", "a new line")
+    assert [d["versions"] for d in deltas(leaf)] == [{"file1.txt": 2}]
+    assert list(leaf.invalidations.pending) == [("L1", "file1.txt")]
+
+def test_copy_not_edited():
+    leaf = leaf_node("pull", files=(), copies=("file2.txt",))
+    leaf.edit_file("file2.txt", "a new line")
+    assert leaf.pool.sent == []
+    assert leaf.files["file2.txt"].version == 1
+
+#
+# stands in for a swarm download, fails when it has no holders to fetch from
+#
+class Swarm:
+    def __init__(self, leaf, file_name, holders):
+        self.holders = holders
+        self.version = 3
+
+    def run(self):
+        if not self.holders:
+            raise ConnectionError("no holder could send a chunk")
+        return 100
+
+# a file swarmed from copies is a copy of their origin
+def test_swarm_copy_of_the_origin(monkeypatch):
+    monkeypatch.setattr(leaf_node_module, "SwarmDownload", Swarm)
+    leaf = leaf_node("push", files=())
+    hits = [{"leaf_node": "L4", "origin": "L9"}, {"leaf_node": "L9", "origin": "L9"}]
+    assert leaf.swarm_download("file9.txt", hits)
+    copy = leaf.files["file9.txt"]
+    assert copy.copy and copy.origin_node == "L9" and copy.version == 3
+    assert deltas(leaf)[0]["origins"] == {"file9.txt": "L9"}
+    assert [m["origin_node"] for m in leaf.pool.sent if m["type"] == "SUBSCRIBE"] == ["L9"]
+
+def test_swarm_failure_reported(monkeypatch):
+    monkeypatch.setattr(leaf_node_module, "SwarmDownload", Swarm)
+    leaf = leaf_node("push", files=())
+    assert not leaf.swarm_download("file9.txt", [{"leaf_node": "L1", "origin": "L1"}])
+    assert "file9.txt" not in leaf.files
+    assert leaf.metrics.stats()["counters"]["download_failures"] == 1
+
+DATA = bytes(range(40))
+
+# a copy of file9.txt that was invalidated, its chunks kept and the file deleted
+def invalidated_copy():
+    leaf = leaf_node("push", files=())
+    leaf.chunks = ChunkStore(f"{leaf.directory}/.chunks", chunk_size=16)
+    with open(f"{leaf.directory}/file9.txt", "wb") as f:
+        f.write(DATA)
+    leaf.chunks.keep("file9.txt", f"{leaf.directory}/file9.txt")
+    os.remove(f"{leaf.directory}/file9.txt")
+    hashes = [hashlib.sha256(DATA[i:i + 16]).hexdigest() for i in range(0, len(DATA), 16)]
+    leaf.pool.replies["file_manifest"] = {"status": "OK", "size": len(DATA), "chunk_size": 16,
+                                          "hashes": hashes, "version": 2}
+    return leaf, hashes
+
+def test_copy_rebuilt_from_kept_chunks():
+    leaf, _ = invalidated_copy()
+    assert leaf.retrieve_chunks("L9", "file9.txt") == (2, 0)
+    with open(f"{leaf.directory}/file9.txt", "rb") as f:
+        assert f.read() == DATA
+    assert "file9.txt" not in leaf.chunks
+
+# a kept chunk that went missing or is damaged sends the download to the whole file
+@pytest.mark.parametrize("damage", ["remove", "corrupt"])
+def test_bad_kept_chunk_downloads_whole_file(monkeypatch, damage):
+    leaf, hashes = invalidated_copy()
+    path = leaf.chunks.path(hashes[1])
+    if damage == "remove":
+        # released after the hashes were compared
+        monkeypatch.setattr(leaf.chunks, "has", lambda digest: True)
+        os.remove(path)
+    else:
+        with open(path, "wb") as f:
+            f.write(b"x" * 16)
+    assert leaf.retrieve_chunks("L9", "file9.txt") == (None, 0)
+    assert not os.path.exists(f"{leaf.directory}/file9.txt.part")
+    whole = []
+    monkeypatch.setattr(leaf, "retrieve_whole", lambda leaf_node_id, file_name: whole.append(file_name) or (2, len(DATA)))
+    assert leaf.retrieve_file("L9", "file9.txt")
+    assert whole == ["file9.txt"]
+    assert "file9.txt" not in leaf.chunks and leaf.files["file9.txt"].version == 2
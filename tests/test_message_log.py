@@ -0,0 +1,72 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_message_log.py checks that message ids are remembered until they are too old or the
+# log is full, on a clock the test moves by hand
+#
+import pytest
+import message_log
+from message_log import MessageLog
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(message_log, "time", clock)
+    return clock
+
+def test_duplicates_refused(clock):
+    log = MessageLog()
+    assert log.add("SP1_1")
+    assert not log.add("SP1_1")
+    assert "SP1_1" in log
+    assert "SP1_2" not in log
+
+def test_ids_expire(clock):
+    log = MessageLog(max_age=10)
+    log.add("SP1_1")
+    clock.now += 5
+    log.add("SP1_2")
+    clock.now += 6
+    # too old to count even before the next add trims it
+    assert "SP1_1" not in log
+    assert "SP1_2" in log
+    assert log.add("SP1_1")
+    assert log.stats()["expired"] == 1
+    assert len(log) == 2
+
+def test_oldest_evicted_when_full(clock):
+    log = MessageLog(max_entries=3)
+    for i in range(5):
+        clock.now += 1
+        log.add(f"SP1_{i}")
+    assert len(log) == 3
+    assert "SP1_0" not in log and "SP1_1" not in log
+    assert all(f"SP1_{i}" in log for i in range(2, 5))
+    assert log.stats()["evicted"] == 2
+
+def test_values_expire_with_their_id(clock):
+    log = MessageLog(max_age=10)
+    log["file1.txt"] = 3
+    assert log.get("file1.txt") == 3
+    clock.now += 11
+    assert log.get("file1.txt") is None
+    with pytest.raises(KeyError):
+        log["file1.txt"]
+
+# an id logged again keeps its new time when the old entry falls off
+def test_relogged_id_survives_its_old_entry(clock):
+    log = MessageLog(max_age=10)
+    log["file1.txt"] = 1
+    clock.now += 6
+    log["file1.txt"] = 2
+    clock.now += 6
+    log.add("other")
+    assert log.get("file1.txt") == 2
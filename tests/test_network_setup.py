@@ -0,0 +1,27 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_network_setup.py checks the command line flags are read with the type of their
+# default and that a super peer started from a config gets the batching it was given
+#
+import os
+import pytest
+from network_setup import load_config, parse_flags, start_super_peer
+from invalidation_batcher import FLUSH_INTERVAL, MAX_BATCH
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "all_to_all.json")
+
+def test_flags_take_the_type_of_their_default():
+    defaults = {"mode": "push", "flush": FLUSH_INTERVAL, "batch": MAX_BATCH, "seed": None}
+    options = parse_flags(["--flush=0.2", "--batch=8", "--seed=7"], defaults)
+    assert options == {"mode": "push", "flush": 0.2, "batch": 8, "seed": 7}
+    with pytest.raises(ValueError):
+        parse_flags(["--flsuh=0.2"], defaults)
+
+def test_super_peer_batching():
+    config = load_config(CONFIG)
+    sp = start_super_peer(config, "SP1", "push", engine='sim')
+    assert (sp.invalidations.interval, sp.invalidations.max_batch) == (FLUSH_INTERVAL, MAX_BATCH)
+    sp = start_super_peer(config, "SP1", "push", engine='sim', flush=0.5, batch=4)
+    assert (sp.invalidations.interval, sp.invalidations.max_batch) == (0.5, 4)
@@ -0,0 +1,79 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_protocol.py sends messages over a socket pair and checks they come out as they went
+# in, framed as json or binary and unframed the way older nodes send them
+#
+import asyncio
+import json
+import socket
+import pytest
+from protocol import (encode, send_message, recv_message, read_message, wrap_reply, HEADER, MAGIC,
+                      LEGACY, JSON, BINARY, MAX_MESSAGE)
+
+MESSAGE = {"type": "file_query", "file_name": "file1.txt", "TTL": 5, "stream": True, "cancel": None,
+           "rate": 1.5, "path": ["SP1", "SP2"], "versions": {"file1.txt": 3}, "text": "café"}
+
+@pytest.fixture
+def pair():
+    a, b = socket.socketpair()
+    yield a, b
+    a.close()
+    b.close()
+
+@pytest.mark.parametrize("codec", [JSON, BINARY])
+def test_framed_round_trip(pair, codec):
+    a, b = pair
+    send_message(a, MESSAGE, codec)
+    assert recv_message(b) == (MESSAGE, codec)
+
+# the frame says how long it is, file bytes sent right behind it are left in the socket
+@pytest.mark.parametrize("codec", [JSON, BINARY])
+def test_frame_leaves_following_bytes(pair, codec):
+    a, b = pair
+    a.sendall(encode({"status": "SENDING", "size": 4}, codec) + b"data")
+    assert recv_message(b) == ({"status": "SENDING", "size": 4}, codec)
+    assert b.recv(4) == b"data"
+
+def test_legacy_round_trip(pair):
+    a, b = pair
+    data = json.dumps(MESSAGE).encode()
+    # an older node's message may arrive in pieces
+    a.sendall(data[:5])
+    a.sendall(data[5:])
+    assert recv_message(b) == (MESSAGE, LEGACY)
+
+def test_legacy_encode_has_no_header():
+    assert encode(MESSAGE, LEGACY) == json.dumps(MESSAGE).encode()
+
+def test_eof_before_a_message(pair):
+    a, b = pair
+    a.close()
+    assert recv_message(b) == (None, None)
+
+def test_oversized_frame_refused(pair):
+    a, b = pair
+    a.sendall(HEADER.pack(MAGIC, JSON, MAX_MESSAGE + 1))
+    with pytest.raises(ValueError):
+        recv_message(b)
+
+def test_binary_refuses_unknown_types():
+    with pytest.raises(TypeError):
+        encode({"files": {1, 2}}, BINARY)
+
+@pytest.mark.parametrize("data, codec", [(encode(MESSAGE, JSON), JSON), (encode(MESSAGE, BINARY), BINARY),
+                                         (json.dumps(MESSAGE).encode(), LEGACY)])
+def test_async_read(data, codec):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_message(reader)
+
+    assert asyncio.run(read()) == (MESSAGE, codec)
+
+def test_reply_carries_request_id():
+    assert wrap_reply({"req_id": 7}, [1]) == {"req_id": 7, "reply": [1]}
+    assert wrap_reply({"req_id": 7}, [1], more=True) == {"req_id": 7, "reply": [1], "more": True}
+    assert wrap_reply({"type": "PING"}, {"type": "PONG"}) == {"type": "PONG"}
@@ -0,0 +1,78 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_query_cache.py checks cached QueryHits are handed out until they expire, are
+# invalidated or pushed out by newer files, on a clock the test moves by hand
+#
+import pytest
+import query_cache
+from query_cache import QueryCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache, "time", clock)
+    return clock
+
+def hits(*leaves):
+    return [{"type": "QueryHit", "leaf_node": leaf, "file_name": "file1.txt"} for leaf in leaves]
+
+def test_answers_from_cache(clock):
+    cache = QueryCache()
+    assert cache.get("file1.txt") is None
+    cache.put("file1.txt", hits("L1", "L7"))
+    assert cache.get("file1.txt") == hits("L1", "L7")
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "entries": 1}
+
+# a caller adding to the list it got back does not change the cached answer
+def test_hands_out_copies(clock):
+    cache = QueryCache()
+    cache.put("file1.txt", hits("L1"))
+    cache.get("file1.txt").append(hits("L2")[0])
+    assert cache.get("file1.txt") == hits("L1")
+
+def test_entries_expire(clock):
+    cache = QueryCache(ttl=30)
+    cache.put("file1.txt", hits("L1"))
+    clock.now += 30
+    assert cache.get("file1.txt") == hits("L1")
+    clock.now += 1
+    assert cache.get("file1.txt") is None
+    assert cache.stats()["entries"] == 0
+
+def test_invalidate(clock):
+    cache = QueryCache()
+    cache.put("file1.txt", hits("L1"))
+    cache.put("file2.txt", hits("L2"))
+    cache.invalidate("file1.txt")
+    cache.invalidate("file3.txt")
+    assert cache.get("file1.txt") is None
+    assert cache.get("file2.txt") == hits("L2")
+
+def test_least_recently_used_dropped(clock):
+    cache = QueryCache(max_entries=2)
+    cache.put("file1.txt", hits("L1"))
+    cache.put("file2.txt", hits("L2"))
+    cache.get("file1.txt")
+    cache.put("file3.txt", hits("L3"))
+    assert cache.get("file2.txt") is None
+    assert cache.get("file1.txt") == hits("L1")
+    assert cache.get("file3.txt") == hits("L3")
+    assert cache.stats()["evictions"] == 1
+
+# a new answer for a file replaces the old one and starts its time over
+def test_put_replaces(clock):
+    cache = QueryCache(ttl=30)
+    cache.put("file1.txt", hits("L1"))
+    clock.now += 20
+    cache.put("file1.txt", hits("L1", "L2"))
+    clock.now += 20
+    assert cache.get("file1.txt") == hits("L1", "L2")
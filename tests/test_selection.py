@@ -0,0 +1,70 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_selection.py checks the order a download tries holders in and the upload slots that
+# decide when a holder answers BUSY
+#
+from selection import SourceStats, UploadSlots, rank, order, choose
+
+def hit(leaf_node, **hints):
+    return dict({"type": "QueryHit", "leaf_node": leaf_node, "file_name": "file1.txt"}, **hints)
+
+def names(hits):
+    return [h["leaf_node"] for h in hits]
+
+def test_old_versions_go_last():
+    hits = [hit("L1", version=2, rate=100), hit("L2", version=3, rate=10)]
+    assert names(rank(hits, SourceStats())) == ["L2", "L1"]
+
+def test_full_holders_after_free_ones():
+    hits = [hit("L1", uploads=4, limit=4, rate=100), hit("L2", uploads=3, limit=4, rate=10)]
+    assert names(rank(hits, SourceStats())) == ["L2", "L1"]
+
+def test_no_limit_is_never_full():
+    hits = [hit("L1", uploads=50, limit=0, rate=1000), hit("L2", uploads=0, limit=4, rate=10)]
+    assert names(rank(hits, SourceStats())) == ["L1", "L2"]
+
+# the expected rate is the holder's rate split over its uploads and the new one
+def test_rate_per_upload():
+    hits = [hit("L1", uploads=3, limit=8, rate=100), hit("L2", uploads=0, limit=8, rate=40),
+            hit("L3", uploads=1, limit=8, rate=60)]
+    assert names(rank(hits, SourceStats())) == ["L2", "L3", "L1"]
+
+def test_measured_rate_beats_reported():
+    stats = SourceStats()
+    stats.finished("L1", size=10, duration=1)
+    hits = [hit("L1", rate=1000), hit("L2", rate=100)]
+    assert names(rank(hits, stats)) == ["L2", "L1"]
+
+def test_our_own_downloads_count_as_load():
+    stats = SourceStats()
+    for _ in range(4):
+        stats.started("L1")
+    hits = [hit("L1", uploads=0, limit=4, rate=1000), hit("L2", uploads=0, limit=4, rate=10)]
+    assert names(rank(hits, stats)) == ["L2", "L1"]
+
+def test_unmeasured_first_then_nearest():
+    hits = [hit("L1", hops=3, rate=100), hit("L2", hops=2), hit("L3", hops=1)]
+    assert names(rank(hits, SourceStats())) == ["L3", "L2", "L1"]
+
+def test_order_tries_chosen_first():
+    hits = [hit("L1", rate=10), hit("L2", rate=100), hit("L3", rate=50)]
+    assert names(order("ranked", hits, SourceStats())) == ["L2", "L3", "L1"]
+    assert names(order("first", hits, SourceStats())) == ["L1", "L2", "L3"]
+    assert names(order("ranked", hits, SourceStats(), chosen=hits[2])) == ["L3", "L2", "L1"]
+
+def test_unknown_policy():
+    try:
+        choose("nearest", [hit("L1")], SourceStats())
+    except ValueError:
+        return
+    assert False, "an unknown policy was accepted"
+
+def test_upload_slots():
+    slots = UploadSlots(limit=2)
+    assert slots.acquire() and slots.acquire()
+    assert not slots.acquire()
+    slots.release(size=100, duration=1)
+    assert slots.acquire()
+    assert slots.stats() == {"uploads": 2, "rate": 100, "limit": 2, "busy": 1}
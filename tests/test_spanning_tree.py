@@ -0,0 +1,74 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_spanning_tree.py follows a broadcast the way the super peers forward it, each asking
+# the tree for its own children, and checks it reaches every peer once, around broken links
+# and only towards targets when they are given
+#
+from spanning_tree import SpanningTree
+
+# SP1 - SP2 - SP3
+#  |  \  |     |
+# SP4 - SP5 - SP6
+TOPOLOGY = {"SP1": ["SP2", "SP4", "SP5"], "SP2": ["SP1", "SP3", "SP5"], "SP3": ["SP2", "SP6"],
+            "SP4": ["SP1", "SP5"], "SP5": ["SP1", "SP2", "SP4", "SP6"], "SP6": ["SP3", "SP5"]}
+
+# {peer: the peer it got the message from} for one broadcast, every peer working out its
+# children on a tree of its own as separate super peers would
+def broadcast(root, avoid=(), targets=None):
+    parents = {root: None}
+    waiting = [root]
+    while waiting:
+        peer = waiting.pop()
+        for child in SpanningTree(TOPOLOGY).children(root, peer, avoid, targets):
+            assert child not in parents, f"{child} got the broadcast twice"
+            assert child in TOPOLOGY[peer]
+            parents[child] = peer
+            waiting.append(child)
+    return parents
+
+def test_every_peer_reached_once():
+    for root in TOPOLOGY:
+        parents = broadcast(root)
+        assert set(parents) == set(TOPOLOGY)
+
+def test_breadth_first_from_root():
+    tree = SpanningTree(TOPOLOGY)
+    assert tree.children("SP1", "SP1") == ["SP2", "SP4", "SP5"]
+    assert tree.children("SP1", "SP2") == ["SP3"]
+    assert tree.children("SP1", "SP5") == ["SP6"]
+    assert tree.children("SP1", "SP4") == []
+
+def test_repair_around_broken_links():
+    avoid = [["SP1", "SP2"], ["SP6", "SP5"]]
+    parents = broadcast("SP1", avoid)
+    assert set(parents) == set(TOPOLOGY)
+    used = {frozenset((peer, parent)) for peer, parent in parents.items() if parent}
+    assert frozenset(("SP1", "SP2")) not in used and frozenset(("SP5", "SP6")) not in used
+
+# a peer cut off by the broken links is left out instead of sent to twice
+def test_unreachable_peer_left_out():
+    parents = broadcast("SP1", [["SP2", "SP3"], ["SP5", "SP6"], ["SP3", "SP6"]])
+    assert set(parents) == set(TOPOLOGY) - {"SP3", "SP6"}
+
+def test_targets_prune_branches():
+    parents = broadcast("SP1", targets={"SP3"})
+    assert set(parents) == {"SP1", "SP2", "SP3"}
+    assert broadcast("SP1", targets=set()) == {"SP1": None}
+
+def test_marked_links_come_back():
+    tree = SpanningTree(TOPOLOGY, down_for=0)
+    tree.mark_down("SP1", "SP2")
+    assert tree.down_links() == []
+    tree = SpanningTree(TOPOLOGY)
+    tree.mark_down("SP1", "SP2")
+    assert tree.down_links() == [["SP1", "SP2"]]
+
+# a message sent hop by hop up the tree comes the same way a broadcast from the root goes
+def test_parent_is_the_way_to_the_root():
+    tree = SpanningTree(TOPOLOGY)
+    parents = broadcast("SP6")
+    for peer in TOPOLOGY:
+        assert tree.parent("SP6", peer) == parents[peer]
+    assert tree.parent("SP6", "SP7") is None
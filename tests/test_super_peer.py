@@ -0,0 +1,150 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_super_peer.py builds super peers with the 'sim' engine, so they start no server, on a
+# line SP1 - SP2 - SP3 and checks where subscriptions to a copy and their cleanups are sent,
+# that QueryHits name where a copy came from and which queries are forwarded
+#
+from super_peer import SuperPeer, RemotePeer
+
+PORTS = {"SP1": 7001, "SP2": 7002, "SP3": 7003}
+TOPOLOGY = {"SP1": ["SP2"], "SP2": ["SP1", "SP3"], "SP3": ["SP2"]}
+
+#
+# stands in for the super peer's connection pool and keeps every message it is given
+#
+class Pool:
+    def __init__(self, down=()):
+        self.sent = []
+        self.down = down  # ports that refuse a connection
+
+    def send(self, port, message):
+        if port in self.down:
+            raise ConnectionRefusedError(f"port {port} is down")
+        self.sent.append((port, message))
+
+def super_peer(peer_id, down=()):
+    sp = SuperPeer(peer_id, PORTS[peer_id], 'push', engine='sim')
+    sp.neighbor_peers = [RemotePeer(other, PORTS[other]) for other in TOPOLOGY[peer_id]]
+    sp.set_topology(TOPOLOGY)
+    sp.leaf_homes = {"L1": "SP1", "L2": "SP1", "L9": "SP3"}
+    sp.pool = Pool(down)
+    return sp
+
+def subscribe(leaf_id, origin="L9"):
+    return {"type": "SUBSCRIBE", "file_name": "file9.txt", "node_id": leaf_id, "origin_node": origin, "again": False}
+
+def cleanup(leaf_id, origin="L9"):
+    return {"type": "CLEANUP", "file_name": "file9.txt", "msg_id": f"{leaf_id}_file9.txt_1", "node_id": leaf_id,
+            "origin_node": origin, "super_peer": "SP1"}
+
+# only the first leaf to subscribe is passed on, one hop towards the origin's super peer
+def test_first_subscription_routed_to_origin():
+    sp = super_peer("SP1")
+    sp.subscribe(subscribe("L1"))
+    sp.subscribe(subscribe("L2"))
+    assert len(sp.pool.sent) == 1
+    port, message = sp.pool.sent[0]
+    assert port == PORTS["SP2"]
+    assert message["home"] == "SP3" and message["super_peer"] == "SP1"
+    assert sp.interest.leaves("file9.txt", "SP1") == {"L1", "L2"}
+
+def test_subscription_again_after_restart():
+    sp = super_peer("SP1")
+    sp.subscribe(subscribe("L1"))
+    sp.subscribe(dict(subscribe("L1"), again=True))
+    assert len(sp.pool.sent) == 2
+
+# the super peers on the way pass it on without keeping it, the origin's one keeps it
+def test_routed_subscription_kept_at_home():
+    sp1, sp2, sp3 = super_peer("SP1"), super_peer("SP2"), super_peer("SP3")
+    sp1.subscribe(subscribe("L1"))
+    sp2.subscribe(sp1.pool.sent[0][1])
+    assert sp2.pool.sent[0][0] == PORTS["SP3"]
+    assert sp2.interest.peers(["file9.txt"]) == set()
+    sp3.subscribe(sp2.pool.sent[0][1])
+    assert sp3.pool.sent == []
+    assert sp3.interest.peers(["file9.txt"]) == {"SP1"}
+    # a message that came back around is not taken twice
+    sp3.subscribe(sp2.pool.sent[0][1])
+    assert sp3.interest.stats() == {"files": 1, "subscriptions": 1}
+
+def test_origin_under_the_same_super_peer():
+    sp = super_peer("SP1")
+    sp.subscribe(subscribe("L2", origin="L1"))
+    assert sp.pool.sent == []
+    assert sp.interest.leaves("file9.txt", "SP1") == {"L2"}
+
+# an origin the config does not know about is told with a broadcast down our tree
+def test_unknown_origin_broadcast():
+    sp = super_peer("SP2")
+    sp.subscribe(subscribe("L1", origin="L50"))
+    assert sorted(port for port, _ in sp.pool.sent) == [PORTS["SP1"], PORTS["SP3"]]
+    assert all(message["root"] == "SP2" and "home" not in message for _, message in sp.pool.sent)
+
+def test_broken_route_falls_back_to_broadcast():
+    sp = super_peer("SP2", down=(PORTS["SP3"],))
+    sp.subscribe(subscribe("L4"))
+    assert [port for port, _ in sp.pool.sent] == [PORTS["SP1"]]
+    assert sp.pool.sent[0][1]["root"] == "SP2"
+
+# the cleanup goes the same way once the last of our leaves holding the file is gone
+def test_last_cleanup_routed_to_origin():
+    sp = super_peer("SP1")
+    sp.subscribe(subscribe("L1"))
+    sp.subscribe(subscribe("L2"))
+    sp.pool.sent.clear()
+    sp.cleanup(cleanup("L1"))
+    assert sp.pool.sent == []
+    sp.cleanup(cleanup("L2"))
+    port, message = sp.pool.sent[0]
+    assert port == PORTS["SP2"] and message["type"] == "CLEANUP" and message["home"] == "SP3"
+    home = super_peer("SP3")
+    home.interest.subscribe("file9.txt", "SP1", "L1")
+    home.cleanup(message)
+    assert home.interest.peers(["file9.txt"]) == set()
+
+# a QueryHit for a copy names the leaf the copy came from, not the one holding it
+def test_hit_names_the_origin_of_a_copy():
+    sp = super_peer("SP1")
+    sp.register_files({"node_id": "L1", "files": ["file1.txt", "file9.txt"], "seq": 1,
+                       "origins": {"file9.txt": "L9"}})
+    sp.register_files({"node_id": "L2", "files": [], "seq": 1})
+    sp.register_delta({"node_id": "L2", "seq": 2, "add": ["file9.txt"], "remove": [], "origins": {"file9.txt": "L1"}})
+    assert sp.leaf_hit("L1", "file1.txt", ["SP1"])["origin"] == "L1"
+    assert sp.leaf_hit("L1", "file9.txt", ["SP1"])["origin"] == "L9"
+    assert sp.leaf_hit("L2", "file9.txt", ["SP1"])["origin"] == "L1"
+    sp.register_delta({"node_id": "L2", "seq": 3, "add": [], "remove": ["file9.txt"]})
+    assert sp.leaf_origins["L2"] == {}
+
+def test_index_hit_names_the_origin():
+    sp = super_peer("SP1")
+    sp.update_index({"leaf_node": "L1", "super_peer": "SP1", "add": ["file9.txt"], "remove": [], "origins": {"file9.txt": "L9"}})
+    sp.update_index({"leaf_node": "L9", "super_peer": "SP3", "add": ["file9.txt"], "remove": []})
+    assert {hit["leaf_node"]: hit["origin"] for hit in sp.index_hits("file9.txt")} == {"L1": "L9", "L9": "L9"}
+    sp.update_index({"leaf_node": "L1", "super_peer": "SP1", "add": [], "remove": ["file9.txt"]})
+    sp.update_index({"leaf_node": "L9", "super_peer": "SP3", "add": [], "remove": ["file9.txt"]})
+    assert sp.index_origins == {}
+
+def query(message_id, **fields):
+    return dict({"type": "file_query", "file_name": "file9.txt", "TTL": 3, "message_id": message_id, "origin": "L1"}, **fields)
+
+# a leaf from before query ids were unique sends the same id every time, each of its
+# queries is still forwarded, under an id the first super peer gave it
+def test_legacy_query_id_replaced():
+    sp = super_peer("SP1")
+    first, again = query("L1_file9.txt"), query("L1_file9.txt")
+    assert sp.answer_locally(first, ["SP1"], [], None) is True
+    assert sp.answer_locally(again, ["SP1"], [], None) is True
+    assert first["message_id"] != again["message_id"]
+    assert first["message_id"].startswith("L1_file9.txt_SP1_")
+    assert sp.forward_query(first, ["SP1"], 1, False)["message_id"] == first["message_id"]
+
+def test_repeated_query_id_not_forwarded():
+    sp = super_peer("SP1")
+    assert sp.answer_locally(query("L1_file9.txt_3fa2c1-1"), ["SP1"], [], None) is True
+    assert sp.answer_locally(query("L1_file9.txt_3fa2c1-1"), ["SP1"], [], None) is False
+    # a query another super peer passed on keeps its id, the flood reaches us more than once
+    assert sp.answer_locally(query("L1_file9.txt", from_peer="SP2"), ["SP2", "SP1"], [], None) is True
+    assert sp.answer_locally(query("L1_file9.txt", from_peer="SP3"), ["SP3", "SP1"], [], None) is None
@@ -0,0 +1,158 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_swarm.py downloads a file from holders that serve its manifest and byte ranges on
+# local sockets, and checks the file comes out whole when holders are slow, send bad chunks
+# or the download was interrupted before
+#
+import json
+import os
+import random
+import socket
+import threading
+import time
+import pytest
+from connection_pool import ConnectionPool
+from metrics import Metrics
+from protocol import recv_message, send_message, wrap_reply, JSON
+from swarm import SwarmDownload, chunk_hashes
+
+CHUNK = 1024
+DATA = random.Random(485).randbytes(8 * CHUNK + 100)
+
+#
+# a leaf holding DATA on port 6000 + its number. a "bad" holder flips a byte in every
+# chunk it sends, every holder waits delay seconds before sending one
+#
+class Holder:
+    def __init__(self, leaf_id, bad=False, delay=0.02):
+        self.leaf_id = leaf_id
+        self.bad = bad
+        self.delay = delay
+        self.sent = []  # offsets of the chunks it sent
+        self.server = socket.create_server(("localhost", 6000 + int(leaf_id[1:])))
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve, args=(client,), daemon=True).start()
+
+    def serve(self, client):
+        with client:
+            while True:
+                request, codec = recv_message(client)
+                if request is None:
+                    return
+                if request["type"] == "file_manifest":
+                    send_message(client, wrap_reply(request, {"status": "OK", "size": len(DATA), "chunk_size": CHUNK,
+                                                              "hashes": chunk_hashes_of(DATA)}), codec)
+                elif request["type"] == "file_transfer":
+                    time.sleep(self.delay)
+                    data = DATA[request["offset"]:request["offset"] + request["length"]]
+                    if self.bad:
+                        data = bytes([data[0] ^ 1]) + data[1:]
+                    self.sent.append(request["offset"])
+                    send_message(client, {"status": "SENDING", "size": len(data)}, codec)
+                    client.sendall(data)
+                    return
+
+    # shutdown wakes the accept thread, so the port is free for the next test
+    def close(self):
+        self.server.shutdown(socket.SHUT_RDWR)
+        self.server.close()
+
+def chunk_hashes_of(data):
+    import hashlib
+    return [hashlib.sha256(data[i:i + CHUNK]).hexdigest() for i in range(0, len(data), CHUNK)]
+
+class Leaf:
+    def __init__(self, directory):
+        self.node_id = "L1"
+        self.directory = directory
+        self.codec = JSON
+        self.pool = ConnectionPool()
+        self.metrics = Metrics("L1")
+
+@pytest.fixture
+def holders():
+    started = []
+
+    def start(*args, **kwargs):
+        holder = Holder(*args, **kwargs)
+        started.append(holder)
+        return holder
+
+    yield start
+    for holder in started:
+        holder.close()
+
+def download(tmp_path, holder_ids):
+    swarm = SwarmDownload(Leaf(str(tmp_path)), "big.bin", holder_ids, chunk_size=CHUNK)
+    received = swarm.run()
+    with open(tmp_path / "big.bin", "rb") as f:
+        assert f.read() == DATA
+    assert not os.path.exists(tmp_path / "big.bin.part")
+    assert not os.path.exists(tmp_path / ".big.bin.chunks")
+    return swarm, received
+
+def test_chunk_hashes(tmp_path):
+    path = tmp_path / "big.bin"
+    path.write_bytes(DATA)
+    assert chunk_hashes(str(path), CHUNK) == chunk_hashes_of(DATA)
+
+def test_every_holder_serves(tmp_path, holders):
+    a, b = holders("L23001"), holders("L23002")
+    swarm, received = download(tmp_path, ["L23001", "L23002"])
+    assert received == len(DATA)
+    assert a.sent and b.sent
+    # the last chunks may be fetched from both, only the first to arrive is counted
+    assert set(a.sent + b.sent) == set(range(0, len(DATA), CHUNK))
+
+def test_bad_holder_dropped(tmp_path, holders):
+    holders("L23001")
+    bad = holders("L23002", bad=True)
+    swarm, _ = download(tmp_path, ["L23001", "L23002"])
+    dropped = [h for h in swarm.holders if h.leaf_id == "L23002"][0]
+    assert dropped.chunks == 0
+    assert 0 < len(bad.sent) <= 3
+
+def test_holder_that_is_down_skipped(tmp_path, holders):
+    holders("L23002")
+    download(tmp_path, ["L23001", "L23002"])
+
+# the chunk map of an interrupted download says which chunks are already in the part file
+def test_resume(tmp_path, holders):
+    holder = holders("L23001")
+    hashes = chunk_hashes_of(DATA)
+    done = [0, 1, 2, 5]
+    with open(tmp_path / "big.bin.part", "wb") as f:
+        f.write(bytes(len(DATA)))
+        for i in done:
+            f.seek(i * CHUNK)
+            f.write(DATA[i * CHUNK:(i + 1) * CHUNK])
+    with open(tmp_path / ".big.bin.chunks", "w") as f:
+        json.dump({"size": len(DATA), "chunk_size": CHUNK, "hashes": hashes, "done": done}, f)
+    _, received = download(tmp_path, ["L23001"])
+    assert sorted(holder.sent) == [i * CHUNK for i in range(len(hashes)) if i not in done]
+    assert received == len(DATA) - len(done) * CHUNK
+
+# a chunk map written for other contents is not trusted
+def test_stale_chunk_map_ignored(tmp_path, holders):
+    holder = holders("L23001")
+    (tmp_path / "big.bin.part").write_bytes(bytes(len(DATA)))
+    with open(tmp_path / ".big.bin.chunks", "w") as f:
+        json.dump({"size": len(DATA), "chunk_size": CHUNK, "hashes": ["0" * 64] * 9, "done": [0, 1]}, f)
+    download(tmp_path, ["L23001"])
+    assert len(holder.sent) == 9
+
+def test_no_holder_left(tmp_path, holders):
+    holders("L23001", bad=True)
+    with pytest.raises(ConnectionError):
+        SwarmDownload(Leaf(str(tmp_path)), "big.bin", ["L23001"], chunk_size=CHUNK).run()
+    with pytest.raises(ConnectionError):
+        SwarmDownload(Leaf(str(tmp_path)), "big.bin", ["L23003"], chunk_size=CHUNK).run()
@@ -0,0 +1,79 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_topology_generator.py checks the degree and connectivity of generated graphs and
+# that the config written around them is consistent
+#
+import random
+from collections import Counter
+import pytest
+from topology_generator import random_regular, small_world, power_law, tree, connected, generate, KINDS
+
+def degrees(n, edges):
+    counts = Counter()
+    for a, b in edges:
+        counts[a] += 1
+        counts[b] += 1
+    return [counts[peer] for peer in range(n)]
+
+@pytest.mark.parametrize("n, degree", [(100, 3), (100, 4), (100, 6), (100, 8), (101, 4), (10, 9), (1000, 8), (4, 3)])
+def test_random_regular(n, degree):
+    rng = random.Random(485)
+    for _ in range(5):
+        edges = random_regular(n, degree, rng)
+        assert all(a != b for a, b in edges)
+        assert all(a < b for a, b in edges)
+        assert degrees(n, edges) == [degree] * n
+        assert connected(n, edges)
+
+@pytest.mark.parametrize("n, degree", [(10, 10), (11, 3), (5, 7)])
+def test_random_regular_impossible(n, degree):
+    with pytest.raises(ValueError):
+        random_regular(n, degree, random.Random(485))
+
+def test_tree_shape():
+    edges = tree(40, 3, random.Random(485))
+    assert len(edges) == 39
+    assert connected(40, edges)
+    assert max(degrees(40, edges)) <= 4
+
+def test_small_world_keeps_link_count():
+    edges = small_world(100, 4, random.Random(485), 0.2)
+    assert len(edges) <= 200
+    assert all(a != b for a, b in edges)
+
+def test_power_law_has_hubs():
+    edges = power_law(500, 4, random.Random(485))
+    assert connected(500, edges)
+    assert max(degrees(500, edges)) > 4 * min(degrees(500, edges))
+
+def test_connected():
+    assert connected(3, {(0, 1), (1, 2)})
+    assert not connected(4, {(0, 1), (2, 3)})
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_generated_config(kind):
+    config = generate(kind, super_peers=50, leaves=120, files=2, degree=4)
+    peers = {sp["peer_id"]: sp for sp in config["super_peers"]}
+    assert len(peers) == 50
+    assert len({sp["port"] for sp in peers.values()}) == 50
+    for peer_id, sp in peers.items():
+        assert peer_id not in sp["neighbors"]
+        assert all(peer_id in peers[other]["neighbors"] for other in sp["neighbors"])
+    index = {peer_id: i for i, peer_id in enumerate(peers)}
+    edges = {(min(index[a], index[b]), max(index[a], index[b])) for a in peers for b in peers[a]["neighbors"]}
+    assert connected(50, edges)
+    leaves = config["leaf_nodes"]
+    assert len(leaves) == 120
+    assert all(leaf["node_id"] in peers[leaf["connected_super_peer"]]["leaf_nodes"] for leaf in leaves)
+    files = [f for leaf in leaves for f in leaf["files"]]
+    assert len(files) == len(set(files)) == 240
+
+def test_same_seed_same_config():
+    assert generate("random_regular", seed=7) == generate("random_regular", seed=7)
+    assert generate("random_regular", seed=7) != generate("random_regular", seed=8)
+
+def test_unknown_kind():
+    with pytest.raises(ValueError):
+        generate("ring")
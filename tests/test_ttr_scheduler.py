@@ -0,0 +1,111 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_ttr_scheduler.py checks when copies come due for a poll and how their time to
+# refresh moves with the answers, on a clock the test moves by hand. the last tests wait on
+# the real clock for a poller that is sleeping
+#
+import threading
+import time
+import pytest
+import ttr_scheduler
+from ttr_scheduler import TTRScheduler
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ttr_scheduler, "time", clock)
+    return clock
+
+def test_due_after_start_ttr(clock):
+    ttr = TTRScheduler(start_ttr=30)
+    ttr.add("file1.txt")
+    clock.now += 10
+    ttr.add("file2.txt")
+    clock.now += 20
+    assert ttr.wait_due() == ["file1.txt"]
+    clock.now += 10
+    assert ttr.wait_due() == ["file2.txt"]
+
+def test_all_due_files_at_once(clock):
+    ttr = TTRScheduler(start_ttr=30)
+    for name in ("file1.txt", "file2.txt", "file3.txt"):
+        ttr.add(name)
+        clock.now += 1
+    clock.now += 100
+    assert ttr.wait_due() == ["file1.txt", "file2.txt", "file3.txt"]
+
+def test_valid_grows_up_to_max(clock):
+    ttr = TTRScheduler(start_ttr=100, max_ttr=200)
+    ttr.add("file1.txt")
+    ttr.valid("file1.txt")
+    assert ttr.ttr["file1.txt"] == 150
+    ttr.valid("file1.txt")
+    assert ttr.ttr["file1.txt"] == 200
+    clock.now += 199
+    ttr.add("file2.txt")  # so the poller has something else to wait for
+    clock.now += 1
+    assert ttr.wait_due() == ["file1.txt"]
+
+def test_lease_pushes_next_check(clock):
+    ttr = TTRScheduler(start_ttr=10)
+    ttr.add("file1.txt")
+    ttr.valid("file1.txt", lease=60)
+    assert ttr.due_at["file1.txt"] == clock.now + 60
+    assert ttr.stats()["leased"] == 1
+
+def test_stale_shrinks_down_to_min(clock):
+    ttr = TTRScheduler(start_ttr=20, min_ttr=8)
+    ttr.add("file1.txt")
+    ttr.stale_found("file1.txt")
+    assert ttr.ttr["file1.txt"] == 10
+    assert "file1.txt" not in ttr.due_at
+    ttr.stale_found("file1.txt")
+    assert ttr.ttr["file1.txt"] == 8
+    # the next copy of the file starts from the shorter ttr
+    ttr.add("file1.txt")
+    assert ttr.due_at["file1.txt"] == clock.now + 8
+    assert ttr.stats()["stale_rate"] == 1.0
+
+def test_removed_file_never_due(clock):
+    ttr = TTRScheduler(start_ttr=10)
+    ttr.add("file1.txt")
+    ttr.add("file2.txt")
+    ttr.remove("file1.txt")
+    clock.now += 10
+    assert ttr.wait_due() == ["file2.txt"]
+
+def test_rescheduled_file_due_once(clock):
+    ttr = TTRScheduler(start_ttr=10)
+    ttr.add("file1.txt")
+    ttr.retry(["file1.txt"])
+    clock.now += 10
+    assert ttr.wait_due() == ["file1.txt"]
+    assert ttr.heap == []
+
+def test_poller_sleeps_until_due():
+    ttr = TTRScheduler(start_ttr=0.2)
+    ttr.add("file1.txt")
+    start = time.time()
+    assert ttr.wait_due() == ["file1.txt"]
+    assert time.time() - start >= 0.15
+
+# a poller waiting with nothing scheduled wakes up for a copy added later
+def test_poller_woken_by_new_copy():
+    ttr = TTRScheduler(start_ttr=0.05)
+    due = []
+    poller = threading.Thread(target=lambda: due.extend(ttr.wait_due()), daemon=True)
+    poller.start()
+    time.sleep(0.1)
+    assert due == []
+    ttr.add("file1.txt")
+    poller.join(2)
+    assert due == ["file1.txt"]
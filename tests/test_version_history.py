@@ -0,0 +1,49 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# test_version_history.py checks an origin can hand out the edits between two versions of a
+# file while it still remembers all of them, and says so when it does not
+#
+from version_history import VersionHistory
+
+def edited(history, file_name, versions):
+    for version in versions:
+        history.record(file_name, version, 100 + version, "line %d\n" % version)
+
+def test_delta_between_versions():
+    history = VersionHistory()
+    edited(history, "file1.txt", range(2, 6))
+    assert history.delta("file1.txt", 2, 4) == [(3, 103, "line 3\n"), (4, 104, "line 4\n")]
+    assert history.delta("file1.txt", 1, 5) == [(v, 100 + v, "line %d\n" % v) for v in range(2, 6)]
+    assert history.delta("file1.txt", 5, 5) == []
+
+def test_edit_not_recorded():
+    history = VersionHistory()
+    edited(history, "file1.txt", [2, 3, 5])
+    assert history.delta("file1.txt", 1, 3) is not None
+    assert history.delta("file1.txt", 3, 5) is None
+    assert history.delta("file2.txt", 1, 2) is None
+
+# a copy older than the oldest remembered edit has to be downloaded again
+def test_only_newest_edits_kept():
+    history = VersionHistory(limit=3)
+    edited(history, "file1.txt", range(2, 7))
+    assert history.delta("file1.txt", 1, 6) is None
+    assert history.delta("file1.txt", 3, 6) is not None
+    assert history.stats() == {"files": 1, "edits": 3, "pruned": 2}
+
+def test_files_kept_apart():
+    history = VersionHistory(limit=2)
+    edited(history, "file1.txt", range(2, 5))
+    edited(history, "file2.txt", [2])
+    assert history.delta("file2.txt", 1, 2) == [(2, 102, "line 2\n")]
+    assert history.stats() == {"files": 2, "edits": 3, "pruned": 1}
+
+def test_forget():
+    history = VersionHistory()
+    edited(history, "file1.txt", [2])
+    history.forget("file1.txt")
+    history.forget("file2.txt")
+    assert history.delta("file1.txt", 1, 2) is None
+    assert history.stats()["files"] == 0
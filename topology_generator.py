@@ -0,0 +1,169 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# topology_generator.py writes config files in the same format as all_to_all.json and
+# linear.json for networks far bigger than the two written by hand. the super peer graph is
+# one of
+#   random_regular  every super peer has exactly degree neighbors
+#   small_world     a ring where each peer knows its degree nearest, with some links rewired
+#   power_law       peers join one at a time and link to degree/2 peers picked by degree
+#   tree            every peer has degree children below it
+# leaves are spread over the super peers in turn and each gets its own files. leaf ports stay
+# 6000 + n, super peer ports start at 7001 or right after the last leaf port
+#   python topology_generator.py <kind> [--super-peers=n] [--leaves=n] [--degree=d] ...
+#
+import json
+import os
+import random
+import sys
+from collections import deque
+from network_setup import parse_flags
+
+KINDS = ["random_regular", "small_world", "power_law", "tree"]
+DEFAULTS = {"super-peers": 100, "leaves": 200, "files": 2, "degree": 4, "rewire": 0.1, "seed": 485,
+            "out": "", "write-files": "no"}
+ATTEMPTS = 100  # tries at a connected graph before giving up
+SWAPS = 10  # degree keeping swaps per link when shuffling a regular graph
+
+# starts from a ring where every peer links to its degree nearest, plus the peer opposite
+# for an odd degree, then shuffles it with swaps that keep every degree: a-b c-d becomes
+# a-d c-b, unless that makes a loop or a second link between two peers
+def random_regular(n, degree, rng, rewire=0.0):
+    if degree >= n or n * degree % 2:
+        raise ValueError(f"No {degree}-regular graph on {n} super peers")
+    edges = set()
+    for peer in range(n):
+        for step in range(1, degree // 2 + 1):
+            other = (peer + step) % n
+            edges.add((min(peer, other), max(peer, other)))
+        if degree % 2:
+            other = (peer + n // 2) % n
+            edges.add((min(peer, other), max(peer, other)))
+    links = sorted(edges)
+    for _ in range(SWAPS * len(links)):
+        i, j = rng.randrange(len(links)), rng.randrange(len(links))
+        (a, b), (c, d) = links[i], links[j]
+        if rng.random() < 0.5:
+            c, d = d, c
+        first, second = (min(a, d), max(a, d)), (min(b, c), max(b, c))
+        if a == d or b == c or first in edges or second in edges:
+            continue
+        edges -= {links[i], links[j]}
+        edges |= {first, second}
+        links[i], links[j] = first, second
+    return edges
+
+# watts strogatz, each link of the ring lattice moves to a random peer with probability rewire
+def small_world(n, degree, rng, rewire=0.1):
+    edges = set()
+    for peer in range(n):
+        for step in range(1, degree // 2 + 1):
+            other = (peer + step) % n
+            edges.add((min(peer, other), max(peer, other)))
+    for a, b in sorted(edges):
+        if rng.random() < rewire:
+            c = rng.randrange(n)
+            if c != a and (min(a, c), max(a, c)) not in edges:
+                edges.discard((a, b))
+                edges.add((min(a, c), max(a, c)))
+    return edges
+
+# barabasi albert, a peer appears in targets once per link so the well connected get picked more
+def power_law(n, degree, rng, rewire=0.0):
+    links = max(degree // 2, 1)
+    edges = set()
+    targets = []
+    for peer in range(min(links + 1, n)):
+        for other in range(peer):
+            edges.add((other, peer))
+            targets += [other, peer]
+    for peer in range(links + 1, n):
+        chosen = set()
+        while len(chosen) < links:
+            chosen.add(rng.choice(targets))
+        for other in chosen:
+            edges.add((other, peer))
+            targets += [other, peer]
+    return edges
+
+def tree(n, degree, rng, rewire=0.0):
+    return {((peer - 1) // degree, peer) for peer in range(1, n)}
+
+def connected(n, edges):
+    neighbors = {peer: [] for peer in range(n)}
+    for a, b in edges:
+        neighbors[a].append(b)
+        neighbors[b].append(a)
+    seen = {0}
+    queue = deque([0])
+    while queue:
+        for other in neighbors[queue.popleft()]:
+            if other not in seen:
+                seen.add(other)
+                queue.append(other)
+    return len(seen) == n
+
+# builds a connected graph of the kind and the config around it
+def generate(kind, super_peers=100, leaves=200, files=2, degree=4, rewire=0.1, seed=485):
+    if kind not in KINDS:
+        raise ValueError(f"Unknown topology {kind}, expected one of {', '.join(KINDS)}")
+    rng = random.Random(seed)
+    for _ in range(ATTEMPTS):
+        edges = globals()[kind](super_peers, degree, rng, rewire)
+        if connected(super_peers, edges):
+            break
+    else:
+        raise ValueError(f"Could not build a connected {kind} graph, try a higher degree")
+
+    peer_ids = [f"SP{i + 1}" for i in range(super_peers)]
+    port_base = 7001 if leaves < 1001 else 6001 + leaves
+    if port_base + super_peers > 65536:
+        raise ValueError(f"{super_peers} super peers and {leaves} leaves do not fit in the port range")
+    neighbors = {peer: set() for peer in range(super_peers)}
+    for a, b in edges:
+        neighbors[a].add(b)
+        neighbors[b].add(a)
+    leaf_nodes = []
+    owned = {peer_id: [] for peer_id in peer_ids}
+    for i in range(leaves):
+        node_id = f"L{i + 1}"
+        peer_id = peer_ids[i % super_peers]
+        owned[peer_id].append(node_id)
+        leaf_nodes.append({"node_id": node_id, "port": 6001 + i, "connected_super_peer": peer_id,
+                           "files": [f"file{i * files + k + 1}.txt" for k in range(files)]})
+    return {"super_peers": [{"peer_id": peer_ids[peer], "port": port_base + peer,
+                             "neighbors": [peer_ids[other] for other in sorted(neighbors[peer])],
+                             "leaf_nodes": owned[peer_ids[peer]]} for peer in range(super_peers)],
+            "leaf_nodes": leaf_nodes}
+
+# the files of every leaf with one line in them, for running a generated config for real
+def write_files(config):
+    for ln_config in config["leaf_nodes"]:
+        os.makedirs(ln_config["node_id"], exist_ok=True)
+        for file_name in ln_config["files"]:
+            path = os.path.join(ln_config["node_id"], file_name)
+            if not os.path.exists(path):
+                with open(path, "w") as f:
+                    f.write(f"{file_name} of {ln_config['node_id']}")
+
+#
+# main
+#
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in KINDS:
+        print(f"Usage: python topology_generator.py <{'/'.join(KINDS)}> [--super-peers=n] [--leaves=n] [--files=per leaf] "
+              "[--degree=d] [--rewire=0..1] [--seed=n] [--out=<config file>] [--write-files=yes/no]")
+        sys.exit(1)
+
+    kind = sys.argv[1]
+    options = parse_flags(sys.argv[2:], DEFAULTS)
+    config = generate(kind, options["super-peers"], options["leaves"], options["files"], options["degree"],
+                      options["rewire"], options["seed"])
+    out = options["out"] or f"{kind}_{options['super-peers']}.json"
+    with open(out, "w") as f:
+        json.dump(config, f, indent=2)
+    if options["write-files"] == "yes":
+        write_files(config)
+    links = sum(len(sp["neighbors"]) for sp in config["super_peers"]) // 2
+    print(f"Wrote {out}: {len(config['super_peers'])} super peers, {links} links, {len(config['leaf_nodes'])} leaves")
@@ -0,0 +1,101 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# ttr_scheduler.py decides when a leaf node in pull mode checks each cached copy again.
+# every file has its own time to refresh, it grows each time the origin says the copy is
+# still valid and shrinks when the copy turns out stale, kept between min_ttr and max_ttr.
+# due times sit in a heap so the poller sleeps until the next one instead of walking every
+# file. an origin can also hand out a lease, a promise the copy stays valid for a while
+#
+import heapq
+import threading
+import time
+
+MIN_TTR = 5  # seconds
+MAX_TTR = 300
+START_TTR = 30
+GROW = 1.5  # ttr multiplier after a VALID poll
+SHRINK = 0.5  # ttr multiplier after a STALE poll
+
+#
+# TTR scheduler class, heap of (due_at, file_name) plus the current ttr of every file
+#
+class TTRScheduler:
+    def __init__(self, start_ttr=START_TTR, min_ttr=MIN_TTR, max_ttr=MAX_TTR):
+        self.start_ttr = start_ttr
+        self.min_ttr = min_ttr
+        self.max_ttr = max_ttr
+        self.ttr = {}  # {file_name: seconds}, kept after a copy is dropped so a new copy starts there
+        self.due_at = {}  # {file_name: time}, heap entries that do not match are stale and skipped
+        self.heap = []
+        self.changed = threading.Condition()
+        self.polls = 0  # PULL_BATCH messages sent
+        self.checks = 0  # copies checked
+        self.stale = 0  # checks that found the copy stale
+        self.leased = 0  # VALID replies that came with a lease
+
+    # starts checking a newly downloaded copy
+    def add(self, file_name):
+        with self.changed:
+            ttr = self.ttr.setdefault(file_name, self.start_ttr)
+            self.schedule(file_name, time.time() + ttr)
+
+    # a poll that never got an answer, try the same files again after their current ttr
+    def retry(self, file_names):
+        for file_name in file_names:
+            self.add(file_name)
+
+    def remove(self, file_name):
+        with self.changed:
+            self.due_at.pop(file_name, None)
+
+    def schedule(self, file_name, due_at):
+        self.due_at[file_name] = due_at
+        heapq.heappush(self.heap, (due_at, file_name))
+        self.changed.notify()
+
+    # blocks until at least one file is due and returns every file that is
+    def wait_due(self):
+        with self.changed:
+            while True:
+                while self.heap and self.due_at.get(self.heap[0][1]) != self.heap[0][0]:
+                    heapq.heappop(self.heap)
+                now = time.time()
+                if self.heap and self.heap[0][0] <= now:
+                    break
+                self.changed.wait(self.heap[0][0] - now if self.heap else None)
+            due = []
+            while self.heap and self.heap[0][0] <= now:
+                due_at, file_name = heapq.heappop(self.heap)
+                if self.due_at.get(file_name) == due_at:
+                    del self.due_at[file_name]
+                    due.append(file_name)
+            return due
+
+    # the copy was still good, check it less often. a lease pushes the next check to when
+    # the origin's promise runs out
+    def valid(self, file_name, lease=0):
+        with self.changed:
+            ttr = min(self.ttr.get(file_name, self.start_ttr) * GROW, self.max_ttr)
+            self.ttr[file_name] = ttr
+            self.checks += 1
+            if lease:
+                self.leased += 1
+            self.schedule(file_name, time.time() + max(ttr, lease))
+
+    # the copy was out of date, the next copy of this file gets checked more often
+    def stale_found(self, file_name):
+        with self.changed:
+            self.ttr[file_name] = max(self.ttr.get(file_name, self.start_ttr) * SHRINK, self.min_ttr)
+            self.checks += 1
+            self.stale += 1
+            self.due_at.pop(file_name, None)
+
+    def stats(self):
+        with self.changed:
+            ttrs = [self.ttr[f] for f in self.due_at if f in self.ttr]
+            return {"polls": self.polls, "checks": self.checks, "stale": self.stale,
+                    "stale_rate": self.stale / self.checks if self.checks else 0.0,
+                    "leased": self.leased, "files": len(self.due_at),
+                    "mean_ttr": sum(ttrs) / len(ttrs) if ttrs else 0.0}
@@ -0,0 +1,51 @@
+#
+# CS 485 PA3 - UIC Fall 2024
+# Mira Sweis - ECE MS
+#
+# version_history.py is an origin's memory of the last few edits to each of its files. an
+# edit only appends text, so a copy at version k becomes version n by appending the text of
+# edits k+1 to n at the offsets they were written at. only the newest HISTORY_LIMIT edits of
+# a file are kept and the history starts empty after a restart, a copy older than that has
+# to be downloaded again
+#
+import threading
+from collections import deque
+
+HISTORY_LIMIT = 32  # edits remembered per file
+
+#
+# Version history class, {file_name: deque of (version, offset, text)}
+#
+class VersionHistory:
+    def __init__(self, limit=HISTORY_LIMIT):
+        self.limit = limit
+        self.files = {}
+        self.lock = threading.Lock()
+        self.pruned = 0  # edits dropped to stay under the limit
+
+    # the edit that turns the file into this version, text written at offset bytes
+    def record(self, file_name, version, offset, text):
+        with self.lock:
+            edits = self.files.setdefault(file_name, deque())
+            edits.append((version, offset, text))
+            while len(edits) > self.limit:
+                edits.popleft()
+                self.pruned += 1
+
+    # edits from version from_version up to to_version in order, or None if one of them is
+    # no longer remembered
+    def delta(self, file_name, from_version, to_version):
+        with self.lock:
+            edits = [edit for edit in self.files.get(file_name, ()) if from_version < edit[0] <= to_version]
+        if [edit[0] for edit in edits] != list(range(from_version + 1, to_version + 1)):
+            return None
+        return edits
+
+    def forget(self, file_name):
+        with self.lock:
+            self.files.pop(file_name, None)
+
+    def stats(self):
+        with self.lock:
+            return {"files": len(self.files), "edits": sum(len(e) for e in self.files.values()),
+                    "pruned": self.pruned}